@@ -0,0 +1,116 @@
+"""Micro-benchmark for the fused formula-image classifier.
+
+Runs the previous per-image colour check and formula scoring and
+FormulaImageClassifier.inspect_batch over the same synthetic crops, checks
+that decisions and confidences agree, and reports crops/sec:
+
+    python benchmarks/bench_image_classifier.py --crops 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.image_classifier import FormulaImageClassifier  # noqa: E402
+
+SNIPPETS = ["x^2 + y^2 = z^2", "a/b <= c", "f(x) = 3x - 1", "E = mc^2", "n! > 2^n",
+            "sum a_i b_i", "lim x -> 0", "p(A|B)", "y = ax + b", "Fig. 3"]
+
+
+def make_crops(count, seed=0):
+    rng = random.Random(seed)
+    crops = []
+    for _ in range(count):
+        width, height = rng.randint(80, 600), rng.randint(24, 160)
+        kind = rng.random()
+        if kind < 0.7:
+            # 白底黑字的公式
+            crop = np.full((height, width, 3), 255, np.uint8)
+            cv2.putText(crop, rng.choice(SNIPPETS), (4, height * 2 // 3), cv2.FONT_HERSHEY_SIMPLEX,
+                        height / 60.0, (0, 0, 0), max(height // 40, 1))
+        elif kind < 0.85:
+            # 彩色照片/图表
+            crop = np.empty((height, width, 3), np.uint8)
+            crop[:] = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+            cv2.circle(crop, (width // 2, height // 2), height // 3, (0, 0, 255), -1)
+        else:
+            # 灰度扫描件
+            crop = np.full((height, width, 3), rng.randint(180, 255), np.uint8)
+            cv2.line(crop, (0, height // 2), (width, height // 3), (40, 40, 40), 2)
+        crops.append(crop)
+    return crops
+
+
+def legacy_is_color_image(img):
+    """Reference: the original split + three absdiff colour check"""
+    cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    b, g, r = cv2.split(img)
+    diff_bg = cv2.absdiff(b, g)
+    diff_br = cv2.absdiff(b, r)
+    diff_gr = cv2.absdiff(g, r)
+    threshold = 10
+    return bool(np.mean(diff_bg) > threshold or np.mean(diff_br) > threshold or np.mean(diff_gr) > threshold)
+
+
+def legacy_is_formula(image):
+    """Reference: the original four-feature formula score"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    scores = []
+    white_ratio = np.sum(gray > 240) / gray.size
+    scores.append(min(white_ratio * 1.0, 1.0))
+    height, width = gray.shape
+    scores.append(1.0 - min(abs(height / width - 1.0), 1.0))
+    _, binary = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    scores.append(min(len(contours) / 6, 1.0))
+    edges = cv2.Canny(gray, 100, 200)
+    scores.append(min(np.sum(edges > 0) / edges.size * 4, 1.0))
+    confidence = np.mean(scores)
+    return confidence > 0.3, confidence
+
+
+def legacy_inspect(image):
+    # 旧流程：先判断彩色，再逐项计算公式特征
+    if legacy_is_color_image(image):
+        return True, False, 0.0
+    return (False,) + legacy_is_formula(image)
+
+
+def bench(func, crops, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(crops)
+        best = min(best, time.perf_counter() - start)
+    return len(crops) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--crops", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    crops = make_crops(args.crops)
+    classifier = FormulaImageClassifier()
+
+    mismatches = 0
+    for old, new in zip(map(legacy_inspect, crops), classifier.inspect_batch(crops)):
+        if old[:2] != new[:2] or abs(old[2] - new[2]) > 1e-12:
+            mismatches += 1
+
+    legacy_rate = bench(lambda batch: [legacy_inspect(crop) for crop in batch], crops, args.repeat)
+    new_rate = bench(classifier.inspect_batch, crops, args.repeat)
+    print(f"crops: {len(crops)}, mismatches: {mismatches}")
+    print(f"legacy per-image : {legacy_rate:10,.0f} crops/s")
+    print(f"fused batch      : {new_rate:10,.0f} crops/s  ({new_rate / legacy_rate:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
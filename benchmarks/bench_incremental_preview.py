@@ -0,0 +1,47 @@
+"""Preview latency for editing one row of a long align derivation.
+
+For derivations of increasing length, renders the full formula once to warm
+the row fragment cache, then changes a single row and times the preview
+render (``render_rgba``) against rendering the edited formula cold:
+
+    python benchmarks/bench_incremental_preview.py --rows 10 30 60
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.latex_renderer import LatexRenderer  # noqa: E402
+from core.render_cache import RenderCache  # noqa: E402
+
+
+def derivation(rows, edited=None):
+    lines = [rf"f_{{{i}}}(x) &= \int_0^{{{i}}} \frac{{t^{{{i}}}}}{{1 + t^2}}\,dt + \sum_{{k=1}}^{{{i}}} k" for i in range(rows)]
+    if edited is not None:
+        lines[edited] += r" + \epsilon"
+    return r"\begin{align}" + r" \\ ".join(lines) + r"\end{align}"
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 30, 60])
+    args = parser.parse_args()
+
+    print(f"{'rows':>5} {'cold':>10} {'one row edited':>16}")
+    for rows in args.rows:
+        renderer = LatexRenderer(cache=RenderCache(max_bytes=256 * 1024 * 1024))
+        cold = timed(lambda: renderer.render_rgba(derivation(rows)))
+        warm = timed(lambda: renderer.render_rgba(derivation(rows, edited=rows // 2)))
+        print(f"{rows:5d} {cold:8.1f} ms {warm:13.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Micro-benchmark for LatexRenderer.render_png.
+
+Renders the same formulas with the previous pyplot figure-per-call path
+(tight bbox) and with the pooled Agg renderer, render cache disabled, and
+reports milliseconds per formula:
+
+    python benchmarks/bench_latex_renderer.py --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.latex_renderer import LatexRenderer  # noqa: E402
+
+FORMULAS = [
+    r"x^2 + y^2 = z^2",
+    r"\frac{a}{b} \leq \sqrt{c}",
+    r"\int_{0}^{1} f(x)\,dx",
+    r"\sum_{n=1}^{\infty} \frac{1}{n^2} = \frac{\pi^2}{6}",
+    r"e^{i\pi} + 1 = 0",
+    r"\lim_{n \to \infty} \left(1 + \frac{1}{n}\right)^n",
+    r"\mathcal{F}(\omega) = \int f(t) e^{-i\omega t}\,dt",
+    r"\alpha_i \beta_j \gamma^{k}",
+]
+
+
+def legacy_render_png(code, fontsize=36, dpi=600):
+    """Reference: the original pyplot figure-per-call render"""
+    fig = plt.figure(figsize=(8, 2), dpi=dpi, facecolor='none', edgecolor='none')
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis("off")
+    ax.text(0.5, 0.5, f"${code}$", fontsize=fontsize, ha='center', va='center')
+    buf = BytesIO()
+    plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0.1, transparent=True, dpi=dpi)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def bench(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for code in FORMULAS:
+            func(code)
+        best = min(best, time.perf_counter() - start)
+    return best / len(FORMULAS) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    renderer = LatexRenderer()
+    renderer.cache = None  # 只比较渲染本身
+
+    legacy_ms = bench(legacy_render_png, args.repeat)
+    pooled_ms = bench(renderer.render_png, args.repeat)
+    print(f"formulas: {len(FORMULAS)}, render cache disabled")
+    print(f"pyplot + tight bbox : {legacy_ms:8.1f} ms/formula")
+    print(f"pooled Agg figure   : {pooled_ms:8.1f} ms/formula  ({legacy_ms / pooled_ms:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
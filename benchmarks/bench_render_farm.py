@@ -0,0 +1,45 @@
+"""Scaling benchmark for RenderFarm.
+
+Renders a batch of distinct formulas to export PNGs with 1, 2, 4, ...
+worker processes (render cache disabled) and reports wall time per batch:
+
+    python benchmarks/bench_render_farm.py --count 400 --max-workers 8
+
+With one worker the farm renders in-process, which is the serial baseline.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from config.settings import Config  # noqa: E402
+from core.render_farm import RenderFarm  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=400)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    Config.RENDER_CACHE_MAX_BYTES = 0  # 只比较渲染本身
+    codes = [rf"\int_0^{{{i}}} \frac{{a_{{{i}}}}}{{b}} + \sqrt{{x^{{{i}}}}}\,dx" for i in range(args.count)]
+
+    print(f"formulas: {args.count}, cpus: {os.cpu_count()}")
+    baseline = None
+    workers = 1
+    while workers <= args.max_workers:
+        start = time.perf_counter()
+        RenderFarm(workers=workers).render(codes)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:2d} workers: {elapsed:7.2f} s  ({baseline / elapsed:.2f}x)")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,121 @@
+"""Micro-benchmark for the single-pass text formula classifier.
+
+Runs the previous multi-regex implementation and TextFormulaClassifier over
+the same synthetic corpus of PDF text blocks, checks that decisions and
+confidences agree, and reports blocks/sec:
+
+    python benchmarks/bench_text_classifier.py --blocks 20000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.text_classifier import TextFormulaClassifier  # noqa: E402
+
+PROSE = ("The results in the previous section show that the method converges quickly "
+         "for most inputs, although the constant depends on the data set used.")
+SNIPPETS = [
+    "x^2 + y^2 = z^2", "\\frac{a}{b} \\leq \\sqrt{c}", "∑ α_i β_i ≤ ∞", "f(x) - g(x)",
+    "\\int_{0}^{1} f(x) dx", "\\left( a + b \\right)", "A \\Rightarrow B", "e^{i\\pi} + 1 = 0",
+    "\\begin{cases} x & y \\end{cases}", "\\lim_{n \\to \\infty} a_n", "p_{ij} = q^{k}_{l}",
+    "\\sinh t \\cdot \\cos t", "value = 3", "see Section 4.2", "α-helix",
+]
+
+
+def make_corpus(count, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            corpus.append(PROSE[:rng.randint(20, len(PROSE))])
+        elif kind < 0.8:
+            corpus.append(" ".join(rng.choice(SNIPPETS) for _ in range(rng.randint(1, 4))))
+        else:
+            corpus.append(PROSE[:rng.randint(10, 60)] + " " + rng.choice(SNIPPETS) + "\n" + PROSE[:40])
+    return corpus
+
+
+def legacy_is_text_formula(text):
+    """Reference: the original eight-search implementation"""
+    if re.search(r'[α-ωΑ-Ω∑∫∏√∞±×÷≠≤≥∈∉⊂⊃∪∩]', text):
+        return True
+    if re.search(r'\\[a-zA-Z]+', text):
+        return True
+    if re.search(r'[+\-*/=<>]', text):
+        return True
+    if re.search(r'\\sin|\\cos|\\tan|\\log|\\ln|\\exp|\\lim|\\sum|\\int|\\prod|\\oint|\\iint|\\iiint|\\iiiint|\\idotsint', text):
+        return True
+    if re.search(r'_[^}]+', text) or re.search(r'\^[^}]+', text):
+        return True
+    if re.search(r'\\left|\\right|\\bigl|\\bigr|\\Bigl|\\Bigr|\\biggl|\\biggr|\\Biggl|\\Biggr', text):
+        return True
+    if re.search(r'\\rightarrow|\\leftarrow|\\leftrightarrow|\\Rightarrow|\\Leftarrow|\\Leftrightarrow', text):
+        return True
+    return bool(re.search(r'\\begin\{.*?\}.*?\\end\{.*?\}', text))
+
+
+def legacy_confidence(text):
+    """Reference: the original eight-findall confidence score"""
+    scores = [
+        min(len(re.findall(r'[α-ωΑ-Ω∑∫∏√∞±×÷≠≤≥∈∉⊂⊃∪∩]', text)) / 1.2, 1.0),
+        min(len(re.findall(r'\\[a-zA-Z]+', text)) / 1.0, 1.0),
+        min(len(re.findall(r'[+\-*/=<>]', text)) / 1.0, 1.0),
+        min(len(re.findall(r'\\sin|\\cos|\\tan|\\log|\\ln|\\exp|\\lim|\\sum|\\int|\\prod|\\oint|\\iint|\\iiint|\\iiiint|\\idotsint', text)) / 1.2, 1.0),
+        min((len(re.findall(r'_[^}]+', text)) + len(re.findall(r'\^[^}]+', text))) / 1.5, 1.0),
+        min(len(re.findall(r'\\left|\\right|\\bigl|\\bigr|\\Bigl|\\Bigr|\\biggl|\\biggr|\\Biggl|\\Biggr', text)) / 1.5, 1.0),
+        min(len(re.findall(r'\\rightarrow|\\leftarrow|\\leftrightarrow|\\Rightarrow|\\Leftarrow|\\Leftrightarrow', text)) / 1.5, 1.0),
+        1.0 if re.search(r'\\begin\{.*?\}.*?\\end\{.*?\}', text) else 0.0,
+    ]
+    return np.mean(scores)
+
+
+def legacy_classify(text):
+    # 旧流程：先判定，命中后再扫描一遍计算置信度
+    if not legacy_is_text_formula(text):
+        return False, 0.0
+    return True, legacy_confidence(text)
+
+
+def bench(func, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.blocks)
+    classifier = TextFormulaClassifier()
+
+    mismatches = 0
+    for text in corpus:
+        old_formula, old_conf = legacy_classify(text)
+        new_formula, new_conf = classifier.classify(text)
+        if old_formula != new_formula or (old_formula and abs(old_conf - new_conf) > 1e-9):
+            mismatches += 1
+
+    legacy_rate = bench(legacy_classify, corpus, args.repeat)
+    new_rate = bench(classifier.classify, corpus, args.repeat)
+    print(f"corpus: {len(corpus)} text blocks, mismatches: {mismatches}")
+    print(f"legacy multi-regex : {legacy_rate:12,.0f} blocks/s")
+    print(f"single-pass        : {new_rate:12,.0f} blocks/s  ({new_rate / legacy_rate:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
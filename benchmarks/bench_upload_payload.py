@@ -0,0 +1,99 @@
+"""Compare upload size and end-to-end latency with and without preprocessing.
+
+Synthetic high-DPI formula crops are sent through APIClient to a local mock
+endpoint that simulates a constrained uplink, so the numbers are
+reproducible without an API key:
+
+    python benchmarks/bench_upload_payload.py --count 30 --uplink-kbps 10000
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from config.settings import Config  # noqa: E402
+from core.api_client import APIClient  # noqa: E402
+
+
+def make_crop(seed, scale=4):
+    """白底黑字的合成公式截图，带大片留白并放大以模拟高DPI"""
+    rng = np.random.default_rng(seed)
+    img = np.full((300, 1200, 3), 255, np.uint8)
+    text = " + ".join(f"x_{i}^{int(rng.integers(2, 9))}" for i in range(int(rng.integers(2, 6))))
+    cv2.putText(img, text + " = y", (60, 170), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (20, 20, 20), 3, cv2.LINE_AA)
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+
+
+def start_mock_server(uplink_kbps):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            # 按上行带宽模拟传输耗时
+            time.sleep(len(body) * 8 / (uplink_kbps * 1000))
+            out = json.dumps({
+                "id": "bench", "object": "chat.completion", "created": 0, "model": "mock",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "x^2"}}],
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(crops, preprocess):
+    Config.UPLOAD_PREPROCESS = preprocess
+    client = APIClient(cache=None)
+    start = time.perf_counter()
+    for crop in crops:
+        client.recognize_formula(crop)
+    elapsed = time.perf_counter() - start
+    uploaded = client.bytes_uploaded if preprocess else sum(len(cv2.imencode(".png", c)[1]) for c in crops)
+    return uploaded, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=30)
+    parser.add_argument("--uplink-kbps", type=float, default=10000)
+    args = parser.parse_args()
+
+    server = start_mock_server(args.uplink_kbps)
+    Config.API_ENDPOINT = f"http://127.0.0.1:{server.server_port}/v1"
+    Config.CACHE_ENABLED = False
+    Config.RATE_LIMIT_RPS = 0  # 只测量传输，不做限流
+    Config.RATE_LIMIT_TPM = 0
+    Config.get_instance().API_KEY = Config.get_instance().API_KEY or "sk-benchmark"
+
+    crops = [make_crop(i) for i in range(args.count)]
+    raw_bytes, raw_time = run(crops, preprocess=False)
+    small_bytes, small_time = run(crops, preprocess=True)
+
+    print(f"crops: {args.count} ({crops[0].shape[1]}x{crops[0].shape[0]}), uplink {args.uplink_kbps:.0f} kbit/s")
+    print(f"{'':14}{'upload bytes':>16}{'avg/image':>12}{'total s':>10}{'ms/image':>10}")
+    for label, size, elapsed in (("original", raw_bytes, raw_time), ("preprocessed", small_bytes, small_time)):
+        print(f"{label:14}{size:16d}{size // args.count:12d}{elapsed:10.2f}{elapsed / args.count * 1000:10.1f}")
+    print(f"bytes saved: {raw_bytes - small_bytes} ({(1 - small_bytes / raw_bytes) * 100:.1f}%)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
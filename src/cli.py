@@ -0,0 +1,166 @@
+"""Headless batch recognition: images, folders and PDFs in, reports out.
+
+    python src/cli.py scans/ paper.pdf -o out/ -f docx,tex,png --workers 8
+
+Progress goes to stdout, one line per formula. The exit code is 0 when
+every formula was recognized and every format was saved, 1 when any of
+them failed and 2 for usage or configuration errors. The remote engine
+reads the API key from ``FORMULAPRO_API_KEY`` (or ``DASHSCOPE_API_KEY``)
+and falls back to the key saved by the desktop app in the system keyring.
+No Qt modules are imported.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from config.settings import Config
+from core.exporters import FORMULA_FORMATS, REPORT_FORMATS, export_formulas
+from core.pdf_parser import PDFParser
+from core.recognition_engine import create_engine
+from core.recognition_pool import RecognitionPool
+from core.render_farm import RenderFarm
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+API_KEY_ENV_VARS = ("FORMULAPRO_API_KEY", "DASHSCOPE_API_KEY")
+
+# (图片路径或PDF裁剪, PDF文本层, 进度输出中的名称)
+Item = Tuple[object, Optional[str], str]
+
+
+def collect_inputs(paths: List[str]) -> List[str]:
+    """Expand folders into their image and PDF files, keeping the given order"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(IMAGE_EXTENSIONS + (".pdf",)))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            raise FileNotFoundError(f"No such file or directory: {path}")
+    return files
+
+
+def iter_items(files: List[str], parser: PDFParser) -> Iterator[Item]:
+    """Yield images as they are and PDF formulas page by page while the PDF is parsed"""
+    for path in files:
+        name = os.path.basename(path)
+        if not path.lower().endswith(".pdf"):
+            yield path, None, name
+            continue
+        count = 0
+        for page_num, page_formulas in parser.iter_pages(path):
+            for formula in page_formulas:
+                count += 1
+                yield formula[0], formula[3] if len(formula) > 3 else None, f"{name} p{page_num + 1} #{count}"
+        if count == 0:
+            print(f"{name}: no formulas found", flush=True)
+
+
+def resolve_api_key() -> str:
+    for name in API_KEY_ENV_VARS:
+        if os.environ.get(name):
+            return os.environ[name]
+    return Config.get_saved_key()
+
+
+def needs_api_key(engine: str) -> bool:
+    return engine == "remote" or (engine == "tiered" and Config.TIER_REMOTE_ENGINE == "remote")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    formats = REPORT_FORMATS + FORMULA_FORMATS
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="image files, PDF files or folders containing them")
+    parser.add_argument("-o", "--output", default=".", help="output directory (default: current directory)")
+    parser.add_argument("-f", "--formats", default="tex,md",
+                        help=f"comma-separated output formats from {', '.join(formats)} (default: tex,md)")
+    parser.add_argument("-w", "--workers", type=int, default=Config.MAX_WORKERS,
+                        help=f"concurrent recognitions (default: {Config.MAX_WORKERS})")
+    parser.add_argument("--render-workers", type=int, default=Config.RENDER_FARM_WORKERS,
+                        help=f"render processes for image formats (default: {Config.RENDER_FARM_WORKERS})")
+    parser.add_argument("--engine", choices=("remote", "local", "mock", "tiered"),
+                        default=Config.RECOGNITION_ENGINE,
+                        help=f"recognition engine (default: {Config.RECOGNITION_ENGINE})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log details to stderr")
+    args = parser.parse_args(argv)
+
+    args.formats = [fmt.strip().lower() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in args.formats if fmt not in formats]
+    if unknown or not args.formats:
+        parser.error(f"unsupported formats: {', '.join(unknown) or '(none)'}")
+    if args.workers < 1 or args.render_workers < 1:
+        parser.error("--workers and --render-workers must be at least 1")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    try:
+        files = collect_inputs(args.inputs)
+        if needs_api_key(args.engine):
+            api_key = resolve_api_key()
+            if not api_key:
+                print(f"error: no API key; set {API_KEY_ENV_VARS[0]} or save one in the desktop app",
+                      file=sys.stderr)
+                return 2
+            Config.set_api_key(api_key)
+        engine = create_engine(args.engine)
+        os.makedirs(args.output, exist_ok=True)
+    except Exception as e:
+        print(f"error: {str(e)}", file=sys.stderr)
+        return 2
+    if not files:
+        print("error: no images or PDFs found in the inputs", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    pool = RecognitionPool(lambda item: engine.recognize_formula(item[0], source_text=item[1]), args.workers)
+    results, failures = [], 0
+    try:
+        # 跨页重复的公式图像只识别一次
+        for idx, (item, success, latex) in enumerate(pool.map(iter_items(files, PDFParser()), dedupe=True)):
+            if success and latex:
+                results.append(latex)
+                print(f"[{idx + 1}] {item[2]}: ok {latex}", flush=True)
+            else:
+                failures += 1
+                print(f"[{idx + 1}] {item[2]}: FAILED {str(latex) if not success else 'empty result'}", flush=True)
+    except KeyboardInterrupt:
+        pool.cancel()
+        print("interrupted", file=sys.stderr)
+        return 1
+
+    print(f"Recognized {len(results)}/{len(results) + failures} formulas "
+          f"in {time.perf_counter() - start:.1f} s", flush=True)
+    if engine.stats():
+        print(f"Recognition tier stats: {engine.stats()}", flush=True)
+    if not results:
+        return 1
+
+    def _on_render(done, total):
+        # 每10%输出一次渲染进度
+        if done == total or done % max(1, total // 10) == 0:
+            print(f"Rendering {done}/{total}", flush=True)
+
+    outcomes = export_formulas(results, args.formats, os.path.join(args.output, "FormulaReport"),
+                               os.path.join(args.output, "formula_"),
+                               farm=RenderFarm(workers=args.render_workers), progress_callback=_on_render)
+    for fmt, error in outcomes.items():
+        print(f"{fmt}: {'saved' if error is None else f'FAILED {str(error)}'}", flush=True)
+
+    failed_formats = [fmt for fmt, error in outcomes.items() if error is not None]
+    return 1 if failures or failed_formats else 0
+
+
+if __name__ == "__main__":
+    # 渲染进程池和多进程PDF解析在打包后同样需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import getpass
 import os
 import platform
 import keyring
@@ -12,6 +13,83 @@ class Config:
     API_ENDPOINT = "https://dashscope-intl.aliyuncs.com/compatible-mode/v1"
     TIMEOUT = 30
     MAX_WORKERS = 4
+    ASYNC_MAX_IN_FLIGHT = 256  # 异步客户端同时在途的请求数
+    ASYNC_MAX_CONNECTIONS = 32  # 共享连接池的keep-alive连接数
+
+    # 识别引擎：remote（DashScope API）、local（本地ONNX模型）、mock（离线测试）、
+    # tiered（文本层 -> 本地模型 -> 远程API 逐级升级）
+    RECOGNITION_ENGINE = "remote"
+    LOCAL_MODEL_DIR = os.path.expanduser("~/.formulapro/models/latex-ocr")
+    LOCAL_MODEL_THREADS = 2  # 每个ONNX会话使用的CPU线程数
+    MOCK_ENGINE_LATENCY = 0.0  # mock引擎模拟的单次识别耗时（秒）
+    TIER_TEXT_LAYER = True  # 分级识别：PDF文本层可直接转换时跳过模型
+    TIER_TEXT_MIN_CONFIDENCE = 0.75  # 版面检测置信度低于该值时不走文本层捷径
+    TIER_LOCAL_ENABLED = True  # 分级识别：本地模型可用时先本地识别
+    TIER_LOCAL_MIN_CONFIDENCE = 0.9  # 本地结果低于该置信度时升级到远程引擎
+    TIER_REMOTE_ENGINE = "remote"  # 最后一级使用的引擎
+
+    # 重试、限流与熔断配置（所有 worker 共享）
+    RETRY_MAX_ATTEMPTS = 5
+    RETRY_BASE_DELAY = 0.5  # 指数退避的初始延迟（秒）
+    RETRY_MAX_DELAY = 30
+    RATE_LIMIT_RPS = 5.0  # 每秒请求数上限
+    RATE_LIMIT_TPM = 100000  # 每分钟token上限
+    RATE_LIMIT_TOKENS_PER_IMAGE = 1500  # 每张图片预估消耗的token
+    CIRCUIT_FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+    CIRCUIT_RESET_TIMEOUT = 30  # 熔断后多久再试探（秒）
+
+    # 上传前的图片预处理配置
+    UPLOAD_PREPROCESS = True
+    UPLOAD_MAX_PIXELS = 1_000_000  # 上传图片的像素上限
+    UPLOAD_BINARIZE = True
+
+    # 多公式合并请求配置
+    BATCH_RECOGNITION = False
+    BATCH_MAX_CROPS = 8  # 每个请求最多包含的公式图片数
+    BATCH_MAX_PAYLOAD_BYTES = 4 * 1024 * 1024
+
+    # PDF解析配置
+    PDF_PARSE_WORKERS = os.cpu_count() or 1  # 多进程并行解析的进程数，1为串行
+    PDF_PARALLEL_MIN_PAGES = 16  # 页数少于此值时直接串行解析
+    PDF_PARSE_CHUNK_PAGES = 8  # 每个进程任务的页数
+    PDF_TEXT_RENDER_MODE = "raster"  # raster: 从页面栅格化公式区域；redraw: 用PIL重绘文本
+    PDF_RASTER_DPI = 200
+    PDF_RASTER_PAGE_BATCH = 3  # 同一页公式区域达到此数量时整页渲染一次再裁剪
+    PDF_FORMULA_DETECTOR = "layout"  # layout: 基于字体/基线的版面检测；regex: 旧的文本块正则匹配
+    PDF_LAYOUT_MIN_CONFIDENCE = 0.4  # 版面检测保留公式区域的最低置信度
+    PDF_LAYOUT_MIN_CHARS = 2  # 行内公式至少包含的非空白字符数
+
+    # 识别结果缓存配置
+    CACHE_ENABLED = True
+    CACHE_PATH = os.path.expanduser("~/.formulapro/recognition_cache.sqlite3")
+    CACHE_MAX_ENTRIES = 50000
+
+    # 公式渲染缓存配置（PNG字节，按LaTeX和渲染参数索引）
+    RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    RENDER_CACHE_DISK = False  # 是否同时缓存到磁盘
+    RENDER_CACHE_DIR = os.path.expanduser("~/.formulapro/render_cache")
+    RENDER_FIGURE_POOL_SIZE = 4  # 复用的matplotlib画布数量
+    RENDER_FRAGMENT_DPI = 200  # 多行环境（align/cases/矩阵）逐单元格渲染的最高分辨率
+
+    # 实时预览配置
+    PREVIEW_DEBOUNCE_MS = 150  # 停止输入多久后开始渲染预览
+    PREVIEW_DRAFT_SCALE = 0.25  # 草图相对完整预览的尺寸比例
+    PREVIEW_CACHE_SIZE = 32  # 按文本缓存的完整预览图数量
+
+    # 导出渲染进程池配置
+    RENDER_FARM_WORKERS = os.cpu_count() or 1  # 渲染进程数，1为在当前进程串行渲染
+    RENDER_FARM_MIN_FORMULAS = 16  # 公式数少于此值时不启动进程池
+    RENDER_FARM_CHUNK = 8  # 每个进程任务的公式数
+
+    # 本地HTTP识别服务配置
+    SERVICE_HOST = "127.0.0.1"
+    SERVICE_PORT = 8765
+    SERVICE_WORKERS = 2  # 同时处理的任务数
+    SERVICE_QUEUE_DEPTH = 32  # 排队任务上限，超出时返回429
+    SERVICE_RETRY_AFTER = 5  # 429响应建议的重试间隔（秒）
+    SERVICE_MAX_JOBS = 200  # 保留的已完成任务数
+    SERVICE_MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+    SERVICE_RECOGNITION_WORKERS = 4  # 每个任务内的并发识别数
 
     # 密钥管理配置
     SERVICE_NAME = "FormulaProSecure"
@@ -42,7 +120,11 @@ class Config:
         try:
             # 使用机器ID和用户名生成唯一的加密密钥
             machine_id = platform.node().encode()
-            username = os.getlogin().encode()
+            try:
+                username = os.getlogin().encode()
+            except OSError:
+                # 没有控制终端（cron、服务、容器）时 os.getlogin 不可用
+                username = getpass.getuser().encode()
             key_base = hashlib.sha256(machine_id + username).digest()[:32]  # 必须是32字节
             self._fernet = Fernet(base64.urlsafe_b64encode(key_base))
             logging.info("Encryption key loaded successfully")
@@ -1,52 +1,135 @@
 # api_client.py
+import asyncio
 import base64
 import logging
-from openai import OpenAI
+import re
+import threading
+import weakref
+import httpx
+from openai import OpenAI, AsyncOpenAI
 from config.settings import Config
-import time
+from core.recognition_cache import RecognitionCache
+from core.request_scheduler import RequestScheduler
+from core.image_utils import to_png_bytes, image_mime_type, preprocess_for_upload
+from core.recognition_engine import RecognitionEngine
 from typing import List, Dict, Any
 
-class APIClient:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=Config.get_instance().API_KEY,
-            base_url=Config.API_ENDPOINT,
-            timeout=Config.TIMEOUT
-        )
+# 批量识别答案的行格式，例如 "3: \frac{a}{b}"
+BATCH_ANSWER_PATTERN = re.compile(r"^(?:formula\s*)?(\d+)\s*[:.)]\s*(.*)$", re.IGNORECASE)
+
+
+class RemoteRequestBuilder:
+    """Prompt, payload and cache helpers shared by the sync and async remote clients"""
+
+    def _setup(self, cache):
         self.logger = logging.getLogger("api_client")
-        self.retry_count = 3
+        self.scheduler = RequestScheduler.get_instance()
         self.model = "qwen-vl-max"
+        self.prompt = "Convert math formula to LaTeX"
+        if cache is None and Config.CACHE_ENABLED:
+            cache = RecognitionCache.get_instance()
+        self.cache = cache
+        self.bytes_original = 0  # 预处理前后的累计字节数
+        self.bytes_uploaded = 0
 
-    def recognize_formula(self, image_path):
-        for attempt in range(self.retry_count):
-            try:
-                with open(image_path, "rb") as f:
-                    image_data = base64.b64encode(f.read()).decode()
-
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Convert math formula to LaTeX"},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{image_data}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }],
-                    timeout=Config.TIMEOUT  # 使用实例属性
-                )
-                return self._parse_response(response.choices[0].message.content)
-            except Exception as e:
-                self.logger.error(f"API Error (attempt {attempt+1}): {str(e)}")
-                if attempt == self.retry_count - 1:
-                    raise
-                time.sleep(1)
-        return ""
+    @staticmethod
+    def _estimate_tokens(messages):
+        images = sum(1 for part in messages[0]["content"] if part["type"] == "image_url")
+        return Config.RATE_LIMIT_TOKENS_PER_IMAGE * max(images, 1)
+
+    def _record_usage(self, estimated, response):
+        usage = getattr(response, "usage", None)
+        self.scheduler.record_usage(estimated, getattr(usage, "total_tokens", None))
+
+    def _prepare_payload(self, image):
+        """Encode the input and shrink it according to the upload settings"""
+        image_bytes = to_png_bytes(image)
+        if not Config.UPLOAD_PREPROCESS:
+            return image_bytes
+        payload, stats = preprocess_for_upload(
+            image_bytes, Config.UPLOAD_MAX_PIXELS, binarize=Config.UPLOAD_BINARIZE
+        )
+        self.bytes_original += stats["original_bytes"]
+        self.bytes_uploaded += stats["payload_bytes"]
+        self.logger.debug(
+            f"Upload payload {stats['original_bytes']} -> {stats['payload_bytes']} bytes "
+            f"({stats['original_bytes'] - stats['payload_bytes']} saved, {stats['encoding']})"
+        )
+        return payload
+
+    def _cache_lookup_key(self, image_bytes):
+        if self.cache is None:
+            return None
+        return RecognitionCache.make_key(image_bytes, self.model, self.prompt)
+
+    def _store_result(self, cache_key, response_text):
+        latex = self._parse_response(response_text)
+        if cache_key is not None and latex:
+            self.cache.put(cache_key, self.model, latex)
+        return latex
+
+    def _build_messages(self, image_bytes):
+        image_data = base64.b64encode(image_bytes).decode()
+        mime_type = image_mime_type(image_bytes)
+        return [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": self.prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{mime_type};base64,{image_data}",
+                        "detail": "high"
+                    }
+                }
+            ]
+        }]
+
+    def _build_batch_messages(self, payloads):
+        count = len(payloads)
+        content = [{
+            "type": "text",
+            "text": (
+                f"The following {count} images are separate math formulas, numbered 1 to {count}. "
+                f"Convert each one to LaTeX and reply with exactly {count} lines of the form "
+                "'<number>: <latex>', one formula per line, with no other text."
+            )
+        }]
+        for number, image_bytes in enumerate(payloads, start=1):
+            image_data = base64.b64encode(image_bytes).decode()
+            content.append({"type": "text", "text": f"Formula {number}:"})
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{image_mime_type(image_bytes)};base64,{image_data}",
+                    "detail": "high"
+                }
+            })
+        return [{"role": "user", "content": content}]
+
+    @staticmethod
+    def _parse_batch_response(response_text, count):
+        """Split a numbered multi-formula answer; None unless all formulas are present"""
+        answers = {}
+        current = None
+        for line in (response_text or "").splitlines():
+            line = line.strip()
+            if not line or line.startswith("```"):
+                continue
+            match = BATCH_ANSWER_PATTERN.match(line)
+            if match:
+                current = int(match.group(1))
+                if current in answers or not 1 <= current <= count:
+                    return None
+                answers[current] = match.group(2).strip()
+            elif current is not None:
+                # 多行公式（如矩阵）续接到上一条答案
+                answers[current] += " " + line
+            else:
+                return None
+        if len(answers) != count or not all(answers.values()):
+            return None
+        return [answers[number].strip() for number in range(1, count + 1)]
 
     @staticmethod
     def _parse_response(response_text):
@@ -57,4 +140,217 @@ class APIClient:
                 return response_text[start:end].strip()
             return response_text.strip('$')
         except ValueError:
-            return response_text.strip('$')
\ No newline at end of file
+            return response_text.strip('$')
+
+
+class APIClient(RemoteRequestBuilder, RecognitionEngine):
+    """Remote recognition engine backed by the DashScope qwen-vl-max API"""
+
+    name = "remote"
+    # 进程内共享的客户端（复用连接池），按API密钥区分
+    _shared_clients: Dict[str, OpenAI] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cache=None):
+        self._setup(cache)
+        self.client = self._get_shared_client(Config.get_instance().API_KEY)
+
+    @classmethod
+    def _get_shared_client(cls, api_key):
+        with cls._shared_lock:
+            client = cls._shared_clients.get(api_key)
+            if client is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=Config.API_ENDPOINT,
+                    timeout=Config.TIMEOUT,
+                    max_retries=0  # 重试由 RequestScheduler 统一处理
+                )
+                cls._shared_clients[api_key] = client
+            return client
+
+    def recognize_formula(self, image, source_text=None):
+        """Recognize a path, encoded bytes, numpy array or QImage/QPixmap"""
+        image_bytes = self._prepare_payload(image)
+
+        # 先查缓存，命中则无需网络请求
+        cache_key = self._cache_lookup_key(image_bytes)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        return self._recognize_payload(image_bytes, cache_key)
+
+    def recognize_batch(self, images, max_crops=None, max_payload_bytes=None):
+        """Recognize several crops while packing them into as few requests as possible.
+
+        Up to ``max_crops`` images totalling at most ``max_payload_bytes`` share
+        one request whose numbered answer is split back per formula. Chunks
+        whose answer does not parse cleanly are retried one image at a time.
+        Returns a list aligned with ``images``; failed items hold the exception.
+        """
+        max_crops = max_crops or Config.BATCH_MAX_CROPS
+        max_payload_bytes = max_payload_bytes or Config.BATCH_MAX_PAYLOAD_BYTES
+        results = [None] * len(images)
+        pending = []  # (index, payload, cache_key)
+
+        for idx, image in enumerate(images):
+            try:
+                payload = self._prepare_payload(image)
+            except Exception as e:
+                results[idx] = e
+                continue
+            cache_key = self._cache_lookup_key(payload)
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                results[idx] = cached
+            else:
+                pending.append((idx, payload, cache_key))
+
+        for chunk in self._chunk_payloads(pending, max_crops, max_payload_bytes):
+            answers = None
+            if len(chunk) > 1:
+                try:
+                    response_text = self._complete(
+                        self._build_batch_messages([payload for _, payload, _ in chunk])
+                    )
+                    answers = self._parse_batch_response(response_text, len(chunk))
+                    if answers is None:
+                        self.logger.warning(
+                            f"Unparseable batch answer for {len(chunk)} formulas, "
+                            "falling back to single requests"
+                        )
+                except Exception as e:
+                    self.logger.warning(f"Batch request failed, falling back to single requests: {str(e)}")
+
+            for pos, (idx, payload, cache_key) in enumerate(chunk):
+                try:
+                    if answers is not None:
+                        results[idx] = self._store_result(cache_key, answers[pos])
+                    else:
+                        results[idx] = self._recognize_payload(payload, cache_key)
+                except Exception as e:
+                    results[idx] = e
+        return results
+
+    @staticmethod
+    def _chunk_payloads(pending, max_crops, max_payload_bytes):
+        chunk, chunk_bytes = [], 0
+        for entry in pending:
+            size = len(entry[1])
+            if chunk and (len(chunk) >= max_crops or chunk_bytes + size > max_payload_bytes):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(entry)
+            chunk_bytes += size
+        if chunk:
+            yield chunk
+
+    def _recognize_payload(self, image_bytes, cache_key):
+        response_text = self._complete(self._build_messages(image_bytes))
+        return self._store_result(cache_key, response_text)
+
+    def _complete(self, messages):
+        """Send one chat completion through the shared scheduler and return the answer text"""
+        tokens = self._estimate_tokens(messages)
+
+        def _send():
+            return self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                timeout=Config.TIMEOUT  # 使用实例属性
+            )
+
+        response = self.scheduler.call(_send, tokens)
+        self._record_usage(tokens, response)
+        return response.choices[0].message.content
+
+
+class AsyncAPIClient(RemoteRequestBuilder):
+    """Asyncio counterpart of APIClient sharing one keep-alive pool per event loop.
+
+    ``recognize_many`` keeps up to ``Config.ASYNC_MAX_IN_FLIGHT`` requests in
+    flight over the shared connections instead of one thread per request.
+    It is not a RecognitionEngine: its methods are coroutines, and the
+    blocking cache lookups run in worker threads.
+    """
+
+    # httpx 的异步连接池绑定事件循环，因此每个事件循环共享一个客户端
+    _async_clients = weakref.WeakKeyDictionary()
+
+    def __init__(self, cache=None, base_url=None):
+        self._setup(cache)
+        self.api_key = Config.get_instance().API_KEY
+        self.base_url = base_url or Config.API_ENDPOINT
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        clients = self._async_clients.setdefault(loop, {})
+        key = (self.api_key, self.base_url)
+        client = clients.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=Config.ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.ASYNC_MAX_CONNECTIONS,
+                ),
+                timeout=Config.TIMEOUT,
+            )
+            client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=Config.TIMEOUT,
+                max_retries=0,
+                http_client=http_client
+            )
+            clients[key] = client
+        return client
+
+    async def recognize_formula(self, image, source_text=None):
+        image_bytes = await asyncio.to_thread(self._prepare_payload, image)
+
+        # SQLite 缓存是阻塞调用，不能在事件循环线程中执行
+        cache_key = self._cache_lookup_key(image_bytes)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        messages = self._build_messages(image_bytes)
+        tokens = self._estimate_tokens(messages)
+
+        async def _send():
+            return await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                timeout=Config.TIMEOUT
+            )
+
+        response = await self.scheduler.acall(_send, tokens)
+        self._record_usage(tokens, response)
+        return await asyncio.to_thread(self._store_result, cache_key, response.choices[0].message.content)
+
+    async def recognize_many(self, images, max_in_flight=None) -> List[Any]:
+        """Recognize all images concurrently, returning results in input order.
+
+        Failed items are returned as the raised exception instead of a string.
+        """
+        semaphore = asyncio.Semaphore(max_in_flight or Config.ASYNC_MAX_IN_FLIGHT)
+
+        async def _recognize(image):
+            async with semaphore:
+                return await self.recognize_formula(image)
+
+        return await asyncio.gather(
+            *(_recognize(image) for image in images),
+            return_exceptions=True
+        )
+
+    @classmethod
+    async def aclose(cls):
+        """Close the clients bound to the running event loop"""
+        clients = cls._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.close()
\ No newline at end of file
@@ -0,0 +1,235 @@
+# exporters.py
+import logging
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Sequence
+
+from core.render_farm import RenderFarm, RenderResult
+
+logger = logging.getLogger("exporters")
+
+REPORT_TITLE = "Formula Recognition Report"
+REPORT_FORMATS = ("docx", "pdf", "tex", "md")  # 所有公式合并到一个文件
+FORMULA_FORMATS = ("png", "svg")  # 每个公式一个文件
+# 每种导出格式使用的公式渲染结果：Word 和 PNG 用位图，PDF 和 SVG 用矢量图
+RENDER_KINDS = {"docx": "png", "png": "png", "pdf": "pdf", "svg": "svg"}
+
+# PDF报告版式（点）
+PDF_MARGIN = 20 * 72 / 25.4
+PDF_TITLE_SPACING = 15 * 72 / 25.4
+PDF_FORMULA_SPACING = 10 * 72 / 25.4
+PDF_FORMULA_MAX_WIDTH = 150 * 72 / 25.4
+PDF_FORMULA_MAX_HEIGHT = 60 * 72 / 25.4
+PDF_FORMULA_SCALE = 0.5  # 公式按 36pt 渲染，报告中相当于 18pt
+
+
+def _clean_formula(formula: str) -> str:
+    return formula.replace("\\begin{equation}", "").replace("\\end{equation}", "").strip("$")
+
+
+def save_docx(formulas: Sequence[str], images: Sequence[RenderResult], output_path: str):
+    """Save all formulas with their rendered images in one Word document"""
+    from docx import Document
+    from docx.shared import Inches
+    from docx.oxml.ns import qn
+
+    doc = Document()
+    style = doc.styles['Normal']
+    style.font.name = 'Times New Roman'
+    style._element.rPr.rFonts.set(qn('w:eastAsia'), 'SimSun')
+
+    doc.add_heading(REPORT_TITLE, 0)
+    for idx, (formula, image) in enumerate(zip(formulas, images)):
+        if isinstance(image, Exception):
+            logger.error(f"Failed to render formula {idx + 1}: {str(image)}")
+            doc.add_paragraph(f"Formula {idx + 1} render failed: {str(image)}")
+            continue
+        doc.add_heading(f"Formula {idx + 1}", level=2)
+        doc.add_paragraph(f"LaTeX Code:\n{formula}")
+        doc.add_picture(BytesIO(image), width=Inches(5))
+
+    doc.save(output_path)
+    logger.info(f"Word document saved successfully: {output_path}")
+
+
+def save_pdf(formulas: Sequence[str], images: Sequence[RenderResult], output_path: str):
+    """Save all formulas in one PDF document, placing each vector formula PDF as a page object.
+
+    Formulas that failed to render get a placeholder line; the document is
+    still saved and RuntimeError is raised afterwards with the failure count.
+    """
+    import fitz
+
+    width, height = fitz.paper_size("a4")
+    margin = PDF_MARGIN
+    text_width = width - 2 * margin
+    doc = fitz.open()
+    page, y = None, height
+    failed = 0
+
+    def _ensure_space(needed):
+        nonlocal page, y
+        if page is None or y + needed > height - margin:
+            page, y = doc.new_page(width=width, height=height), margin
+
+    try:
+        _ensure_space(0)
+        title_width = fitz.get_text_length(REPORT_TITLE, fontname="hebo", fontsize=18)
+        page.insert_text(((width - title_width) / 2, y + 18), REPORT_TITLE, fontname="hebo", fontsize=18)
+        y += 18 + PDF_TITLE_SPACING
+
+        for idx, (formula, image) in enumerate(zip(formulas, images)):
+            if isinstance(image, Exception):
+                logger.error(f"Failed to render formula {idx + 1}: {str(image)}")
+                failed += 1
+                lines = _wrap_text(f"Formula {idx + 1} render failed: {str(image)}", "helv", 10, text_width)
+                _ensure_space(12 * len(lines) + PDF_FORMULA_SPACING)
+                for line in lines:
+                    page.insert_text((margin, y + 10), line, fontname="helv", fontsize=10)
+                    y += 12
+                y += PDF_FORMULA_SPACING
+                continue
+            with fitz.open("pdf", image) as formula_doc:
+                # 公式按自然尺寸缩放后放入，超出版心时等比缩小
+                rect = formula_doc[0].rect
+                scale = min(PDF_FORMULA_SCALE, PDF_FORMULA_MAX_WIDTH / rect.width,
+                            PDF_FORMULA_MAX_HEIGHT / rect.height)
+                code_lines = _wrap_text(f"LaTeX Code: {formula}", "cour", 10, text_width)
+                _ensure_space(14 + 6 + 12 * len(code_lines) + 6 + rect.height * scale)
+
+                page.insert_text((margin, y + 14), f"Formula {idx + 1}", fontname="hebo", fontsize=14)
+                y += 14 + 6
+                for line in code_lines:
+                    page.insert_text((margin, y + 10), line, fontname="cour", fontsize=10)
+                    y += 12
+                y += 6
+                target = fitz.Rect(margin, y, margin + rect.width * scale, y + rect.height * scale)
+                page.show_pdf_page(target, formula_doc, 0)
+                y = target.y1 + PDF_FORMULA_SPACING
+
+        # 各公式子集字体中相同的字形过程去重后只保存一份
+        doc.save(output_path, garbage=4, deflate=True)
+    finally:
+        doc.close()
+    logger.info(f"PDF document saved successfully: {output_path}")
+    if failed:
+        raise RuntimeError(f"{failed} of {len(formulas)} formulas could not be rendered in {output_path}")
+
+
+def _wrap_text(text: str, fontname: str, fontsize: float, max_width: float) -> List[str]:
+    """Break text into lines no wider than ``max_width`` points"""
+    import fitz
+
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        line = ""
+        for char in paragraph:
+            if line and fitz.get_text_length(line + char, fontname=fontname, fontsize=fontsize) > max_width:
+                lines.append(line)
+                line = ""
+            line += char
+        lines.append(line)
+    return lines
+
+
+def save_tex(formulas: Sequence[str], output_path: str):
+    """Save all formulas in one compilable LaTeX document"""
+    tex_content = f"""\\documentclass{{article}}
+\\usepackage{{amsmath}}
+\\begin{{document}}
+\\title{{{REPORT_TITLE}}}
+\\maketitle
+"""
+    for idx, formula in enumerate(formulas):
+        tex_content += f"\\section*{{Formula {idx + 1}}}\n"
+        tex_content += "\\begin{align*}\n"
+        tex_content += f"{_clean_formula(formula)}\n"
+        tex_content += "\\end{align*}\n\n"
+    tex_content += "\\end{document}"
+
+    with open(output_path, "w", encoding='utf-8') as f:
+        f.write(tex_content)
+    logger.info(f"LaTeX document saved successfully: {output_path}")
+
+
+def save_md(formulas: Sequence[str], output_path: str):
+    """Save all formulas in one Markdown document with math blocks"""
+    md_content = f"# {REPORT_TITLE}\n\n"
+    for idx, formula in enumerate(formulas):
+        clean_formula = formula.strip("$")
+        md_content += f"## Formula {idx + 1}\n\n"
+        md_content += "**LaTeX Code:**\n"
+        md_content += "```math\n"
+        md_content += f"{clean_formula}\n"
+        md_content += "```\n\n"
+        md_content += f"**Rendered Formula:**\n$$\n{clean_formula}\n$$\n\n"
+
+    with open(output_path, "w", encoding='utf-8') as f:
+        f.write(md_content)
+    logger.info(f"Markdown document saved successfully: {output_path}")
+
+
+def save_formula_files(images: Sequence[RenderResult], fmt: str, formula_prefix: str) -> int:
+    """Write one ``{formula_prefix}{n}.{fmt}`` file per formula and return how many were saved.
+
+    Formulas that failed to render are logged and skipped; RuntimeError is
+    raised afterwards if any were skipped.
+    """
+    saved, failed = 0, 0
+    for idx, image in enumerate(images):
+        output_path = f"{formula_prefix}{idx + 1}.{fmt}"
+        if isinstance(image, Exception):
+            logger.error(f"Failed to save {fmt.upper()} file {idx + 1}: {str(image)}")
+            failed += 1
+            continue
+        with open(output_path, "wb") as f:
+            f.write(image)
+        saved += 1
+        logger.info(f"{fmt.upper()} file {idx + 1} saved successfully: {output_path}")
+    if failed:
+        raise RuntimeError(f"{failed} of {len(images)} {fmt.upper()} files could not be rendered")
+    return saved
+
+
+def export_formulas(formulas: Sequence[str], formats: Sequence[str], report_base: str, formula_prefix: str,
+                    farm: Optional[RenderFarm] = None,
+                    progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Optional[Exception]]:
+    """Export formulas to every requested format, rendering each formula once per image kind.
+
+    Reports go to ``{report_base}.{fmt}`` and per-formula files to
+    ``{formula_prefix}{n}.{fmt}``. Images are rendered up front by the
+    render farm, once per kind in ``RENDER_KINDS``;
+    ``progress_callback(done, total)`` follows the rendering.
+    Returns a dict mapping each format to None on success or the exception
+    that made it fail.
+    """
+    formulas = list(formulas)
+    kinds = sorted({RENDER_KINDS[fmt] for fmt in formats if fmt in RENDER_KINDS})
+    farm = farm or RenderFarm()
+    images: Dict[str, List[RenderResult]] = {}
+    for pass_idx, kind in enumerate(kinds):
+        def _report(done, total, offset=pass_idx * len(formulas)):
+            # 多种渲染结果依次生成，进度按总量累计
+            if progress_callback:
+                progress_callback(offset + done, total * len(kinds))
+        images[kind] = farm.render(formulas, kind, _report)
+
+    results = {}
+    for fmt in formats:
+        try:
+            if fmt == "docx":
+                save_docx(formulas, images["png"], f"{report_base}.docx")
+            elif fmt == "pdf":
+                save_pdf(formulas, images["pdf"], f"{report_base}.pdf")
+            elif fmt == "tex":
+                save_tex(formulas, f"{report_base}.tex")
+            elif fmt == "md":
+                save_md(formulas, f"{report_base}.md")
+            elif fmt in FORMULA_FORMATS:
+                save_formula_files(images[RENDER_KINDS[fmt]], fmt, formula_prefix)
+            else:
+                raise ValueError(f"Unsupported export format: {fmt}")
+            results[fmt] = None
+        except Exception as e:
+            logger.error(f"Failed to save {fmt.upper()}: {str(e)}", exc_info=True)
+            results[fmt] = e
+    return results
@@ -0,0 +1,98 @@
+# image_classifier.py
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+COLOR_THRESHOLD = 10     # 通道间平均差异超过该值视为彩色图片
+WHITE_LEVEL = 240        # 大于该灰度值的像素视为白色背景
+FORMULA_THRESHOLD = 0.3  # 图片公式的置信度阈值
+
+
+class FormulaImageClassifier:
+    """Fused colour check and formula scoring for embedded images and crops.
+
+    The grayscale conversion, one inverted threshold (which gives both the
+    white ratio and the contour mask) and Canny all write into scratch
+    buffers that are reused across calls, so a batch of crops allocates
+    only once. Grayscale (2-D) inputs skip the channel comparison entirely.
+    Results match the original per-image ``_is_color_image``/``_is_formula``.
+    Instances are not thread-safe; use one per worker.
+    """
+
+    def __init__(self):
+        self._capacity = 0
+        self._gray = self._binary = self._edges = self._rolled = self._diff = None
+
+    def _reserve(self, pixels: int):
+        if pixels > self._capacity:
+            self._capacity = pixels
+            self._gray = np.empty(pixels, np.uint8)
+            self._binary = np.empty(pixels, np.uint8)
+            self._edges = np.empty(pixels, np.uint8)
+            self._rolled = np.empty(pixels * 3, np.uint8)
+            self._diff = np.empty(pixels * 3, np.uint8)
+
+    def _view(self, buffer: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        return buffer[:int(np.prod(shape))].reshape(shape)
+
+    def _grayscale(self, image: np.ndarray) -> np.ndarray:
+        if image.ndim == 2:
+            return image
+        if image.shape[2] == 1:
+            return image.reshape(image.shape[:2])
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self._view(self._gray, image.shape[:2]))
+
+    def is_color(self, image: np.ndarray) -> bool:
+        """True if any pair of channels differs by more than ``COLOR_THRESHOLD`` on average"""
+        if image.ndim == 2 or image.shape[2] == 1:
+            return False
+        shape = image.shape
+        self._reserve(shape[0] * shape[1])
+        # 把通道轮换为 (g, r, b) 后与原图做一次 absdiff，即得 |b-g|、|g-r|、|r-b| 三个差值
+        rolled = self._view(self._rolled, shape)
+        cv2.mixChannels([image], [rolled], [0, 2, 1, 0, 2, 1])
+        diff = cv2.absdiff(image, rolled, dst=self._view(self._diff, shape))
+        limit = COLOR_THRESHOLD * shape[0] * shape[1]
+        return any(total > limit for total in cv2.sumElems(diff)[:3])
+
+    def features(self, image: np.ndarray) -> Dict[str, float]:
+        shape = image.shape[:2]
+        self._reserve(shape[0] * shape[1])
+        gray = self._grayscale(image)
+        height, width = shape
+        pixels = gray.size
+
+        # 反向阈值：非零像素即非白色，白色像素数可直接由其补集得到
+        binary = self._view(self._binary, shape)
+        cv2.threshold(gray, WHITE_LEVEL, 255, cv2.THRESH_BINARY_INV, dst=binary)
+        white = pixels - cv2.countNonZero(binary)
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        edges = cv2.Canny(gray, 100, 200, edges=self._view(self._edges, shape))
+        return {"white_ratio": white / pixels, "aspect_ratio": height / width,
+                "contours": len(contours), "edge_ratio": cv2.countNonZero(edges) / pixels}
+
+    def classify(self, image: np.ndarray) -> Tuple[bool, float]:
+        """Return ``(is_formula, confidence)`` for an image"""
+        counts = self.features(image)
+        scores = (
+            min(counts["white_ratio"] * 1.0, 1.0),
+            1.0 - min(abs(counts["aspect_ratio"] - 1.0), 1.0),
+            min(counts["contours"] / 6, 1.0),
+            min(counts["edge_ratio"] * 4, 1.0),
+        )
+        confidence = sum(scores) / len(scores)
+        return confidence > FORMULA_THRESHOLD, confidence
+
+    def inspect(self, image: Optional[np.ndarray]) -> Tuple[bool, bool, float]:
+        """Return ``(is_color, is_formula, confidence)``; colour images are not scored"""
+        if self.is_color(image):
+            return True, False, 0.0
+        return (False,) + self.classify(image)
+
+    def inspect_batch(self, images: Sequence[np.ndarray]) -> List[Tuple[bool, bool, float]]:
+        """``inspect`` every image, sizing the scratch buffers once for the largest crop"""
+        if images:
+            self._reserve(max(image.shape[0] * image.shape[1] for image in images))
+        return [self.inspect(image) for image in images]
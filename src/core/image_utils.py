@@ -0,0 +1,137 @@
+# image_utils.py
+import hashlib
+import os
+import cv2
+import numpy as np
+
+
+def to_png_bytes(image) -> bytes:
+    """Return encoded image bytes for any supported recognition input.
+
+    Accepts a file path, already-encoded bytes, a numpy array (BGR or
+    grayscale, as produced by OpenCV) or a ``QImage``/``QPixmap``. In-memory
+    inputs are PNG-encoded straight into a buffer without touching the disk.
+    """
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as f:
+            return f.read()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    if isinstance(image, np.ndarray):
+        ok, buf = cv2.imencode(".png", image)
+        if not ok:
+            raise ValueError("Failed to encode image array as PNG")
+        return buf.tobytes()
+    if _is_qt_image(image):
+        return _qt_image_to_png(image)
+    raise TypeError(f"Unsupported image type: {type(image).__name__}")
+
+
+def image_mime_type(data: bytes) -> str:
+    """根据文件头判断图片的MIME类型"""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+def _is_qt_image(image) -> bool:
+    # Qt 为可选依赖，命令行模式下可能未安装
+    try:
+        from PyQt6.QtGui import QImage, QPixmap
+    except ImportError:
+        return False
+    return isinstance(image, (QImage, QPixmap))
+
+
+def _qt_image_to_png(image) -> bytes:
+    from PyQt6.QtCore import QBuffer, QByteArray, QIODevice
+
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    if not image.save(buffer, "PNG"):
+        raise ValueError("Failed to encode Qt image as PNG")
+    buffer.close()
+    return bytes(data)
+
+
+def preprocess_for_upload(data: bytes, max_pixels: int, binarize: bool = True,
+                          margin: int = 8):
+    """Shrink an encoded image before it is uploaded for recognition.
+
+    Trims uniform borders, converts to grayscale, optionally binarizes,
+    downscales to at most ``max_pixels`` and keeps the smallest of several
+    encodings. Returns ``(payload, stats)``; undecodable input is returned
+    unchanged.
+    """
+    stats = {"original_bytes": len(data), "payload_bytes": len(data), "encoding": "original"}
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None or gray.size == 0:
+        return data, stats
+
+    # 以边框像素的中位数作为背景色，兼容深色背景的截图
+    border = np.concatenate((gray[0], gray[-1], gray[:, 0], gray[:, -1]))
+    background = int(np.median(border))
+    ys, xs = np.nonzero(cv2.absdiff(gray, background) > 32)
+    if len(xs):
+        h, w = gray.shape
+        gray = gray[max(ys.min() - margin, 0):min(ys.max() + margin + 1, h),
+                    max(xs.min() - margin, 0):min(xs.max() + margin + 1, w)]
+
+    h, w = gray.shape
+    if h * w > max_pixels:
+        scale = (max_pixels / float(h * w)) ** 0.5
+        gray = cv2.resize(gray, (max(int(w * scale), 1), max(int(h * scale), 1)),
+                          interpolation=cv2.INTER_AREA)
+
+    candidates = []
+    if binarize:
+        flags = cv2.THRESH_BINARY | cv2.THRESH_OTSU
+        if background < 128:
+            flags = cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU  # 统一为白底黑字
+        _, bw = cv2.threshold(gray, 0, 255, flags)
+        candidates.append(("png-bilevel", ".png", bw, [cv2.IMWRITE_PNG_BILEVEL, 1]))
+    else:
+        candidates.append(("png", ".png", gray, [cv2.IMWRITE_PNG_COMPRESSION, 9]))
+        candidates.append(("jpeg", ".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, 90]))
+
+    best = (stats["encoding"], data)
+    for name, ext, img, params in candidates:
+        ok, buf = cv2.imencode(ext, img, params)
+        if ok and len(buf) < len(best[1]):
+            best = (name, buf.tobytes())
+
+    stats["encoding"], payload = best
+    stats["payload_bytes"] = len(payload)
+    return payload, stats
+
+
+class VisualDeduplicator:
+    """Recognize crops with identical content once.
+
+    Crops are keyed by a hash of the binarized full-resolution ink, trimmed
+    to its bounding box, so repeated formulas with different blank margins
+    share one result while any differing pixel (``x_1`` vs ``x_2``) does not.
+    """
+
+    def __init__(self, threshold: int = 128):
+        self.threshold = threshold
+        self._values = {}
+
+    def signature(self, image: np.ndarray):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        ink = gray < self.threshold
+        ys, xs = np.nonzero(ink)
+        if len(xs):
+            ink = ink[ys.min():ys.max() + 1, xs.min():xs.max() + 1]
+        # 形状参与键值，避免不同尺寸的位图打包后碰巧相同
+        return ink.shape, hashlib.sha1(np.packbits(ink).tobytes()).digest()
+
+    def get_or_add(self, image: np.ndarray, factory):
+        """Return the value stored for an identical crop, or store and return ``factory()``"""
+        key = self.signature(image)
+        if key not in self._values:
+            self._values[key] = factory()
+        return self._values[key]
@@ -1,32 +1,75 @@
 # latex_renderer.py
-import matplotlib.pyplot as plt
+import queue
+import re
+import threading
+import matplotlib
+import matplotlib.style
+import numpy as np
+import struct
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
+from matplotlib.mathtext import MathTextParser
 from io import BytesIO
 import logging
-from PyQt6.QtGui import QPixmap
-from PyQt6.QtCore import Qt
+import cv2
 import os
+from config.settings import Config
+from core.render_cache import RenderCache
 
 # 禁用字体警告
 logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
 
+# 全局 matplotlib 样式只在导入时设置一次：渲染线程读取 rcParams 时不会遇到并发修改
+matplotlib.style.use('default')
+matplotlib.rcParams['font.sans-serif'] = ['Arial']
+matplotlib.rcParams.update({
+    'font.family': 'serif',  # 使用系统自带字体
+    'mathtext.fontset': 'cm',  # 使用内置Computer Modern数学字体
+    'figure.dpi': 600,  # 提高基础DPI
+    'savefig.dpi': 600,
+    'figure.autolayout': False,
+    'axes.linewidth': 0.8,
+    'lines.linewidth': 1.2,
+    'mathtext.rm': 'serif',  # 明确配置数学字体
+    'mathtext.cal': 'serif',
+    'mathtext.it': 'serif:italic',
+    'mathtext.bf': 'serif:bold',
+    'svg.fonttype': 'path',  # SVG中的字形输出为路径，不依赖查看端字体
+})
+
+# mathtext 不支持的多行环境：(列对齐方式，循环使用), 左定界符, 右定界符, 是否按行间公式排版
+GRID_ENVIRONMENTS = {
+    "align": ("rl", "", "", True), "align*": ("rl", "", "", True), "aligned": ("rl", "", "", True),
+    "split": ("rl", "", "", True), "eqnarray": ("rcl", "", "", True), "eqnarray*": ("rcl", "", "", True),
+    "gather": ("c", "", "", True), "gather*": ("c", "", "", True), "gathered": ("c", "", "", True),
+    "cases": ("ll", r"\{", "", False),
+    "matrix": ("c", "", "", False), "pmatrix": ("c", "(", ")", False), "bmatrix": ("c", "[", "]", False),
+    "Bmatrix": ("c", r"\{", r"\}", False), "vmatrix": ("c", "|", "|", False),
+    "Vmatrix": ("c", r"\Vert", r"\Vert", False),
+}
+_GRID_PATTERN = re.compile(r"^(.*?)\\begin\{(\w+\*?)\}(.*)\\end\{\2\}(.*)$", re.DOTALL)
+_ROW_NOISE = re.compile(r"\\(?:nonumber|notag|hline)\b|\\label\{[^{}]*\}")
+
 
 class LatexRenderer:
-    def __init__(self):
-        plt.style.use('default')
-        plt.rcParams['font.sans-serif'] = ['Arial']
-        plt.rcParams.update({
-            'font.family': 'serif',  # 使用系统自带字体
-            'mathtext.fontset': 'cm',  # 使用内置Computer Modern数学字体
-            'figure.dpi': 600,  # 提高基础DPI
-            'savefig.dpi': 600,
-            'figure.autolayout': False,
-            'axes.linewidth': 0.8,
-            'lines.linewidth': 1.2,
-            'mathtext.rm': 'serif',  # 明确配置数学字体
-            'mathtext.cal': 'serif',
-            'mathtext.it': 'serif:italic',
-            'mathtext.bf': 'serif:bold',
-        })
+    # 校验和测量公式时只做排版不画图，进程内共享一个解析器
+    _validator = MathTextParser("path")
+    _rasterizer = MathTextParser("agg")
+    # matplotlib 的字体缓存和 mathtext 解析器不是线程安全的，排版和绘制串行执行
+    _mathtext_lock = threading.Lock()
+    # 可复用的 Figure/画布，避免每次渲染重新创建
+    _figure_pool = queue.LifoQueue(maxsize=Config.RENDER_FIGURE_POOL_SIZE)
+    # 多行环境的行距和定界符间距（em）
+    GRID_ROW_GAP = 0.3
+    GRID_DELIMITER_GAP = 0.2
+
+    def __init__(self, cache=None):
+        # 同一公式在预览和多格式导出中只渲染一次
+        if cache is None and Config.RENDER_CACHE_MAX_BYTES > 0:
+            cache = RenderCache.get_instance()
+        self.cache = cache
         self._precache_fonts()
 
     def _precache_fonts(self):
@@ -36,61 +79,432 @@ class LatexRenderer:
             r'$\sum_{n=1}^{\infty} \frac{1}{n^2}$',
             r'$\mathcal{F}(\omega)$'
         ]
-        fig = plt.figure()
-        for formula in test_formulas:
-            fig.text(0.5, 0.5, formula, ha='center', va='center')
-        plt.close(fig)
+        with self._mathtext_lock:
+            for formula in test_formulas:
+                self._measure(formula, 36)
 
     def render_to_qpixmap(self, code):
+        # Qt 只在界面预览中需要，渲染进程和命令行导出不加载 PyQt6
+        from PyQt6.QtGui import QPixmap
+        from PyQt6.QtCore import Qt
         try:
-            # 清理代码中的非法命令
-            clean_code = self._clean_latex(code)
-
-            # 创建高分辨率画布
-            fig = plt.figure(
-                figsize=(8, 2),  # 优化画布比例
-                dpi=600,  # 最终渲染DPI
-                facecolor='none',  # 透明背景
-                edgecolor='none'
-            )
-            ax = fig.add_axes([0, 0, 1, 1])
-            ax.axis("off")
-
-            # 处理公式环境
-            display_code = self._wrap_environment(code)
-
-            # 渲染文本
-            text = ax.text(
-                0.5, 0.5,
-                display_code,
-                fontsize=36,  # 适当增大字号
-                ha='center',
-                va='center',
-            )
-
-            # 保存为高分辨率图像
-            buf = BytesIO()
-            plt.savefig(
-                buf,
-                format='png',
-                bbox_inches='tight',
-                pad_inches=0.1,  # 减少边距
-                transparent=True,
-                dpi=600,  # 保存DPI与画布一致
-            )
-            plt.close(fig)
-
-            # 转换为QPixmap并保持高质量缩放
-            pixmap = QPixmap()
-            pixmap.loadFromData(buf.getvalue())
-            return pixmap.scaled(
-                1600, 400,
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation  # 高质量缩放算法
-            )
+            return QPixmap.fromImage(self.render_to_qimage(code))
+        except ValueError:
+            # 不是合法的 mathtext（例如纯文本），走完整的图形渲染再缩放
+            try:
+                pixmap = QPixmap()
+                pixmap.loadFromData(self.render_png(code))
+                return pixmap.scaled(
+                    1600, 400,
+                    Qt.AspectRatioMode.KeepAspectRatio,
+                    Qt.TransformationMode.SmoothTransformation  # 高质量缩放算法
+                )
+            except Exception as e:
+                logging.error(f"Render Error: {str(e)}", exc_info=True)
         except Exception as e:
             logging.error(f"Render Error: {str(e)}", exc_info=True)
-            return QPixmap()
+        return QPixmap()
+
+    def render_to_qimage(self, code, max_width=1600, max_height=400, fontsize=36):
+        """Wrap the RGBA buffer from ``render_rgba`` in a QImage without copying it"""
+        from PyQt6.QtGui import QImage
+        rgba = self.render_rgba(code, max_width, max_height, fontsize)
+        height, width = rgba.shape[:2]
+        image = QImage(rgba.data, width, height, rgba.strides[0], QImage.Format.Format_RGBA8888)
+        image._buffer = rgba  # QImage 不拥有这块内存，必须保持 numpy 数组存活
+        return image
+
+    def render_rgba(self, code, max_width=1600, max_height=400, fontsize=36):
+        """Rasterize mathtext straight to an RGBA array that fits ``max_width`` x ``max_height``.
+
+        The DPI is chosen from the mathtext layout so the formula is drawn
+        directly at its final size; there is no PNG round trip and no rescale.
+        Raises ValueError if the code is not valid mathtext.
+        """
+        if self.cache is None:
+            alpha = self._render_alpha(code, max_width, max_height, fontsize)
+        else:
+            key = RenderCache.make_key(code, kind="alpha", max_width=max_width,
+                                       max_height=max_height, fontsize=fontsize)
+            data = self.cache.get(key)
+            if data is None:
+                alpha = self._render_alpha(code, max_width, max_height, fontsize)
+                self.cache.put(key, struct.pack("<II", *alpha.shape) + alpha.tobytes())
+            else:
+                shape = struct.unpack_from("<II", data)
+                alpha = np.frombuffer(data, np.uint8, offset=8).reshape(shape)
+
+        # 文字颜色取 rcParams，透明度即 mathtext 的灰度掩码
+        red, green, blue, _ = (int(round(c * 255)) for c in to_rgba(matplotlib.rcParams['text.color']))
+        rgba = np.empty(alpha.shape + (4,), np.uint8)
+        rgba[..., 0], rgba[..., 1], rgba[..., 2] = red, green, blue
+        rgba[..., 3] = alpha
+        return rgba
+
+    def render_export_png(self, code, max_width=1600, max_height=400, fontsize=36):
+        """PNG bytes sized like the preview pixmap, used by the exporters without Qt"""
+        try:
+            rgba = self.render_rgba(code, max_width, max_height, fontsize)
+        except ValueError:
+            # 不是合法的 mathtext（例如纯文本），与预览一致：完整渲染后等比缩放
+            rgba = cv2.cvtColor(cv2.imdecode(np.frombuffer(self.render_png(code, fontsize), np.uint8),
+                                             cv2.IMREAD_UNCHANGED), cv2.COLOR_BGRA2RGBA)
+            height, width = rgba.shape[:2]
+            scale = min(max_width / width, max_height / height)
+            rgba = cv2.resize(rgba, (max(int(width * scale), 1), max(int(height * scale), 1)),
+                              interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+        ok, encoded = cv2.imencode(".png", cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA))
+        if not ok:
+            raise RuntimeError("Failed to encode formula image")
+        return encoded.tobytes()
+
+    def _render_alpha(self, code, max_width, max_height, fontsize):
+        grid = self._split_grid(code)
+        if grid is not None:
+            return self._render_grid_alpha(*grid, max_width, max_height, fontsize)
+        display_code = self._wrap_environment(code)
+        pad = 0.1 * 72  # 四周留白（点）
+        prop = FontProperties(size=fontsize)
+        with self._mathtext_lock:
+            width, height, depth = self._measure(display_code, fontsize)
+            dpi = 72 * min(max_width / (width + 2 * pad), max_height / (height + 2 * pad))
+            mask = self._rasterizer.parse(display_code, dpi=dpi, prop=prop).image
+
+        mask_height, mask_width = mask.shape
+        pad_px = int(round(pad * dpi / 72))
+        # 栅格结果可能比排版尺寸多出一两像素，缩小留白以保证不超出目标尺寸
+        pad_x = max(0, min(pad_px, (max_width - mask_width) // 2))
+        pad_y = max(0, min(pad_px, (max_height - mask_height) // 2))
+        alpha = np.zeros((mask_height + 2 * pad_y, mask_width + 2 * pad_x), np.uint8)
+        alpha[pad_y:pad_y + mask_height, pad_x:pad_x + mask_width] = mask
+        return alpha
+
+    @classmethod
+    def _split_grid(cls, code):
+        """Return ``(environment, rows of cells, prefix, suffix)`` for a multi-row environment, else None.
+
+        ``prefix`` and ``suffix`` are the inline math around the environment,
+        e.g. ``|x| =`` in ``|x| = \\begin{cases}...\\end{cases}``.
+        """
+        code = code.strip()
+        for prefix, suffix in (("$$", "$$"), ("\\[", "\\]"), ("$", "$")):
+            if code.startswith(prefix) and code.endswith(suffix) and len(code) > len(prefix) + len(suffix):
+                code = code[len(prefix):-len(suffix)].strip()
+                break
+        match = _GRID_PATTERN.match(code)
+        if match is None or match.group(2) not in GRID_ENVIRONMENTS:
+            return None
+        prefix, environment, body, suffix = match.groups()
+        display = GRID_ENVIRONMENTS[environment][3]
+        rows = []
+        for row in cls._split_top_level(body, "\\\\"):
+            row = _ROW_NOISE.sub("", row)
+            row = re.sub(r"^\s*\[[^\]]*\]", "", row)  # 去掉 \\[2pt] 这类行距参数
+            if display:
+                row = re.sub(r"\\frac\b", r"\\dfrac", row)  # mathtext 没有 \displaystyle
+            if row.strip():
+                rows.append([cell.strip() for cell in cls._split_top_level(row, "&")])
+        return (environment, rows, prefix.strip(), suffix.strip()) if rows else None
+
+    @staticmethod
+    def _split_top_level(text, separator):
+        """Split on ``separator`` outside braces and nested environments"""
+        parts, depth, start, idx = [], 0, 0, 0
+        while idx < len(text):
+            if text.startswith("\\begin{", idx):
+                depth += 1
+            elif text.startswith("\\end{", idx):
+                depth -= 1
+            elif text[idx] == "{":
+                depth += 1
+            elif text[idx] == "}":
+                depth -= 1
+            elif depth == 0 and text.startswith(separator, idx):
+                parts.append(text[start:idx])
+                idx += len(separator)
+                start = idx
+                continue
+            elif text[idx] == "\\":
+                idx += 1  # 跳过转义字符，例如 \{ 和 \&
+            idx += 1
+        parts.append(text[start:])
+        return parts
+
+    def _render_grid_alpha(self, environment, rows, prefix, suffix, max_width, max_height, fontsize):
+        """Composite a multi-row environment from independently cached cell fragments.
+
+        The DPI that fits ``max_width`` x ``max_height`` is chosen from the
+        cells' layout metrics, then each cell is rasterized at that DPI and
+        cached on its own. Editing one row re-renders only that row's cells,
+        and the rest is compositing of small images.
+        """
+        aligns, left, right, _ = GRID_ENVIRONMENTS[environment]
+        dpi = self._grid_dpi(aligns, rows, prefix, suffix, bool(left), bool(right),
+                             max_width, max_height, fontsize)
+        em = fontsize * dpi / 72
+        cells = [[self._fragment(cell, fontsize, dpi) for cell in row] for row in rows]
+        col_x, col_widths, row_metrics, width, height = self._grid_layout(
+            aligns, [[(alpha.shape[1], ascent, alpha.shape[0] - ascent) for alpha, ascent in row] for row in cells], em)
+
+        block = np.zeros((max(int(height), 1), max(int(width), 1)), np.uint8)
+        y = 0
+        for row, (ascent, descent) in zip(cells, row_metrics):
+            for col, (alpha, cell_ascent) in enumerate(row):
+                if alpha.size == 0:
+                    continue
+                align = aligns[col % len(aligns)]
+                x = int(col_x[col]) + {"l": 0, "c": (col_widths[col] - alpha.shape[1]) // 2,
+                                       "r": col_widths[col] - alpha.shape[1]}[align]
+                top = int(y + ascent - cell_ascent)  # 同一行的单元格按基线对齐
+                region = block[top:top + alpha.shape[0], x:x + alpha.shape[1]]
+                np.maximum(region, alpha[:region.shape[0], :region.shape[1]], out=region)
+            y += ascent + descent + int(self.GRID_ROW_GAP * em)
+
+        # 定界符、前后的行内公式与整块按数学轴（约 0.25em）垂直居中拼接
+        axis = 0.25 * em
+        gap = np.zeros((1, int(self.GRID_DELIMITER_GAP * em)), np.uint8)
+        items = []
+        if prefix:
+            fragment, ascent = self._fragment(prefix, fontsize, dpi)
+            items += [(fragment, ascent - axis), (gap, 0)]
+        if left:
+            items += [(self._delimiter(left, fontsize, dpi, block.shape[0]), block.shape[0] / 2), (gap, 0)]
+        items.append((block, block.shape[0] / 2))
+        if right:
+            items += [(gap, 0), (self._delimiter(right, fontsize, dpi, block.shape[0]), block.shape[0] / 2)]
+        if suffix:
+            fragment, ascent = self._fragment(suffix, fontsize, dpi)
+            items += [(gap, 0), (fragment, ascent - axis)]
+        alpha = self._join_on_axis(items)
+
+        # 与单行公式相同的四周留白；排版估算偏小时再整体缩小，保证不超出目标尺寸
+        pad = int(round(0.1 * dpi))
+        alpha = cv2.copyMakeBorder(alpha, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=0)
+        scale = min(max_width / alpha.shape[1], max_height / alpha.shape[0])
+        if scale < 1.0:
+            size = (max(int(alpha.shape[1] * scale), 1), max(int(alpha.shape[0] * scale), 1))
+            alpha = cv2.resize(alpha, size, interpolation=cv2.INTER_AREA)
+        return alpha
+
+    @classmethod
+    def _grid_layout(cls, aligns, sizes, em):
+        """Column positions and row metrics for cells given as ``(width, ascent, descent)``"""
+        columns = max(len(row) for row in sizes)
+        col_widths = [max((row[col][0] for row in sizes if col < len(row)), default=0) for col in range(columns)]
+        # 对齐环境中每对 rl 列之间留 2em，其余列之间留 1em
+        gaps = [0 if aligns == "rl" and col % 2 == 0 else (2 * em if aligns == "rl" else em)
+                for col in range(columns - 1)]
+        col_x = [0]
+        for col in range(columns - 1):
+            col_x.append(col_x[-1] + col_widths[col] + int(gaps[col]))
+        width = col_x[-1] + col_widths[-1]
+        row_metrics = [(max(cell[1] for cell in row), max(max(cell[2] for cell in row), 0)) for row in sizes]
+        height = sum(a + d for a, d in row_metrics) + int(cls.GRID_ROW_GAP * em) * (len(sizes) - 1)
+        return col_x, col_widths, row_metrics, width, height
+
+    def _grid_dpi(self, aligns, rows, prefix, suffix, left, right, max_width, max_height, fontsize):
+        """DPI at which the composite fits the target box, estimated from layout metrics in points"""
+        sizes = [[self._cell_metrics(cell, fontsize) for cell in row] for row in rows]
+        _, _, _, width, height = self._grid_layout(aligns, sizes, fontsize)
+        delimiter_width = 0.5 * fontsize + self.GRID_DELIMITER_GAP * fontsize
+        width += delimiter_width * (left + right)
+        for part in (prefix, suffix):
+            if part:
+                part_width, part_ascent, part_descent = self._cell_metrics(part, fontsize)
+                width += part_width + self.GRID_DELIMITER_GAP * fontsize
+                height = max(height, part_ascent + part_descent)
+        pad = 0.1 * 72
+        dpi = 72 * min(max_width / (width + 2 * pad), max_height / (height + 2 * pad))
+        # 取整到 4 的倍数：小幅修改不改变分辨率，其余行的缓存片段仍可复用
+        return max(4, int(min(dpi, Config.RENDER_FRAGMENT_DPI)) // 4 * 4)
+
+    def _cell_metrics(self, cell, fontsize):
+        """Return ``(width, ascent, descent)`` of a cell in points"""
+        if not cell:
+            return 0, 0, 0
+        key = RenderCache.make_key(cell, kind="metrics", fontsize=fontsize)
+        data = self.cache.get(key) if self.cache is not None else None
+        if data is not None:
+            return struct.unpack("<ddd", data)
+        with self._mathtext_lock:
+            width, height, depth = self._measure(f"${cell}$", fontsize)
+        metrics = (width, height - depth, depth)
+        if self.cache is not None:
+            self.cache.put(key, struct.pack("<ddd", *metrics))
+        return metrics
+
+    @staticmethod
+    def _join_on_axis(items):
+        """Place ``(alpha, axis_from_top)`` pieces side by side with their axes on one line"""
+        above = max(int(round(axis)) for alpha, axis in items if alpha.size)
+        below = max(alpha.shape[0] - int(round(axis)) for alpha, axis in items if alpha.size)
+        joined = np.zeros((above + below, sum(alpha.shape[1] for alpha, _ in items)), np.uint8)
+        x = 0
+        for alpha, axis in items:
+            if alpha.shape[0] > 1:
+                top = above - int(round(axis))
+                joined[top:top + alpha.shape[0], x:x + alpha.shape[1]] = alpha
+            x += alpha.shape[1]
+        return joined
+
+    def _fragment(self, cell, fontsize, dpi):
+        """Return ``(alpha, ascent)`` for one cell, rendering only on a cache miss"""
+        if not cell:
+            return np.zeros((0, 0), np.uint8), 0
+        key = RenderCache.make_key(cell, kind="fragment", fontsize=fontsize, dpi=dpi)
+        data = self.cache.get(key) if self.cache is not None else None
+        if data is not None:
+            height, width, ascent = struct.unpack_from("<III", data)
+            return np.frombuffer(data, np.uint8, offset=12).reshape(height, width), ascent
+
+        with self._mathtext_lock:
+            parsed = self._rasterizer.parse(f"${cell}$", dpi=dpi, prop=FontProperties(size=fontsize))
+        alpha = np.ascontiguousarray(parsed.image, np.uint8)
+        ascent = max(0, min(alpha.shape[0], int(round(parsed.height - parsed.depth))))
+        if self.cache is not None:
+            self.cache.put(key, struct.pack("<III", alpha.shape[0], alpha.shape[1], ascent) + alpha.tobytes())
+        return alpha, ascent
+
+    def _delimiter(self, delimiter, fontsize, dpi, height):
+        """Stretch a delimiter glyph to ``height`` pixels"""
+        alpha, _ = self._fragment(delimiter, fontsize, dpi)
+        rows = np.flatnonzero(alpha.max(axis=1))
+        cols = np.flatnonzero(alpha.max(axis=0))
+        glyph = alpha[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        # 纵向拉伸到整块高度，横向略微加宽以保持笔画比例
+        stretch = height / glyph.shape[0]
+        width = max(int(round(glyph.shape[1] * max(1.0, stretch) ** 0.3)), 1)
+        return cv2.resize(glyph, (width, max(height, 1)), interpolation=cv2.INTER_CUBIC)
+
+    def render_png(self, code, fontsize=36, dpi=600):
+        """Return the formula as PNG bytes, rendering only on a cache miss"""
+        if self.cache is None:
+            return self._render_figure(code, fontsize, dpi, "png")
+        key = RenderCache.make_key(code, fontsize=fontsize, dpi=dpi)
+        return self.cache.get_or_render(key, lambda: self._render_figure(code, fontsize, dpi, "png"))
+
+    def render_svg(self, code, fontsize=36):
+        """Return the formula as an SVG document whose glyphs are vector paths"""
+        return self._render_vector(code, fontsize, "svg")
+
+    def render_pdf(self, code, fontsize=36):
+        """Return the formula as a single-page vector PDF sized to the formula"""
+        return self._render_vector(code, fontsize, "pdf")
+
+    def _render_vector(self, code, fontsize, fmt):
+        render = self._render_figure if self._split_grid(code) is None else self._render_grid_document
+        if self.cache is None:
+            return render(code, fontsize, 72, fmt)
+        key = RenderCache.make_key(code, kind=fmt, fontsize=fontsize)
+        return self.cache.get_or_render(key, lambda: render(code, fontsize, 72, fmt))
+
+    def _render_grid_document(self, code, fontsize, dpi, fmt):
+        """SVG/PDF for a multi-row environment: its raster composite wrapped at natural size"""
+        import base64
+        import fitz
+
+        environment, rows, prefix, suffix = self._split_grid(code)
+        aligns, left, right, _ = GRID_ENVIRONMENTS[environment]
+        raster_dpi = self._grid_dpi(aligns, rows, prefix, suffix, bool(left), bool(right), 1600, 400, fontsize)
+        png = self.render_export_png(code)
+        width, height = struct.unpack(">II", png[16:24])  # PNG IHDR 中的尺寸
+        width_pt, height_pt = width * 72 / raster_dpi, height * 72 / raster_dpi
+        if fmt == "svg":
+            return (f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                    f'width="{width_pt:.1f}pt" height="{height_pt:.1f}pt" viewBox="0 0 {width} {height}">'
+                    f'<image width="{width}" height="{height}" '
+                    f'xlink:href="data:image/png;base64,{base64.b64encode(png).decode("ascii")}"/></svg>\n'
+                    ).encode("utf-8")
+        doc = fitz.open()
+        try:
+            page = doc.new_page(width=width_pt, height=height_pt)
+            page.insert_image(page.rect, stream=png)
+            return doc.tobytes(garbage=3, deflate=True)
+        finally:
+            doc.close()
+
+    def _render_figure(self, code, fontsize, dpi, fmt):
+        # 处理公式环境
+        display_code = self._wrap_environment(code)
+        pad = 0.1 * 72  # 四周留白（点），与原先 pad_inches=0.1 一致
+        # 矢量格式不写入生成时间，同一公式的输出字节保持一致
+        metadata = {"svg": {"Date": None}, "pdf": {"CreationDate": None}}.get(fmt)
+
+        fig, canvas, text = self._acquire_figure()
+        try:
+            with self._mathtext_lock:
+                try:
+                    # 直接用 mathtext 排版得到尺寸，只需绘制一次
+                    width, height, depth = self._measure(display_code, fontsize)
+                except ValueError:
+                    width = None
+                fig.set_dpi(dpi)
+                text.set_text(display_code)
+                text.set_fontsize(fontsize)
+                buf = BytesIO()
+                if width is None:
+                    # 不是合法的 mathtext（例如纯文本），退回按实际墨迹裁剪
+                    fig.set_size_inches(8, 2)
+                    text.set_position((0.5, 0.5))
+                    text.set_verticalalignment('center')
+                    text.set_horizontalalignment('center')
+                    fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight',
+                                pad_inches=0.1, transparent=True, metadata=metadata)
+                else:
+                    fig_width, fig_height = width + 2 * pad, height + 2 * pad
+                    fig.set_size_inches(fig_width / 72, fig_height / 72)
+                    text.set_position((pad / fig_width, (pad + depth) / fig_height))
+                    text.set_verticalalignment('baseline')
+                    text.set_horizontalalignment('left')
+                    if fmt == "png":
+                        canvas.print_png(buf)
+                    else:
+                        # savefig 临时切换到 SVG/PDF 后端，绘制完成后画布仍是 Agg
+                        fig.savefig(buf, format=fmt, dpi=dpi, transparent=True, metadata=metadata)
+            return buf.getvalue()
+        finally:
+            self._release_figure((fig, canvas, text))
+
+    @classmethod
+    def _measure(cls, display_code, fontsize):
+        """Return ``(width, height, depth)`` in points without drawing"""
+        layout = cls._validator.parse(display_code, dpi=72, prop=FontProperties(size=fontsize))
+        return layout.width, layout.height, layout.depth
+
+    @classmethod
+    def _acquire_figure(cls):
+        try:
+            return cls._figure_pool.get_nowait()
+        except queue.Empty:
+            # 不经过 pyplot：Figure + Agg 画布，不注册到全局的图形管理器
+            fig = Figure(facecolor='none', edgecolor='none')
+            canvas = FigureCanvasAgg(fig)
+            text = fig.text(0, 0, "")
+            return fig, canvas, text
+
+    @classmethod
+    def _release_figure(cls, entry):
+        try:
+            cls._figure_pool.put_nowait(entry)
+        except queue.Full:
+            pass
+
+    @classmethod
+    def validate(cls, code):
+        """Return True if mathtext can parse and lay out the formula"""
+        if not code or not code.strip():
+            return False
+        grid = cls._split_grid(cls._clean_latex(code))
+        if grid is not None:
+            # 多行环境按单元格分别排版，所有单元格都能排版即可渲染
+            environment, rows, prefix, suffix = grid
+            return all(cls.validate(part) for part in [prefix, suffix] + [cell for row in rows for cell in row] if part)
+        try:
+            with cls._mathtext_lock:
+                cls._validator.parse(cls._wrap_environment(cls._clean_latex(code)), dpi=72)
+            return True
+        except Exception:
+            return False
 
     def _wrap_environment(self, code):
         """自动添加合适的数学环境"""
@@ -0,0 +1,289 @@
+# layout_detector.py
+import re
+import statistics
+from typing import Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from config.settings import Config
+
+# TeX/AMS 以及常见 OpenType 数学字体（去掉子集前缀 "ABCDEF+" 后匹配前缀）
+MATH_FONT_PREFIXES = ("CMMI", "CMSY", "CMEX", "CMBSY", "MSAM", "MSBM", "EUFM", "EURM", "EUSM",
+                      "RSFS", "MTMI", "MTSY", "TXMI", "TXSY", "TXEX", "PXMI", "PXSY", "PXEX",
+                      "ESINT", "STMARY", "SYMBOL", "LMMATH")
+MATH_SYMBOLS = frozenset("+=<>*/^_|∑∫∏√∞±×÷≠≤≥≈≡∝∈∉⊂⊃⊆⊇∪∩∂∇∀∃→←↔⇒⇐⇔−·∘′"
+                         "αβγδεζηθικλμνξοπρστυφχψωΓΔΘΛΞΠΣΥΦΨΩϵϑϕϱς")
+# 公式中常见的正文字体片段：数字、括号、运算符、函数名
+GLUE_PATTERN = re.compile(r"^(?:[\s\d.,;:()\[\]{}|+\-=<>/*'!]+|\s*(?:sin|cos|tan|log|ln|exp|lim|max|min|det|sup|inf)\s*)$")
+EDGE_PUNCTUATION = frozenset(" ,.;:")
+UNKNOWN_SCRIPT = "?"  # 文本中方向未知的上下标写作 ?{...}，文本层捷径遇到时放弃
+
+MATH, GLUE, TEXT = 0, 1, 2
+SUPERSCRIPT_FLAG = 1  # PyMuPDF span flags 的上标位
+ITALIC_FLAG = 2
+
+
+# 等宽字体中的内容是代码（x << 1、() -> a），不是公式
+CODE_FONT_PREFIXES = ("CMTT", "SFTT", "TXTT", "PCR", "LMMONO", "COURIER", "INCONSOLATA", "BERAMONO",
+                      "NIMBUSMON", "CONSOLAS", "MENLO")
+BRACKET_PAIRS = {")": "(", "]": "[", "}": "{", "⟩": "⟨"}
+OPENING_BRACKETS = {open_: close for close, open_ in BRACKET_PAIRS.items()}
+
+
+def is_math_font(name: str) -> bool:
+    name = name.split("+", 1)[-1].upper().replace(" ", "")
+    return name.startswith(MATH_FONT_PREFIXES) or "MATH" in name
+
+
+def is_italic(span: Dict) -> bool:
+    name = span["font"].upper()
+    return bool(span["flags"] & ITALIC_FLAG) or "ITALIC" in name or "OBLIQUE" in name
+
+
+def is_code_font(name: str) -> bool:
+    name = name.split("+", 1)[-1].upper().replace(" ", "")
+    return name.startswith(CODE_FONT_PREFIXES) or "MONO" in name
+
+
+def brackets_balanced(text: str) -> bool:
+    stack = []
+    for char in text:
+        if char in OPENING_BRACKETS:
+            stack.append(char)
+        elif char in BRACKET_PAIRS:
+            if not stack or stack.pop() != BRACKET_PAIRS[char]:
+                return False
+    return not stack
+
+
+class LayoutFormulaDetector:
+    """Find inline and display formulas from PyMuPDF ``rawdict`` spans.
+
+    Spans are labelled by font (TeX/OpenType math fonts), baseline shift
+    (sub/superscripts) and math-symbol density. Runs of math spans inside a
+    line become inline formulas, lines that are almost entirely math become
+    display formulas, and touching regions (stacked fractions, detached
+    scripts, multi-line displays) are merged. Script shifts are measured from
+    the baseline of the line's body-size text; monospace (code) spans are
+    never math and regions with unbalanced brackets are dropped. Each
+    region's bbox is the union of its glyph boxes. Returns the same
+    ``(text, bbox, confidence)`` candidates as the block-level regex check.
+    """
+
+    def __init__(self, min_confidence: Optional[float] = None, min_chars: Optional[int] = None):
+        self.min_confidence = Config.PDF_LAYOUT_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.min_chars = Config.PDF_LAYOUT_MIN_CHARS if min_chars is None else min_chars
+
+    def detect(self, page: fitz.Page) -> List[Tuple[str, Tuple[float, float, float, float], float]]:
+        lines = [line for block in page.get_text("rawdict")["blocks"] if block["type"] == 0
+                 for line in block["lines"] if line["spans"]]
+        sizes = [span["size"] for line in lines for span in line["spans"] for _ in span["chars"]]
+        if not sizes:
+            return []
+        body_size = statistics.median(sizes)
+
+        regions = []
+        for line in lines:
+            regions.extend(self._line_regions(line, body_size))
+        regions = self._merge(regions, pad=0.25 * body_size)
+
+        candidates = []
+        for region in regions:
+            confidence = self._confidence(region)
+            # 未能与其他公式合并的孤立小字号行（图注、脚注标号）不是上下标
+            # 括号不配对说明区域截断在公式中间，外框和文本都不可信
+            if confidence >= self.min_confidence and region["chars"] >= self.min_chars \
+                    and not region["detached"] and brackets_balanced(region["text"]):
+                candidates.append((region["text"].strip(), tuple(region["bbox"]), confidence))
+        candidates.sort(key=lambda c: (round(c[1][1]), c[1][0]))  # 按阅读顺序输出
+        return candidates
+
+    def _line_regions(self, line: Dict, body_size: float) -> List[Dict]:
+        spans = line["spans"]
+        base_y, base_size = self._main_baseline(spans, body_size)
+        small_line = max(s["size"] for s in spans) < 0.85 * body_size
+
+        labelled = []
+        for span in spans:
+            text = "".join(ch["c"] for ch in span["chars"])
+            visible = len(text) - text.count(" ")
+            if not visible:
+                labelled.append((span, text, GLUE, ""))
+                continue
+            # script 记录上下标方向："^" 上标、"_" 下标、"*" 方向未知（单独成行的小字号片段）
+            # 上下标必须比主行字号小；MuPDF 的上标标志对主行上的正常字号字形也会误报
+            shift = span["origin"][1] - base_y
+            reduced = span["size"] < 0.9 * base_size
+            if reduced and shift > 0.1 * base_size:
+                script = "_"
+            elif reduced and (span["flags"] & SUPERSCRIPT_FLAG or shift < -0.1 * base_size):
+                script = "^"
+            elif small_line and visible <= 6:
+                script = "*"  # 单独成行的小字号片段通常是被拆开的上下标
+            else:
+                script = ""
+            symbols = sum(1 for c in text if c in MATH_SYMBOLS)
+            if is_code_font(span["font"]):
+                kind = TEXT
+            elif is_math_font(span["font"]) or script or (symbols and symbols / visible >= 0.25):
+                kind = MATH
+            elif visible <= 6 and GLUE_PATTERN.match(text):
+                kind = GLUE
+            elif visible <= 2 and text.strip().isalpha() and is_italic(span):
+                kind = GLUE  # 非数学字体排版的斜体变量（matplotlib 等生成的 PDF）
+            else:
+                kind = TEXT
+            labelled.append((span, text, kind, script))
+
+        line_chars = sum(len(text) - text.count(" ") for _, text, _, _ in labelled)
+        math_chars = sum(len(text) - text.count(" ") for _, text, kind, _ in labelled if kind != TEXT)
+        if any(kind == MATH for _, _, kind, _ in labelled) and math_chars >= 0.8 * line_chars:
+            # 整行几乎都是数学内容：行间公式
+            region = self._region(labelled, display=True)
+            region["detached"] = small_line
+            return [region]
+
+        regions, run = [], []
+        for entry in labelled + [(None, "", TEXT, "")]:
+            if entry[2] != TEXT:
+                run.append(entry)
+                continue
+            if any(kind == MATH for _, _, kind, _ in run):
+                regions.append(self._region(run, display=False))
+            run = []
+        return regions
+
+    @staticmethod
+    def _main_baseline(spans: List[Dict], body_size: float) -> Tuple[float, float]:
+        """Return ``(baseline_y, size)`` of the line's main text.
+
+        Among the visible spans set in the body font size (or, failing that,
+        the line's largest size) the baseline covering the most width wins.
+        """
+        visible = [span for span in spans if any(not ch["c"].isspace() for ch in span["chars"])]
+        if not visible:
+            return spans[0]["origin"][1], spans[0]["size"]
+        main = [span for span in visible if abs(span["size"] - body_size) <= 0.1 * body_size]
+        if not main:
+            largest = max(span["size"] for span in visible)
+            main = [span for span in visible if span["size"] >= 0.9 * largest]
+        widths = {}
+        for span in main:
+            key = round(span["origin"][1], 1)
+            widths[key] = widths.get(key, 0.0) + span["bbox"][2] - span["bbox"][0]
+        base_y = max(widths, key=widths.get)
+        widest = max((span for span in main if round(span["origin"][1], 1) == base_y),
+                     key=lambda span: span["bbox"][2] - span["bbox"][0])
+        return base_y, widest["size"]
+
+    @staticmethod
+    def _region(run, display: bool) -> Dict:
+        x0 = y0 = float("inf")
+        x1 = y1 = float("-inf")
+        chars = math_font_chars = symbols = 0
+        script = False
+        for span, _, kind, marker in run:
+            script = script or bool(marker)
+            glyphs = [ch for ch in span["chars"] if not ch["c"].isspace()]
+            chars += len(glyphs)
+            if kind == MATH and is_math_font(span["font"]):
+                math_font_chars += len(glyphs)
+            symbols += sum(1 for ch in glyphs if ch["c"] in MATH_SYMBOLS)
+        # 去掉首尾的空白和标点，让外框紧贴公式本身
+        glyphs = [(ch, marker) for span, _, _, marker in run for ch in span["chars"]]
+        start, stop = 0, len(glyphs)
+        while start < stop and glyphs[start][0]["c"] in EDGE_PUNCTUATION:
+            start += 1
+        while stop > start and glyphs[stop - 1][0]["c"] in EDGE_PUNCTUATION:
+            stop -= 1
+        # 区域边缘多出来的括号属于周围的正文，例如 class(K′) 中的右括号
+        inner = "".join(ch["c"] for ch, _ in glyphs[start:stop])
+        while stop > start and glyphs[stop - 1][0]["c"] in BRACKET_PAIRS:
+            close = glyphs[stop - 1][0]["c"]
+            if inner.count(close) <= inner.count(BRACKET_PAIRS[close]):
+                break
+            stop, inner = stop - 1, inner[:-1]
+        while start < stop and glyphs[start][0]["c"] in OPENING_BRACKETS:
+            open_ = glyphs[start][0]["c"]
+            if inner.count(open_) <= inner.count(OPENING_BRACKETS[open_]):
+                break
+            start, inner = start + 1, inner[1:]
+
+        # 文本层保留上下标结构（x^{2}、a_{i}），供识别时的文本层捷径使用
+        text, open_marker = [], ""
+        for ch, marker in glyphs[start:stop]:
+            marker = UNKNOWN_SCRIPT if marker == "*" else marker
+            if marker != open_marker:
+                if open_marker:
+                    text.append("}")
+                if marker:
+                    text.append(marker + "{")
+                open_marker = marker
+            text.append(ch["c"])
+            bx0, by0, bx1, by1 = ch["bbox"]
+            if bx1 > bx0 and by1 > by0:
+                x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+        if open_marker:
+            text.append("}")
+        return {"text": "".join(text), "bbox": [x0, y0, x1, y1],
+                "chars": chars, "math_font_chars": math_font_chars, "symbols": symbols,
+                "script": script, "display": display, "detached": False}
+
+    @staticmethod
+    def _merge(regions: List[Dict], pad: float) -> List[Dict]:
+        regions = [r for r in regions if r["bbox"][0] < r["bbox"][2]]
+        merged = True
+        while merged:
+            merged = False
+            regions.sort(key=lambda r: (r["bbox"][1], r["bbox"][0]))
+            result = []
+            for region in regions:
+                for other in result:
+                    relation = LayoutFormulaDetector._touching(region, other, pad)
+                    if relation:
+                        a, b = region["bbox"], other["bbox"]
+                        if relation == "stacked":
+                            # 上下堆叠（分式、多行公式）的文本按行分开
+                            other["text"] += "\n" + region["text"]
+                        elif a[0] < b[0]:
+                            other["text"] = region["text"] + " " + other["text"]
+                        else:
+                            other["text"] += " " + region["text"]
+                        other["bbox"] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        for key in ("chars", "math_font_chars", "symbols"):
+                            other[key] += region[key]
+                        other["script"] = other["script"] or region["script"]
+                        other["display"] = other["display"] or region["display"]
+                        other["detached"] = other["detached"] and region["detached"]
+                        merged = True
+                        break
+                else:
+                    result.append(region)
+            regions = result
+        return regions
+
+    @staticmethod
+    def _touching(a: Dict, b: Dict, pad: float) -> Optional[str]:
+        """Return "inline" or "stacked" if the two regions belong together, else None"""
+        (ax0, ay0, ax1, ay1), (bx0, by0, bx1, by1) = a["bbox"], b["bbox"]
+        if ax0 - pad > bx1 or bx0 - pad > ax1 or ay0 - pad > by1 or by0 - pad > ay1:
+            return None
+        # 同一行内：垂直方向大幅重叠，横向相邻（被拆开的上下标、相邻的数学片段）
+        overlap = min(ay1, by1) - max(ay0, by0)
+        if overlap > 0.5 * min(ay1 - ay0, by1 - by0):
+            return "inline"
+        # 上下堆叠只合并行间公式（分式、多行公式）和单独成行的上下标，避免把相邻两行的行内公式连在一起
+        stacked = (a["display"] and b["display"]) or \
+            any(r["script"] and r["chars"] <= 6 for r in (a, b))
+        return "stacked" if stacked and min(ax1, bx1) > max(ax0, bx0) else None
+
+    @staticmethod
+    def _confidence(region: Dict) -> float:
+        scores = [
+            min(region["math_font_chars"] / 3, 1.0),
+            1.0 if region["script"] else 0.0,
+            min(region["symbols"] / 2, 1.0),
+        ]
+        if region["display"]:
+            scores.append(1.0)
+        return sum(scores) / len(scores)
@@ -2,267 +2,294 @@ import fitz  # PyMuPDF
 import cv2
 import numpy as np
 import logging
-import re
-from typing import List, Tuple, Union, Optional
+import math
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
 from PIL import Image, ImageDraw, ImageFont
+from config.settings import Config
+from core.text_classifier import TextFormulaClassifier
+from core.image_classifier import FormulaImageClassifier
+from core.layout_detector import LayoutFormulaDetector
+
+# (图片, 位置, 置信度, 文本层内容)；图片公式和正则检测到的文本块没有可信的文本层，为空字符串
+Formula = Tuple[np.ndarray, Tuple[float, float, float, float], float, str]
 
 class PDFParser:
     def __init__(self):
         self.formulas = []
         self.logger = logging.getLogger(__name__)
-        # 定义数学公式的特征模式
-        self.formula_patterns = [
-            # 行内公式
-            r'\$[^$]+\$',
-            r'\\\([^)]+\\\)',
-            r'\\\[[^\]]+\\\]',
-            
-            # 数学环境
-            r'\\begin\{equation\}.*?\\end\{equation\}',
-            r'\\begin\{align\}.*?\\end\{align\}',
-            r'\\begin\{gather\}.*?\\end\{gather\}',
-            r'\\begin\{math\}.*?\\end\{math\}',
-            r'\\begin\{displaymath\}.*?\\end\{displaymath\}',
-            r'\\begin\{array\}.*?\\end\{array\}',
-            r'\\begin\{matrix\}.*?\\end\{matrix\}',
-            r'\\begin\{bmatrix\}.*?\\end\{bmatrix\}',
-            r'\\begin\{pmatrix\}.*?\\end\{pmatrix\}',
-            r'\\begin\{vmatrix\}.*?\\end\{vmatrix\}',
-            r'\\begin\{cases\}.*?\\end\{cases\}',
-            r'\\begin\{split\}.*?\\end\{split\}',
-            r'\\begin\{multline\}.*?\\end\{multline\}',
-            
-            # 数学函数和符号
-            r'\\frac\{.*?\}\{.*?\}',
-            r'\\sum_\{.*?\}\^\{.*?\}',
-            r'\\int_\{.*?\}\^\{.*?\}',
-            r'\\lim_\{.*?\}',
-            r'\\sqrt\{.*?\}',
-            r'\\left.*?\\right',
-            r'\\bigl.*?\\bigr',
-            r'\\Bigl.*?\\Bigr',
-            r'\\biggl.*?\\biggr',
-            r'\\Biggl.*?\\Biggr',
-            r'\\langle.*?\\rangle',
-            r'\\lceil.*?\\rceil',
-            r'\\lfloor.*?\\rfloor',
-            r'\\|.*?\\|',
-            r'\\|.*?\\|',
-            r'\\vert.*?\\vert',
-            r'\\Vert.*?\\Vert',
-            r'\\lbrace.*?\\rbrace',
-            r'\\lgroup.*?\\rgroup',
-            r'\\lmoustache.*?\\rmoustache',
-            r'\\ulcorner.*?\\urcorner',
-            r'\\llcorner.*?\\lrcorner',
-            
-            # 数学运算符
-            r'\\pm',
-            r'\\mp',
-            r'\\times',
-            r'\\div',
-            r'\\cdot',
-            r'\\ast',
-            r'\\star',
-            r'\\dagger',
-            r'\\ddagger',
-            r'\\amalg',
-            r'\\cap',
-            r'\\cup',
-            r'\\uplus',
-            r'\\sqcap',
-            r'\\sqcup',
-            r'\\vee',
-            r'\\wedge',
-            r'\\setminus',
-            r'\\wr',
-            r'\\diamond',
-            r'\\bigtriangleup',
-            r'\\bigtriangledown',
-            r'\\triangleleft',
-            r'\\triangleright',
-            r'\\lhd',
-            r'\\rhd',
-            r'\\unlhd',
-            r'\\unrhd',
-            r'\\oplus',
-            r'\\ominus',
-            r'\\otimes',
-            r'\\oslash',
-            r'\\odot',
-            r'\\bigcirc',
-            r'\\dagger',
-            r'\\ddagger',
-            r'\\amalg',
-            
-            # 数学关系符
-            r'\\leq',
-            r'\\geq',
-            r'\\equiv',
-            r'\\models',
-            r'\\prec',
-            r'\\succ',
-            r'\\sim',
-            r'\\perp',
-            r'\\preceq',
-            r'\\succeq',
-            r'\\simeq',
-            r'\\mid',
-            r'\\ll',
-            r'\\gg',
-            r'\\asymp',
-            r'\\parallel',
-            r'\\subset',
-            r'\\supset',
-            r'\\approx',
-            r'\\bowtie',
-            r'\\subseteq',
-            r'\\supseteq',
-            r'\\cong',
-            r'\\sqsubset',
-            r'\\sqsupset',
-            r'\\Join',
-            r'\\sqsubseteq',
-            r'\\sqsupseteq',
-            r'\\doteq',
-            r'\\in',
-            r'\\ni',
-            r'\\propto',
-            r'\\vdash',
-            r'\\dashv',
-            
-            # 箭头
-            r'\\leftarrow',
-            r'\\rightarrow',
-            r'\\leftrightarrow',
-            r'\\Leftarrow',
-            r'\\Rightarrow',
-            r'\\Leftrightarrow',
-            r'\\mapsto',
-            r'\\hookleftarrow',
-            r'\\hookrightarrow',
-            r'\\leftharpoonup',
-            r'\\rightharpoonup',
-            r'\\leftharpoondown',
-            r'\\rightharpoondown',
-            r'\\rightleftharpoons',
-            r'\\curvearrowleft',
-            r'\\curvearrowright',
-            r'\\circlearrowleft',
-            r'\\circlearrowright',
-            r'\\multimap',
-            r'\\boxtimes',
-            r'\\boxplus',
-            r'\\triangleq',
-            r'\\circeq',
-            r'\\doteqdot',
-            r'\\risingdotseq',
-            r'\\fallingdotseq',
-            r'\\eqcirc',
-            r'\\cirsim',
-            r'\\backsimeq',
-            r'\\thicksim',
-            r'\\thickapprox',
-            r'\\approxeq',
-            r'\\bumpeq',
-            r'\\Bumpeq',
-            r'\\eqsim',
-            r'\\simeq',
-            r'\\backepsilon',
-            r'\\models',
-            r'\\vDash',
-            r'\\Vdash',
-            r'\\Vvdash',
-            r'\\VDash',
-            r'\\nvdash',
-            r'\\nvDash',
-            r'\\nVdash',
-            r'\\nVDash',
-            r'\\ulcorner',
-            r'\\urcorner',
-            r'\\llcorner',
-            r'\\lrcorner',
-        ]
-
-    def extract_formulas(self, pdf_path: str) -> List[Tuple[np.ndarray, Tuple[float, float, float, float], float]]:
+        self.text_classifier = TextFormulaClassifier()
+        self.image_classifier = FormulaImageClassifier()
+        self.layout_detector = LayoutFormulaDetector()
+        self._xref_memo = {}  # 单次解析内 xref -> 公式置信度，非公式为 None；不缓存像素
+
+    def extract_formulas(self, pdf_path: str) -> List[Formula]:
         """Extract formulas from PDF file"""
+        formulas = []
+        for _, page_formulas in self.iter_pages(pdf_path):
+            formulas.extend(page_formulas)
+        return formulas
+
+    def iter_formulas(self, pdf_path: str,
+                      progress_callback: Optional[Callable[[int, int], None]] = None
+                      ) -> Iterator[Formula]:
+        """Yield formulas one by one while the document is still being parsed"""
+        for _, page_formulas in self.iter_pages(pdf_path, progress_callback):
+            yield from page_formulas
+
+    def iter_pages(self, pdf_path: str,
+                   progress_callback: Optional[Callable[[int, int], None]] = None,
+                   workers: Optional[int] = None,
+                   pages: Optional[Sequence[int]] = None
+                   ) -> Iterator[Tuple[int, List[Formula]]]:
+        """Yield ``(page_number, formulas)`` page by page.
+
+        Only the current page's images are held in memory, so consumers can
+        start recognizing page 1 while later pages are still unparsed.
+        ``progress_callback(pages_done, total_pages)`` runs after every page.
+        With ``workers > 1`` large documents are sharded across a process
+        pool; pages are still yielded in order with the same results.
+        ``pages`` restricts parsing to the given page numbers, serially, and
+        progress then counts selected pages.
+        """
+        workers = Config.PDF_PARSE_WORKERS if workers is None else workers
         try:
             doc = fitz.open(pdf_path)
-            formulas = []
-            
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                
-                # 1. 提取文本形式的数学公式
-                text_blocks = page.get_text("blocks")
-                for block in text_blocks:
-                    if block[6] == 0:  # 文本块
-                        text = block[4]
-                        # 检查是否包含数学公式
-                        if self._is_text_formula(text):
-                            # 获取文本块的位置
-                            x0, y0, x1, y1 = block[:4]
-                            # 将文本转换为图片
-                            img = self._text_to_image(text, page, (x0, y0, x1, y1))
-                            if img is not None:
-                                # 计算文本公式的置信度
-                                confidence = self._calculate_text_formula_confidence(text)
-                                formulas.append((img, (x0, y0, x1, y1), confidence))
-                
-                # 2. 提取图片形式的数学公式
-                image_list = page.get_images()
-                for img_index, img in enumerate(image_list):
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    
-                    # 将图片转换为numpy数组
-                    nparray = np.frombuffer(image_bytes, np.uint8)
-                    img_array = cv2.imdecode(nparray, cv2.IMREAD_COLOR)
-                    
-                    # 检查是否为彩色图片
-                    if self._is_color_image(img_array):
-                        continue
-                        
-                    # 检查是否为数学公式
-                    is_formula, confidence = self._is_formula(img_array)
-                    if is_formula:
-                        # 获取图片位置
-                        rect = page.get_image_bbox(img)
-                        if rect:
-                            x0, y0, x1, y1 = rect
-                            formulas.append((img_array, (x0, y0, x1, y1), confidence))
-            
+        except Exception as e:
+            self.logger.error(f"Error opening PDF: {str(e)}")
+            return
+
+        self._xref_memo = {}
+        total = len(doc)
+        if pages is not None:
+            # 只解析选中的页面时，进度按选中页面的个数计算
+            pages = list(pages)
+            total = len(pages)
+            parsed = self._iter_selected_pages(doc, pages)
+        elif workers > 1 and total >= Config.PDF_PARALLEL_MIN_PAGES:
             doc.close()
-            return formulas
-            
+            parsed = self._iter_pages_parallel(pdf_path, total, workers)
+        else:
+            parsed = self._iter_pages_serial(doc)
+
+        for done, (page_num, page_formulas) in enumerate(parsed, start=1):
+            if progress_callback:
+                progress_callback(done if pages is not None else page_num + 1, total)
+            yield page_num, page_formulas
+
+    def _iter_pages_serial(self, doc: fitz.Document):
+        try:
+            yield from self._extract_page_range(doc, 0, len(doc))
+        finally:
+            doc.close()
+
+    def _iter_selected_pages(self, doc: fitz.Document, pages: Sequence[int]):
+        try:
+            for page_num in pages:
+                yield from self._extract_page_range(doc, page_num, page_num + 1)
+        finally:
+            doc.close()
+
+    def _iter_pages_parallel(self, pdf_path: str, total: int, workers: int):
+        """Parse page ranges in worker processes and merge them back in page order"""
+        chunk = max(1, min(Config.PDF_PARSE_CHUNK_PAGES, math.ceil(total / workers)))
+        ranges = iter([(start, min(start + chunk, total)) for start in range(0, total, chunk)])
+        pending = deque()
+
+        # 调用方（GUI、识别服务）已有运行中的线程，fork 可能继承被占用的锁而死锁
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            try:
+                while True:
+                    # 限制在途分片数，避免已解析未消费的页面占满内存
+                    while len(pending) < workers * 2:
+                        page_range = next(ranges, None)
+                        if page_range is None:
+                            break
+                        pending.append((page_range, executor.submit(_parse_page_range, pdf_path, *page_range)))
+                    if not pending:
+                        break
+
+                    (start, stop), future = pending.popleft()
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error parsing pages {start + 1}-{stop}: {str(e)}")
+                        results = [(page_num, []) for page_num in range(start, stop)]
+                    yield from results
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def _extract_page_range(self, doc: fitz.Document, start: int, stop: int):
+        for page_num in range(start, stop):
+            try:
+                page_formulas = self._extract_page(doc, doc[page_num])
+            except Exception as e:
+                self.logger.error(f"Error extracting formulas from page {page_num + 1}: {str(e)}")
+                page_formulas = []
+            yield page_num, page_formulas
+
+    def _extract_page(self, doc: fitz.Document, page: fitz.Page) -> List[Formula]:
+        """Extract text and image formulas from a single page"""
+        formulas = []
+
+        # 1. 提取文本形式的数学公式
+        if Config.PDF_FORMULA_DETECTOR == "layout":
+            # 基于字体、基线和符号密度定位公式，外框只包含公式本身
+            candidates = self.layout_detector.detect(page)
+        else:
+            candidates = self._detect_text_blocks(page)
+
+        if Config.PDF_TEXT_RENDER_MODE == "raster":
+            # 直接从页面栅格化公式区域，保留真实字形
+            images = self._rasterize_regions(page, [rect for _, rect, _ in candidates])
+        else:
+            images = [self._text_to_image(text, page, rect) for text, rect, _ in candidates]
+        # 只有版面检测器的文本保留了上下标结构；正则命中的整块文本可能混有正文，
+        # 低置信度区域也可能截断或混入正文，二者都不交给文本层捷径
+        layout = Config.PDF_FORMULA_DETECTOR == "layout"
+        for (text, rect, confidence), img in zip(candidates, images):
+            if img is not None:
+                trusted = layout and confidence >= Config.TIER_TEXT_MIN_CONFIDENCE
+                formulas.append((img, rect, confidence, text if trusted else ""))
+
+        # 2. 提取图片形式的数学公式
+        image_list = page.get_images(full=True)  # get_image_bbox 需要完整的图片条目
+        # 同一文档中重复引用的图片（页眉、Logo、重复的公式图）只解码和判定一次
+        new_xrefs = list(dict.fromkeys(img[0] for img in image_list if img[0] not in self._xref_memo))
+        decoded = {}
+        for xref, verdict in zip(new_xrefs, self._classify_embedded_images(doc, new_xrefs) if new_xrefs else []):
+            self._xref_memo[xref] = verdict[1] if verdict is not None else None
+            if verdict is not None:
+                decoded[xref] = verdict[0]
+
+        for img in image_list:
+            confidence = self._xref_memo[img[0]]
+            if confidence is None:
+                continue
+
+            img_array = decoded.get(img[0])
+            if img_array is None:
+                # 之前页面已判定为公式的图片只缓存了结论，像素按需重新解码，内存不随文档增长
+                img_array = self._decode_image(doc, img[0])
+                if img_array is None:
+                    continue
+                decoded[img[0]] = img_array
+            # 获取图片位置
+            rect = page.get_image_bbox(img)
+            if rect:
+                x0, y0, x1, y1 = rect
+                formulas.append((img_array, (x0, y0, x1, y1), confidence, ""))
+
+        return formulas
+
+    def _detect_text_blocks(self, page: fitz.Page) -> List[Tuple[str, Tuple[float, float, float, float], float]]:
+        """Block-level detection: every text block the regex classifier accepts"""
+        candidates = []
+        text_blocks = page.get_text("blocks")
+        for block in text_blocks:
+            if block[6] == 0:  # 文本块
+                text = block[4]
+                # 一次扫描同时得到判定结果和置信度
+                is_formula, confidence = self.text_classifier.classify(text)
+                if is_formula:
+                    # 获取文本块的位置
+                    candidates.append((text, tuple(block[:4]), confidence))
+        return candidates
+
+    def _classify_embedded_images(self, doc: fitz.Document, xrefs: List[int]) -> List[Optional[Tuple[np.ndarray, float]]]:
+        """Decode embedded images and score them as one batch.
+
+        Returns ``(image, confidence)`` for each xref that looks like a
+        formula and None otherwise (colour, undecodable or rejected images).
+        """
+        images = [self._decode_image(doc, xref) for xref in xrefs]
+
+        decoded = [img for img in images if img is not None]
+        try:
+            verdicts = iter(self.image_classifier.inspect_batch(decoded))
         except Exception as e:
-            self.logger.error(f"Error extracting formulas from PDF: {str(e)}")
-            return []
-            
+            # 批量判定失败时逐张重试，只丢弃出错的那张图片
+            self.logger.error(f"Error in batch formula detection: {str(e)}")
+            verdicts = iter([self._inspect_image(img) for img in decoded])
+
+        results = []
+        for img_array in images:
+            if img_array is None:
+                results.append(None)  # 无法解码时保守处理，与彩色图片一样跳过
+                continue
+            is_color, is_formula, confidence = next(verdicts)
+            results.append((img_array, confidence) if is_formula and not is_color else None)
+        return results
+
+    def _decode_image(self, doc: fitz.Document, xref: int) -> Optional[np.ndarray]:
+        try:
+            # 将图片转换为numpy数组
+            nparray = np.frombuffer(doc.extract_image(xref)["image"], np.uint8)
+            return cv2.imdecode(nparray, cv2.IMREAD_COLOR)
+        except Exception as e:
+            self.logger.error(f"Error decoding embedded image {xref}: {str(e)}")
+            return None
+
+    def _inspect_image(self, img: np.ndarray) -> Tuple[bool, bool, float]:
+        try:
+            return self.image_classifier.inspect(img)
+        except Exception as e:
+            self.logger.error(f"Error in formula detection: {str(e)}")
+            return True, False, 0.0
+
     def _is_color_image(self, img: np.ndarray) -> bool:
         """Check if image is color image"""
         try:
-            # 转换为灰度图
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # 计算颜色通道的差异
-            b, g, r = cv2.split(img)
-            diff_bg = cv2.absdiff(b, g)
-            diff_br = cv2.absdiff(b, r)
-            diff_gr = cv2.absdiff(g, r)
-            
-            # 如果颜色通道差异大于阈值，认为是彩色图片
-            threshold = 10
-            if np.mean(diff_bg) > threshold or np.mean(diff_br) > threshold or np.mean(diff_gr) > threshold:
-                return True
-                
-            return False
-            
+            return self.image_classifier.is_color(img)
         except Exception as e:
             self.logger.error(f"Error checking color image: {str(e)}")
             return True  # 如果出错，保守处理，认为是彩色图片
-            
+
+    def _rasterize_regions(self, page: fitz.Page, rects: List[Tuple[float, float, float, float]],
+                           dpi: Optional[int] = None) -> List[Optional[np.ndarray]]:
+        """Render formula regions straight from the page as BGR arrays.
+
+        Pages with several regions are rasterized once and sliced; otherwise
+        each region is rendered with a clip. Grayscale rendering keeps the
+        MuPDF buffer small and is expanded to three channels once per region.
+        """
+        if not rects:
+            return []
+        dpi = dpi or Config.PDF_RASTER_DPI
+        try:
+            # 旋转页面的整页像素与页面坐标不对应，只能逐个裁剪渲染
+            if len(rects) >= Config.PDF_RASTER_PAGE_BATCH and page.rotation == 0:
+                pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+                page_gray = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+                scale = dpi / 72.0
+                origin_x, origin_y = page.rect.x0, page.rect.y0
+                images = []
+                for x0, y0, x1, y1 in rects:
+                    left = max(int(math.floor((x0 - origin_x) * scale)), 0)
+                    top = max(int(math.floor((y0 - origin_y) * scale)), 0)
+                    right = min(int(math.ceil((x1 - origin_x) * scale)), pix.width)
+                    bottom = min(int(math.ceil((y1 - origin_y) * scale)), pix.height)
+                    if right <= left or bottom <= top:
+                        images.append(None)
+                        continue
+                    images.append(cv2.cvtColor(page_gray[top:bottom, left:right], cv2.COLOR_GRAY2BGR))
+                return images
+            return [self._rasterize_clip(page, rect, dpi) for rect in rects]
+        except Exception as e:
+            self.logger.error(f"Error rasterizing formula regions: {str(e)}")
+            return [None] * len(rects)
+
+    def _rasterize_clip(self, page: fitz.Page, rect: Tuple[float, float, float, float], dpi: int) -> Optional[np.ndarray]:
+        clip = fitz.Rect(rect) & page.rect
+        if clip.is_empty:
+            return None
+        pix = page.get_pixmap(clip=clip, dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        gray = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
     def _text_to_image(self, text: str, page: fitz.Page, rect: Tuple[float, float, float, float]) -> Optional[np.ndarray]:
         """Convert text to image"""
         try:
@@ -295,49 +322,7 @@ class PDFParser:
     def _is_text_formula(self, text: str) -> bool:
         """Check if text is a mathematical formula"""
         try:
-            # 1. 检查是否包含数学符号
-            math_symbols = r'[α-ωΑ-Ω∑∫∏√∞±×÷≠≤≥∈∉⊂⊃∪∩]'
-            if re.search(math_symbols, text):
-                return True
-                
-            # 2. 检查是否包含LaTeX命令
-            latex_commands = r'\\[a-zA-Z]+'
-            if re.search(latex_commands, text):
-                return True
-                
-            # 3. 检查是否包含数学运算符
-            operators = r'[+\-*/=<>]'
-            if re.search(operators, text):
-                return True
-                
-            # 4. 检查是否包含数学函数
-            math_functions = r'\\sin|\\cos|\\tan|\\log|\\ln|\\exp|\\lim|\\sum|\\int|\\prod|\\oint|\\iint|\\iiint|\\iiiint|\\idotsint'
-            if re.search(math_functions, text):
-                return True
-                
-            # 5. 检查是否包含上下标
-            subscripts = r'_[^}]+'
-            superscripts = r'\^[^}]+'
-            if re.search(subscripts, text) or re.search(superscripts, text):
-                return True
-                
-            # 6. 检查是否包含数学括号
-            brackets = r'\\left|\\right|\\bigl|\\bigr|\\Bigl|\\Bigr|\\biggl|\\biggr|\\Biggl|\\Biggr'
-            if re.search(brackets, text):
-                return True
-                
-            # 7. 检查是否包含数学箭头
-            arrows = r'\\rightarrow|\\leftarrow|\\leftrightarrow|\\Rightarrow|\\Leftarrow|\\Leftrightarrow'
-            if re.search(arrows, text):
-                return True
-                
-            # 8. 检查是否包含数学环境
-            environments = r'\\begin\{.*?\}.*?\\end\{.*?\}'
-            if re.search(environments, text):
-                return True
-                
-            return False
-            
+            return self.text_classifier.classify(text)[0]
         except Exception as e:
             self.logger.error(f"Error checking text formula: {str(e)}")
             return False
@@ -345,47 +330,7 @@ class PDFParser:
     def _is_formula(self, image: np.ndarray) -> Tuple[bool, float]:
         """Check if image is a mathematical formula"""
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Calculate feature scores
-            scores = []
-            
-            # 1. White pixel ratio score (formulas usually have black text on white background)
-            white_ratio = np.sum(gray > 240) / gray.size
-            white_score = min(white_ratio * 1.0, 1.0)  # 进一步降低白色像素比例要求
-            scores.append(white_score)
-            self.logger.debug(f"White pixel ratio score: {white_score:.2f} (ratio: {white_ratio:.2f})")
-            
-            # 2. Aspect ratio score (formulas usually have reasonable height/width ratio)
-            height, width = gray.shape
-            aspect_ratio = height / width
-            aspect_score = 1.0 - min(abs(aspect_ratio - 1.0), 1.0)  # 进一步调整比例范围
-            scores.append(aspect_score)
-            self.logger.debug(f"Aspect ratio score: {aspect_score:.2f} (ratio: {aspect_ratio:.2f})")
-            
-            # 3. Connected components score (formulas usually have multiple small characters)
-            _, binary = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY_INV)
-            contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            contour_count = len(contours)
-            contour_score = min(contour_count / 6, 1.0)  # 进一步降低连通区域要求
-            scores.append(contour_score)
-            self.logger.debug(f"Connected components score: {contour_score:.2f} (found {contour_count} components)")
-            
-            # 4. Edge detection score (formulas usually have many vertical and horizontal edges)
-            edges = cv2.Canny(gray, 100, 200)
-            edge_ratio = np.sum(edges > 0) / edges.size
-            edge_score = min(edge_ratio * 4, 1.0)  # 进一步降低边缘检测要求
-            scores.append(edge_score)
-            self.logger.debug(f"Edge detection score: {edge_score:.2f} (ratio: {edge_ratio:.2f})")
-            
-            # Calculate confidence score
-            confidence = np.mean(scores)
-            self.logger.debug(f"Final image confidence score: {confidence:.2f}")
-            
-            # Return whether it's a formula and the confidence
-            return confidence > 0.3, confidence  # 进一步降低图片公式的置信度阈值
-            
+            return self.image_classifier.classify(image)
         except Exception as e:
             self.logger.error(f"Error in formula detection: {str(e)}")
             return False, 0.0
@@ -393,60 +338,13 @@ class PDFParser:
     def _calculate_text_formula_confidence(self, text: str) -> float:
         """Calculate confidence score for text formula"""
         try:
-            scores = []
-            
-            # 1. 检查是否包含数学符号
-            math_symbols = r'[α-ωΑ-Ω∑∫∏√∞±×÷≠≤≥∈∉⊂⊃∪∩]'
-            symbol_count = len(re.findall(math_symbols, text))
-            symbol_score = min(symbol_count / 1.2, 1.0)
-            scores.append(symbol_score)
-            
-            # 2. 检查是否包含LaTeX命令
-            latex_commands = r'\\[a-zA-Z]+'
-            command_count = len(re.findall(latex_commands, text))
-            command_score = min(command_count / 1.0, 1.0)
-            scores.append(command_score)
-            
-            # 3. 检查是否包含数学运算符
-            operators = r'[+\-*/=<>]'
-            operator_count = len(re.findall(operators, text))
-            operator_score = min(operator_count / 1.0, 1.0)
-            scores.append(operator_score)
-            
-            # 4. 检查是否包含数学函数
-            math_functions = r'\\sin|\\cos|\\tan|\\log|\\ln|\\exp|\\lim|\\sum|\\int|\\prod|\\oint|\\iint|\\iiint|\\iiiint|\\idotsint'
-            func_count = len(re.findall(math_functions, text))
-            func_score = min(func_count / 1.2, 1.0)
-            scores.append(func_score)
-            
-            # 5. 检查是否包含上下标
-            subscripts = r'_[^}]+'
-            superscripts = r'\^[^}]+'
-            sub_count = len(re.findall(subscripts, text))
-            sup_count = len(re.findall(superscripts, text))
-            sub_sup_score = min((sub_count + sup_count) / 1.5, 1.0)
-            scores.append(sub_sup_score)
-            
-            # 6. 检查是否包含数学括号
-            brackets = r'\\left|\\right|\\bigl|\\bigr|\\Bigl|\\Bigr|\\biggl|\\biggr|\\Biggl|\\Biggr'
-            bracket_count = len(re.findall(brackets, text))
-            bracket_score = min(bracket_count / 1.5, 1.0)
-            scores.append(bracket_score)
-            
-            # 7. 检查是否包含数学箭头
-            arrows = r'\\rightarrow|\\leftarrow|\\leftrightarrow|\\Rightarrow|\\Leftarrow|\\Leftrightarrow'
-            arrow_count = len(re.findall(arrows, text))
-            arrow_score = min(arrow_count / 1.5, 1.0)
-            scores.append(arrow_score)
-            
-            # 8. 检查是否包含数学环境
-            environments = r'\\begin\{.*?\}.*?\\end\{.*?\}'
-            env_score = 1.0 if re.search(environments, text) else 0.0
-            scores.append(env_score)
-            
-            # 计算最终得分
-            return np.mean(scores)
-            
+            return self.text_classifier.classify(text)[1]
         except Exception as e:
             self.logger.error(f"Error calculating text formula confidence: {str(e)}")
-            return 0.0 
\ No newline at end of file
+            return 0.0
+
+def _parse_page_range(pdf_path: str, start: int, stop: int):
+    """Process-pool entry point: parse pages [start, stop) with a private document handle"""
+    parser = PDFParser()
+    with fitz.open(pdf_path) as doc:
+        return list(parser._extract_page_range(doc, start, stop))
\ No newline at end of file
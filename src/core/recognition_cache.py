@@ -0,0 +1,119 @@
+# recognition_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from config.settings import Config
+
+
+class RecognitionCache:
+    """Persistent LaTeX cache keyed by image content, model and prompt.
+
+    Entries live in a small SQLite database; once ``max_entries`` is exceeded
+    the least recently used rows are evicted.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or Config.CACHE_PATH
+        self.max_entries = max_entries or Config.CACHE_MAX_ENTRIES
+        self.logger = logging.getLogger("recognition_cache")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS recognitions ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " latex TEXT NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON recognitions(last_access)"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model: str, prompt: str) -> str:
+        """生成内容寻址的缓存键"""
+        digest = hashlib.sha256()
+        digest.update(image_bytes)
+        digest.update(b"\0" + model.encode("utf-8"))
+        digest.update(b"\0" + prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latex FROM recognitions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE recognitions SET last_access = ? WHERE key = ?",
+                (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, latex: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recognitions (key, model, latex, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, model, latex, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """按LRU淘汰超出上限的条目"""
+        count = self._conn.execute("SELECT COUNT(*) FROM recognitions").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM recognitions WHERE key IN ("
+                " SELECT key FROM recognitions ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.logger.info(f"Evicted {overflow} cached recognitions")
+
+    def invalidate(self, key: Optional[str] = None, model: Optional[str] = None):
+        """Remove one entry, every entry of a model, or the whole cache"""
+        with self._lock:
+            if key is not None:
+                self._conn.execute("DELETE FROM recognitions WHERE key = ?", (key,))
+            elif model is not None:
+                self._conn.execute("DELETE FROM recognitions WHERE model = ?", (model,))
+            else:
+                self._conn.execute("DELETE FROM recognitions")
+            self._conn.commit()
+
+    def clear(self):
+        self.invalidate()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM recognitions").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": size}
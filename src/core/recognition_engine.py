@@ -0,0 +1,176 @@
+# recognition_engine.py
+import abc
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config.settings import Config
+from core.image_utils import to_png_bytes
+
+
+class RecognitionEngine(abc.ABC):
+    """Common interface of the formula recognition backends.
+
+    ``recognize_formula`` accepts a path, encoded bytes, numpy array or
+    QImage/QPixmap and returns LaTeX; ``source_text`` is the formula's PDF
+    text layer, used only by engines that can take advantage of it.
+    ``recognize_batch`` returns a list aligned with its input where failed
+    items hold the exception.
+    """
+
+    name = "base"
+    cache = None
+
+    @abc.abstractmethod
+    def recognize_formula(self, image, source_text: Optional[str] = None) -> str:
+        """Return the LaTeX for one formula image"""
+
+    def stats(self) -> Dict[str, int]:
+        """Engine-specific counters; empty when the engine keeps none"""
+        return {}
+
+    def recognize_batch(self, images, max_crops=None, max_payload_bytes=None) -> List[Any]:
+        results = []
+        for image in images:
+            try:
+                results.append(self.recognize_formula(image))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class MockEngine(RecognitionEngine):
+    """Offline stand-in that returns a deterministic LaTeX string per image"""
+
+    name = "mock"
+
+    def __init__(self, latency: Optional[float] = None, latex: Optional[str] = None):
+        self.latency = Config.MOCK_ENGINE_LATENCY if latency is None else latency
+        self.latex = latex
+
+    def recognize_formula(self, image, source_text: Optional[str] = None) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.latex is not None:
+            return self.latex
+        digest = hashlib.sha256(to_png_bytes(image)).hexdigest()[:8]
+        return f"x_{{{digest}}}"
+
+
+class LocalOnnxEngine(RecognitionEngine):
+    """CPU image-to-LaTeX model run with onnxruntime.
+
+    ``model_dir`` holds an encoder/decoder export (``encoder.onnx``,
+    ``decoder.onnx``), a HuggingFace ``tokenizer.json`` and an optional
+    ``config.json`` with ``image_height``, ``image_width``, ``bos_token_id``,
+    ``eos_token_id`` and ``max_length``. The sessions are loaded once per
+    process and shared by every engine instance and worker thread.
+    """
+
+    name = "local"
+    _models: Dict[str, Tuple[Any, Any, Any, Dict[str, Any]]] = {}
+    _models_lock = threading.Lock()
+
+    DEFAULTS = {"image_height": 192, "image_width": 672, "bos_token_id": 1,
+                "eos_token_id": 2, "max_length": 256}
+
+    def __init__(self, model_dir: Optional[str] = None):
+        self.logger = logging.getLogger("local_engine")
+        self.model_dir = os.path.expanduser(model_dir or Config.LOCAL_MODEL_DIR)
+        self.encoder, self.decoder, self.tokenizer, self.settings = self._load(self.model_dir)
+
+    @classmethod
+    def _load(cls, model_dir):
+        with cls._models_lock:
+            model = cls._models.get(model_dir)
+            if model is None:
+                # onnxruntime/tokenizers 为可选依赖，仅本地引擎需要
+                try:
+                    import onnxruntime
+                    from tokenizers import Tokenizer
+                except ImportError as e:
+                    raise ImportError("The local recognition engine requires onnxruntime and tokenizers") from e
+
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = Config.LOCAL_MODEL_THREADS
+                providers = ["CPUExecutionProvider"]
+                encoder = onnxruntime.InferenceSession(
+                    os.path.join(model_dir, "encoder.onnx"), options, providers=providers)
+                decoder = onnxruntime.InferenceSession(
+                    os.path.join(model_dir, "decoder.onnx"), options, providers=providers)
+                tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+                settings = dict(cls.DEFAULTS)
+                config_path = os.path.join(model_dir, "config.json")
+                if os.path.exists(config_path):
+                    with open(config_path, "r", encoding="utf-8") as f:
+                        settings.update(json.load(f))
+                model = cls._models[model_dir] = (encoder, decoder, tokenizer, settings)
+                logging.getLogger("local_engine").info(f"Loaded local recognition model from {model_dir}")
+            return model
+
+    def _preprocess(self, image) -> np.ndarray:
+        """Grayscale, fit into the model canvas on a white background, normalize to [-1, 1]"""
+        if isinstance(image, np.ndarray):
+            gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = cv2.imdecode(np.frombuffer(to_png_bytes(image), np.uint8), cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                raise ValueError("Failed to decode image for local recognition")
+
+        height, width = self.settings["image_height"], self.settings["image_width"]
+        scale = min(height / gray.shape[0], width / gray.shape[1], 1.0)
+        resized = cv2.resize(gray, (max(int(gray.shape[1] * scale), 1), max(int(gray.shape[0] * scale), 1)),
+                             interpolation=cv2.INTER_AREA)
+        canvas = np.full((height, width), 255, np.uint8)
+        canvas[:resized.shape[0], :resized.shape[1]] = resized
+        return ((canvas.astype(np.float32) / 255.0 - 0.5) / 0.5)[None, None]
+
+    def recognize_with_confidence(self, image) -> Tuple[str, float]:
+        """Greedy-decode one formula; confidence is the mean probability of the chosen tokens"""
+        pixels = self._preprocess(image)
+        memory = self.encoder.run(None, {self.encoder.get_inputs()[0].name: pixels})[0]
+
+        ids_name, memory_name = (inp.name for inp in self.decoder.get_inputs()[:2])
+        tokens = [self.settings["bos_token_id"]]
+        log_prob = 0.0
+        for _ in range(self.settings["max_length"]):
+            logits = self.decoder.run(None, {ids_name: np.array([tokens], np.int64),
+                                             memory_name: memory})[0][0, -1]
+            probs = np.exp(logits - logits.max())
+            probs /= probs.sum()
+            token = int(probs.argmax())
+            if token == self.settings["eos_token_id"]:
+                break
+            tokens.append(token)
+            log_prob += float(np.log(probs[token]))
+
+        generated = tokens[1:]
+        latex = self.tokenizer.decode(generated).replace("Ġ", " ").strip()
+        confidence = float(np.exp(log_prob / len(generated))) if generated else 0.0
+        return latex, confidence
+
+    def recognize_formula(self, image, source_text: Optional[str] = None) -> str:
+        return self.recognize_with_confidence(image)[0]
+
+
+def create_engine(name: Optional[str] = None) -> RecognitionEngine:
+    """Build the recognition engine selected by ``Config.RECOGNITION_ENGINE``"""
+    name = (name or Config.RECOGNITION_ENGINE).lower()
+    if name == "remote":
+        from core.api_client import APIClient  # api_client 依赖本模块的基类
+        return APIClient()
+    if name == "local":
+        return LocalOnnxEngine()
+    if name == "mock":
+        return MockEngine()
+    if name == "tiered":
+        from core.tiered_engine import TieredEngine
+        return TieredEngine()
+    raise ValueError(f"Unknown recognition engine: {name}")
@@ -0,0 +1,86 @@
+# recognition_pool.py
+import functools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from config.settings import Config
+from core.image_utils import VisualDeduplicator
+from core.request_scheduler import cancellation
+
+
+class RecognitionPool:
+    """Run a recognition callable over many inputs with bounded concurrency.
+
+    Results are yielded in input order as ``(item, success, result)`` where
+    ``result`` is the recognized LaTeX on success and the exception otherwise.
+    """
+
+    def __init__(self, recognize: Callable[[Any], Any], max_workers: Optional[int] = None):
+        self.recognize = recognize
+        self.max_workers = max(1, max_workers or Config.MAX_WORKERS)
+        self.logger = logging.getLogger("recognition_pool")
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Stop submitting new work and drop queued requests"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _recognize(self, item):
+        # 取消时正在退避或限流等待的请求立即结束
+        with cancellation(self._cancelled):
+            return self.recognize(item)
+
+    def map(self, items: Iterable[Any], dedupe: bool = False) -> Iterator[Tuple[Any, bool, Any]]:
+        """Yield ``(item, success, result)`` in input order.
+
+        With ``dedupe`` numpy crops with identical ink (or tuples whose first
+        element is one) share one recognition and its result is fanned out to
+        every occurrence.
+        """
+        # 最多保留 2 倍 worker 数的在途任务，输入可以是惰性迭代器
+        window = self.max_workers * 2
+        source = iter(items)
+        pending = deque()
+        deduplicator = VisualDeduplicator() if dedupe else None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="recognition") as executor:
+            try:
+                exhausted = False
+                while True:
+                    while not exhausted and not self.cancelled and len(pending) < window:
+                        try:
+                            item = next(source)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        submit = functools.partial(executor.submit, self._recognize, item)
+                        image = item[0] if isinstance(item, tuple) and item else item
+                        if deduplicator is not None and isinstance(image, np.ndarray):
+                            future = deduplicator.get_or_add(image, submit)
+                        else:
+                            future = submit()
+                        pending.append((item, future))
+
+                    if not pending or self.cancelled:
+                        break
+
+                    item, future = pending.popleft()
+                    try:
+                        outcome = (item, True, future.result())
+                    except Exception as e:
+                        outcome = (item, False, e)
+                    yield outcome
+            finally:
+                # 取消尚未开始的请求，正在进行的请求自然结束
+                for _, future in pending:
+                    future.cancel()
@@ -0,0 +1,133 @@
+# render_cache.py
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from config.settings import Config
+
+
+class RenderCache:
+    """LRU cache of rendered formula images (encoded bytes) keyed by LaTeX and render parameters.
+
+    The memory tier is capped at ``max_bytes`` of encoded data. With
+    ``disk_dir`` set, entries are also written there and survive restarts;
+    disk hits are promoted back into memory.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_bytes: Optional[int] = None, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes or Config.RENDER_CACHE_MAX_BYTES
+        self.disk_dir = disk_dir
+        self.logger = logging.getLogger("render_cache")
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(disk_dir=Config.RENDER_CACHE_DIR if Config.RENDER_CACHE_DISK else None)
+            return cls._instance
+
+    @staticmethod
+    def normalize(code: str) -> str:
+        """空白在数学模式中无意义，合并后同一公式的不同写法共享缓存"""
+        return " ".join(code.split())
+
+    @classmethod
+    def make_key(cls, code: str, **params) -> str:
+        digest = hashlib.sha256(cls.normalize(code).encode("utf-8"))
+        for name in sorted(params):
+            digest.update(f"\0{name}={params[name]!r}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._store(key, data)
+        self._write_disk(key, data)
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> bytes:
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def _store(self, key, data):
+        if len(data) > self.max_bytes:
+            return  # 单个条目超过上限时不进入内存层
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = data
+        self._size += len(data)
+        # 按LRU淘汰直到回到内存上限以内
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _read_disk(self, key) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免并发读到半个文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Failed to write render cache entry: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries), "bytes": self._size}
@@ -0,0 +1,140 @@
+# render_farm.py
+import logging
+import math
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Sequence, Union
+
+from config.settings import Config
+from core.latex_renderer import LatexRenderer
+from core.render_cache import RenderCache
+
+RenderResult = Union[bytes, Exception]
+
+# 每个渲染进程只创建一次渲染器，字体缓存和画布池在进程内复用
+_worker_renderer = None
+
+
+def _init_worker():
+    global _worker_renderer
+    _worker_renderer = LatexRenderer()
+
+
+def _render(renderer: LatexRenderer, code: str, kind: str) -> RenderResult:
+    try:
+        if kind == "png":
+            return renderer.render_export_png(code)
+        if kind == "svg":
+            return renderer.render_svg(code)
+        if kind == "pdf":
+            return renderer.render_pdf(code)
+        raise ValueError(f"Unknown render kind: {kind}")
+    except Exception as e:
+        # 统一转成 RuntimeError，保证异常能跨进程序列化
+        return RuntimeError(f"{type(e).__name__}: {str(e)}")
+
+
+def _render_chunk(codes: List[str], kind: str) -> List[RenderResult]:
+    """Process-pool entry point: render a chunk of formulas with the worker's renderer"""
+    return [_render(_worker_renderer, code, kind) for code in codes]
+
+
+class RenderFarm:
+    """Render LaTeX to encoded image bytes across a pool of worker processes.
+
+    ``kind`` selects the output: ``png`` (raster sized like the preview),
+    ``svg`` or ``pdf`` (vector, glyphs as paths).
+
+    Results are returned in input order; a formula that fails to render
+    yields its exception in place of the bytes. Finished renders are kept in
+    the shared ``RenderCache`` so exporting the same formulas to several
+    formats renders each one once. Batches smaller than
+    ``RENDER_FARM_MIN_FORMULAS`` render in-process.
+    """
+
+    KINDS = ("png", "svg", "pdf")
+
+    def __init__(self, workers: Optional[int] = None, renderer: Optional[LatexRenderer] = None):
+        self.workers = workers or Config.RENDER_FARM_WORKERS
+        self.logger = logging.getLogger("render_farm")
+        self.cache = RenderCache.get_instance() if Config.RENDER_CACHE_MAX_BYTES > 0 else None
+        self._renderer = renderer
+
+    @property
+    def renderer(self) -> LatexRenderer:
+        if self._renderer is None:
+            self._renderer = LatexRenderer()
+        return self._renderer
+
+    def render(self, codes: Sequence[str], kind: str = "png",
+               progress_callback: Optional[Callable[[int, int], None]] = None) -> List[RenderResult]:
+        return list(self.iter_render(codes, kind, progress_callback))
+
+    def iter_render(self, codes: Sequence[str], kind: str = "png",
+                    progress_callback: Optional[Callable[[int, int], None]] = None) -> Iterator[RenderResult]:
+        """Yield one result per formula in input order, reporting ``(done, total)`` as they arrive"""
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown render kind: {kind}")
+        codes = list(codes)
+        total = len(codes)
+        keys = [RenderCache.make_key(code, kind=f"export_{kind}") for code in codes] if self.cache else None
+
+        cached = {}
+        if self.cache is not None:
+            for idx, key in enumerate(keys):
+                data = self.cache.get(key)
+                if data is not None:
+                    cached[idx] = data
+        misses = [idx for idx in range(total) if idx not in cached]
+
+        if self.workers > 1 and len(misses) >= Config.RENDER_FARM_MIN_FORMULAS:
+            rendered = self._iter_parallel([codes[idx] for idx in misses], kind)
+        else:
+            rendered = (_render(self.renderer, codes[idx], kind) for idx in misses)
+
+        for done in range(total):
+            if done in cached:
+                result = cached[done]
+            else:
+                result = next(rendered)
+                if self.cache is not None and not isinstance(result, Exception):
+                    self.cache.put(keys[done], result)
+            if progress_callback:
+                progress_callback(done + 1, total)
+            yield result
+
+    def _iter_parallel(self, codes: List[str], kind: str) -> Iterator[RenderResult]:
+        """Render chunks in worker processes and yield the results in submission order"""
+        workers = min(self.workers, len(codes))
+        chunk = max(1, min(Config.RENDER_FARM_CHUNK, math.ceil(len(codes) / workers)))
+        chunks = iter([(start, codes[start:start + chunk]) for start in range(0, len(codes), chunk)])
+        pending = deque()
+        self.logger.info(f"Rendering {len(codes)} formulas in {workers} processes")
+
+        # 调用方（GUI、识别服务）已有运行中的线程，fork 可能继承被占用的锁而死锁
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            try:
+                while True:
+                    # 限制在途分片数，避免已渲染未消费的图片占满内存
+                    while len(pending) < workers * 2:
+                        item = next(chunks, None)
+                        if item is None:
+                            break
+                        start, chunk_codes = item
+                        pending.append((start, len(chunk_codes),
+                                        executor.submit(_render_chunk, chunk_codes, kind)))
+                    if not pending:
+                        break
+
+                    start, count, future = pending.popleft()
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error rendering formulas {start + 1}-{start + count}: {str(e)}")
+                        results = [RuntimeError(f"Render worker failed: {str(e)}")] * count
+                    yield from results
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
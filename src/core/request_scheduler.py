@@ -0,0 +1,244 @@
+# request_scheduler.py
+import asyncio
+import contextlib
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import openai
+
+from config.settings import Config
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised while the circuit breaker rejects requests after sustained failures"""
+
+
+class RequestCancelledError(RuntimeError):
+    """Raised when the caller's cancellation event is set while a request waits"""
+
+
+# 当前线程的取消事件；调度器的等待在事件置位时立即结束
+_context = threading.local()
+
+
+@contextlib.contextmanager
+def cancellation(event: threading.Event):
+    """Make scheduler waits in the current thread end as soon as ``event`` is set"""
+    previous = getattr(_context, "event", None)
+    _context.event = event
+    try:
+        yield
+    finally:
+        _context.event = previous
+
+
+# 这些状态码值得重试，其余客户端错误（401/400/404等）重试也不会成功
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+
+def is_service_failure(error: Exception) -> bool:
+    """Whether the error says the service itself is unhealthy (counts toward the circuit breaker)"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 408 or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the server's Retry-After hint (seconds, milliseconds or HTTP date)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(retry_at.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``reserve`` returns how long the caller must wait.
+
+    Reservations may drive the balance negative, so concurrent callers queue
+    up behind each other instead of all waking at the same moment.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, amount: float):
+        """Return over-estimated tokens (or charge more with a negative amount)"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def pause(self, seconds: float) -> bool:
+        """Drain the bucket so every worker waits at least ``seconds``; False when the bucket is unlimited"""
+        if self.rate <= 0:
+            return False
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+        return True
+
+
+class CircuitBreaker:
+    """Open after ``failure_threshold`` consecutive failures, probe again after ``reset_timeout``"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("Recognition service unavailable, circuit breaker is open")
+            # 半开状态：放行一个试探请求
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RequestScheduler:
+    """Retry, rate limiting and circuit breaking shared by every API worker"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger("request_scheduler")
+        if Config.RETRY_MAX_ATTEMPTS < 1:
+            raise ValueError("RETRY_MAX_ATTEMPTS must be at least 1")
+        self.max_attempts = Config.RETRY_MAX_ATTEMPTS
+        self.base_delay = Config.RETRY_BASE_DELAY
+        self.max_delay = Config.RETRY_MAX_DELAY
+        self.request_bucket = TokenBucket(Config.RATE_LIMIT_RPS, max(Config.RATE_LIMIT_RPS, 1.0))
+        self.token_bucket = TokenBucket(Config.RATE_LIMIT_TPM / 60.0, Config.RATE_LIMIT_TPM)
+        self.breaker = CircuitBreaker(Config.CIRCUIT_FAILURE_THRESHOLD, Config.CIRCUIT_RESET_TIMEOUT)
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def call(self, send: Callable, tokens: int = 0):
+        """Run ``send()`` under the shared limits, retrying transient failures"""
+        for attempt in range(self.max_attempts):
+            self._wait(self._admit(tokens))
+            try:
+                result = send()
+            except Exception as e:
+                self._wait(self._handle_failure(e, attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+    @staticmethod
+    def _wait(delay: float):
+        """Sleep ``delay`` seconds, raising RequestCancelledError if the caller cancels meanwhile"""
+        event = getattr(_context, "event", None)
+        if event is None:
+            if delay > 0:
+                time.sleep(delay)
+        elif event.wait(delay):
+            raise RequestCancelledError("Request cancelled")
+
+    async def acall(self, send: Callable, tokens: int = 0):
+        """Async counterpart of ``call`` for coroutine-returning ``send``; cancel the task to stop waiting"""
+        for attempt in range(self.max_attempts):
+            await asyncio.sleep(self._admit(tokens))
+            try:
+                result = await send()
+            except Exception as e:
+                await asyncio.sleep(self._handle_failure(e, attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def record_usage(self, estimated: int, actual: Optional[int]):
+        """Correct the tokens-per-minute bucket with the usage the API reported"""
+        if actual is not None:
+            self.token_bucket.refund(estimated - actual)
+
+    def _admit(self, tokens):
+        self.breaker.before_call()
+        return max(self.request_bucket.reserve(1), self.token_bucket.reserve(tokens))
+
+    def _handle_failure(self, error, attempt):
+        """Return the delay before the next attempt, or re-raise if retrying is pointless"""
+        if not is_retryable(error):
+            raise error
+        if is_service_failure(error):
+            # 只有服务端故障计入熔断；429 只是限流，由下面的暂停处理
+            self.breaker.record_failure()
+        if attempt == self.max_attempts - 1:
+            raise error
+
+        delay = retry_after_seconds(error)
+        if delay is not None:
+            delay = min(delay, self.max_delay)  # 不让服务端的超长 Retry-After 卡住所有 worker
+        else:
+            # 指数退避 + 全抖动，避免所有 worker 同时重试
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        self.logger.warning(
+            f"API Error (attempt {attempt + 1}/{self.max_attempts}), retrying in {delay:.1f}s: {str(error)}"
+        )
+        if isinstance(error, openai.RateLimitError) and self.request_bucket.pause(delay):
+            # 限流时暂停所有 worker，而不是各自继续冲击接口；
+            # 下一次 _admit 会在桶上等待，这里不再重复睡眠
+            return 0.0
+        return delay
@@ -0,0 +1,80 @@
+# text_classifier.py
+import re
+from typing import Dict, Tuple
+
+# 一次扫描即可得到所有特征所需的记号；"_"/"^" 仅在后面跟着非 "}" 字符时才算上下标
+TOKEN_PATTERN = re.compile(r"\\[a-zA-Z]+|[α-ωΑ-Ω∑∫∏√∞±×÷≠≤≥∈∉⊂⊃∪∩+\-*/=<>}]|[_^](?=[^}])")
+ENVIRONMENT_PATTERN = re.compile(r"\\begin\{.*?\}.*?\\end\{.*?\}")
+
+OPERATORS = frozenset("+-*/=<>")
+MATH_FUNCTIONS = ("sin", "cos", "tan", "log", "ln", "exp", "lim", "sum", "int", "prod",
+                  "oint", "iint", "iiint", "iiiint", "idotsint")
+MATH_BRACKETS = ("left", "right", "bigl", "bigr", "Bigl", "Bigr", "biggl", "biggr", "Biggl", "Biggr")
+MATH_ARROWS = ("rightarrow", "leftarrow", "leftrightarrow", "Rightarrow", "Leftarrow", "Leftrightarrow")
+
+
+class TextFormulaClassifier:
+    """Single-pass classifier for PDF text blocks.
+
+    One ``findall`` over a combined pattern yields every feature count, from
+    which both the formula decision and its confidence are derived.
+    """
+
+    def features(self, text: str) -> Dict[str, int]:
+        symbols = commands = operators = functions = scripts = brackets = arrows = 0
+        # 上下标一直延续到下一个 "}"，期间的 "_"/"^" 不重复计数
+        in_sub = in_sup = False
+        has_begin = has_end = False
+
+        for token in TOKEN_PATTERN.findall(text):
+            first = token[0]
+            if first == "\\":
+                commands += 1
+                name = token[1:]
+                if name.startswith(MATH_FUNCTIONS):
+                    functions += 1
+                if name.startswith(MATH_BRACKETS):
+                    brackets += 1
+                if name.startswith(MATH_ARROWS):
+                    arrows += 1
+                if name == "begin":
+                    has_begin = True
+                elif name == "end":
+                    has_end = True
+            elif first in OPERATORS:
+                operators += 1
+            elif first == "}":
+                in_sub = in_sup = False
+            elif first == "_":
+                if not in_sub:
+                    scripts += 1
+                    in_sub = True
+            elif first == "^":
+                if not in_sup:
+                    scripts += 1
+                    in_sup = True
+            else:
+                symbols += 1
+
+        environments = int(has_begin and has_end and ENVIRONMENT_PATTERN.search(text) is not None)
+        return {"symbols": symbols, "commands": commands, "operators": operators,
+                "functions": functions, "scripts": scripts, "brackets": brackets,
+                "arrows": arrows, "environments": environments}
+
+    def classify(self, text: str) -> Tuple[bool, float]:
+        """Return ``(is_formula, confidence)`` for a text block"""
+        counts = self.features(text)
+        # 函数、括号、箭头和环境都以LaTeX命令开头，已被 commands 覆盖
+        is_formula = bool(counts["symbols"] or counts["commands"] or counts["operators"]
+                          or counts["scripts"])
+        scores = (
+            min(counts["symbols"] / 1.2, 1.0),
+            min(counts["commands"] / 1.0, 1.0),
+            min(counts["operators"] / 1.0, 1.0),
+            min(counts["functions"] / 1.2, 1.0),
+            min(counts["scripts"] / 1.5, 1.0),
+            min(counts["brackets"] / 1.5, 1.0),
+            min(counts["arrows"] / 1.5, 1.0),
+            float(counts["environments"]),
+        )
+        return is_formula, sum(scores) / len(scores)
@@ -0,0 +1,169 @@
+# tiered_engine.py
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import Config
+from core.latex_renderer import LatexRenderer
+from core.layout_detector import UNKNOWN_SCRIPT
+from core.recognition_engine import RecognitionEngine, LocalOnnxEngine, create_engine
+
+# PDF文本层中的Unicode数学符号到LaTeX命令的映射
+UNICODE_LATEX = {
+    "α": r"\alpha", "β": r"\beta", "γ": r"\gamma", "δ": r"\delta", "ε": r"\varepsilon",
+    "ϵ": r"\epsilon", "ζ": r"\zeta", "η": r"\eta", "θ": r"\theta", "ϑ": r"\vartheta",
+    "ι": r"\iota", "κ": r"\kappa", "λ": r"\lambda", "μ": r"\mu", "ν": r"\nu", "ξ": r"\xi",
+    "π": r"\pi", "ρ": r"\rho", "ϱ": r"\varrho", "σ": r"\sigma", "ς": r"\varsigma",
+    "τ": r"\tau", "υ": r"\upsilon", "φ": r"\varphi", "ϕ": r"\phi", "χ": r"\chi",
+    "ψ": r"\psi", "ω": r"\omega", "Γ": r"\Gamma", "Δ": r"\Delta", "Θ": r"\Theta",
+    "Λ": r"\Lambda", "Ξ": r"\Xi", "Π": r"\Pi", "Σ": r"\Sigma", "Υ": r"\Upsilon",
+    "Φ": r"\Phi", "Ψ": r"\Psi", "Ω": r"\Omega",
+    "∑": r"\sum", "∏": r"\prod", "∫": r"\int", "∞": r"\infty", "∂": r"\partial",
+    "∇": r"\nabla", "±": r"\pm", "×": r"\times", "÷": r"\div", "·": r"\cdot",
+    "∘": r"\circ", "≠": r"\neq", "≤": r"\leq", "≥": r"\geq", "≈": r"\approx",
+    "≡": r"\equiv", "∝": r"\propto", "∈": r"\in", "∉": r"\notin", "⊂": r"\subset",
+    "⊃": r"\supset", "⊆": r"\subseteq", "⊇": r"\supseteq", "∪": r"\cup", "∩": r"\cap",
+    "∀": r"\forall", "∃": r"\exists", "→": r"\to", "←": r"\leftarrow",
+    "↔": r"\leftrightarrow", "⇒": r"\Rightarrow", "⇐": r"\Leftarrow",
+    "⇔": r"\Leftrightarrow", "∨": r"\vee", "∧": r"\wedge", "⟨": r"\langle",
+    "⟩": r"\rangle", "−": "-", "′": "'",
+}
+# 省略号在文本层中通常带空格
+TEXT_ELLIPSES = (("· · ·", r"\cdots"), ("⋯", r"\cdots"), (". . .", r"\ldots"), ("…", r"\ldots"))
+PLAIN_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+                        " +-=<>()[]|/*!',.:;^_{}")
+# 文本层中以正体出现的函数名，其余多字母串视为正文或无法区分的乘积
+FUNCTION_NAMES = frozenset("sin cos tan cot sec csc arcsin arccos arctan sinh cosh tanh coth log ln lg "
+                           "exp lim limsup liminf max min sup inf det dim ker deg gcd arg Pr hom".split())
+LETTER_RUN = re.compile(r"(?<![\\A-Za-z])[A-Za-z]{2,}")
+# 字母或希腊字母后紧跟数字（如 "τ1"）通常是丢失了标记的下标
+LOST_SCRIPT = re.compile(r"[A-Za-z\u0370-\u03ff]\d")
+
+
+def text_to_latex(text: str) -> Optional[str]:
+    """Convert a PDF text-layer formula to LaTeX, or None if its structure is lost.
+
+    Multi-line text (stacked fractions, aligned displays), radicals, scripts
+    of unknown direction or lost markers (a letter directly followed by a
+    digit), words other than function names and any character
+    without a known LaTeX equivalent cannot be recovered reliably from the
+    text layer and return None. Function names become commands such as ``\\sin``.
+    """
+    text = (text or "").strip()
+    if not text or "\n" in text or "√" in text or UNKNOWN_SCRIPT in text:
+        return None
+    if LOST_SCRIPT.search(text):
+        return None
+    for source, command in TEXT_ELLIPSES:
+        text = text.replace(source, f"{command} ")
+    words = LETTER_RUN.findall(text)
+    if any(word not in FUNCTION_NAMES for word in words):
+        return None
+    text = LETTER_RUN.sub(lambda match: f"\\{match.group(0)} ", text)
+    parts = []
+    for char in text:
+        if char in PLAIN_CHARS or char == "\\":
+            parts.append(char)
+        elif char in UNICODE_LATEX:
+            latex = UNICODE_LATEX[char]
+            parts.append(latex + " " if latex.startswith("\\") else latex)
+        else:
+            return None
+    return " ".join("".join(parts).split())
+
+
+class TieredEngine(RecognitionEngine):
+    """Recognize with the cheapest tier that gives a trustworthy answer.
+
+    1. ``text``: the PDF text layer converted directly to LaTeX.
+    2. ``local``: the offline model, accepted above ``TIER_LOCAL_MIN_CONFIDENCE``.
+    3. ``remote``: the configured remote engine for everything else.
+
+    Cheap-tier answers must also parse and lay out through
+    ``LatexRenderer.validate``. ``stats()`` reports how many formulas each
+    tier resolved plus how many local answers were escalated.
+    """
+
+    name = "tiered"
+
+    def __init__(self, remote: Optional[RecognitionEngine] = None,
+                 local: Optional[RecognitionEngine] = None):
+        self.logger = logging.getLogger("tiered_engine")
+        self.remote = remote or create_engine(Config.TIER_REMOTE_ENGINE)
+        self.cache = self.remote.cache
+        self.local = local
+        if self.local is None and Config.TIER_LOCAL_ENABLED:
+            try:
+                self.local = LocalOnnxEngine()
+            except Exception as e:
+                # 本地模型缺失或未安装依赖时跳过本地层
+                self.logger.warning(f"Local tier disabled: {str(e)}")
+        self.min_confidence = Config.TIER_LOCAL_MIN_CONFIDENCE
+        self._counters = {"text": 0, "local": 0, "remote": 0, "escalated": 0, "invalid": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def _cheap_tiers(self, image, source_text: Optional[str]) -> Optional[Tuple[str, str]]:
+        """Return ``(latex, tier)`` from the text layer or local model, or None to escalate
+
+        ``source_text`` is only supplied by the parser for layout regions above
+        ``TIER_TEXT_MIN_CONFIDENCE``; text with lost script structure escalates.
+        """
+        if source_text and Config.TIER_TEXT_LAYER:
+            latex = text_to_latex(source_text)
+            if latex and LatexRenderer.validate(latex):
+                return latex, "text"
+
+        if self.local is not None:
+            try:
+                latex, confidence = self.local.recognize_with_confidence(image)
+            except Exception as e:
+                self.logger.warning(f"Local recognition failed, escalating: {str(e)}")
+            else:
+                if confidence >= self.min_confidence and LatexRenderer.validate(latex):
+                    return latex, "local"
+                self.logger.debug(f"Escalating local result (confidence {confidence:.2f}): {latex}")
+            self._count("escalated")  # 本地结果不可信，交给远程引擎
+        return None
+
+    def _finish_remote(self, latex: str) -> str:
+        self._count("remote")
+        if not LatexRenderer.validate(latex):
+            # 远程结果是最后一级，只记录无法渲染的答案，不再拦截
+            self._count("invalid")
+            self.logger.warning(f"Remote result does not render: {latex}")
+        return latex
+
+    def recognize_formula(self, image, source_text: Optional[str] = None) -> str:
+        resolved = self._cheap_tiers(image, source_text)
+        if resolved is not None:
+            self._count(resolved[1])
+            return resolved[0]
+        return self._finish_remote(self.remote.recognize_formula(image))
+
+    def recognize_batch(self, images, max_crops=None, max_payload_bytes=None) -> List[Any]:
+        """Resolve what the cheap tiers can and send the rest to the remote engine together"""
+        results = [None] * len(images)
+        escalated = []
+        for idx, image in enumerate(images):
+            resolved = self._cheap_tiers(image, None)
+            if resolved is not None:
+                self._count(resolved[1])
+                results[idx] = resolved[0]
+            else:
+                escalated.append(idx)
+
+        if escalated:
+            remote_results = self.remote.recognize_batch([images[idx] for idx in escalated],
+                                                         max_crops, max_payload_bytes)
+            for idx, result in zip(escalated, remote_results):
+                results[idx] = result if isinstance(result, Exception) else self._finish_remote(result)
+        return results
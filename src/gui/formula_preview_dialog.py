@@ -10,11 +10,12 @@ import cv2
 import numpy as np
 
 class FormulaItem(QWidget):
-    def __init__(self, formula_data, position, confidence, parent=None):
+    def __init__(self, formula_data, position, confidence, source_text="", parent=None):
         super().__init__(parent)
         self.formula_data = formula_data
         self.position = position
         self.confidence = confidence
+        self.source_text = source_text  # PDF文本层内容，图片公式为空
         self._init_ui()
         
     def _init_ui(self):
@@ -84,8 +85,8 @@ class FormulaPreviewDialog(QDialog):
         grid = QGridLayout()
         
         # Display formula thumbnails
-        for i, (formula_data, position, confidence) in enumerate(self.formulas):
-            item = FormulaItem(formula_data, position, confidence)
+        for i, (formula_data, position, confidence, *rest) in enumerate(self.formulas):
+            item = FormulaItem(formula_data, position, confidence, rest[0] if rest else "")
             self.formula_items.append(item)  # 保存引用
             grid.addWidget(item, i//3, i%3)
         
@@ -119,10 +120,14 @@ class FormulaPreviewDialog(QDialog):
         for item in self.formula_items:
             item.set_selected(False)
                 
+    def get_selected_indices(self):
+        """Indices of the selected formulas in the list passed to the dialog"""
+        return [i for i, item in enumerate(self.formula_items) if item.is_selected()]
+
     def get_selected_formulas(self):
         """Get selected formulas"""
         selected = []
         for item in self.formula_items:
             if item.is_selected():
-                selected.append((item.formula_data, item.position))
+                selected.append((item.formula_data, item.position, item.source_text))
         return selected 
\ No newline at end of file
@@ -3,7 +3,6 @@ import os
 import logging
 import sys
 import platform
-import tempfile
 import time
 import numpy as np
 from PIL import ImageGrab, Image
@@ -13,25 +12,20 @@ from PyQt6.QtWidgets import (
     QTextEdit, QLabel, QMessageBox, QDialog, QSizePolicy,
     QApplication, QListView, QTreeView, QAbstractItemView, QProgressDialog
 )
-from PyQt6.QtGui import QGuiApplication, QPainter, QPen, QColor, QShortcut, QKeySequence, QFont
+from PyQt6.QtGui import QGuiApplication, QPainter, QPen, QColor, QShortcut, QKeySequence, QFont, QPixmap
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer, QRect, QPoint, QSize
-from core.api_client import APIClient
+from core.recognition_engine import create_engine
 from core.latex_renderer import LatexRenderer
 from core.pdf_parser import PDFParser
+from core.recognition_pool import RecognitionPool
+from core.exporters import export_formulas, FORMULA_FORMATS
 from config.settings import Config
 from gui.api_key_dialog import ApiKeyDialog
 from gui.format_dialog import FormatSelectionDialog
 from gui.formula_preview_dialog import FormulaPreviewDialog
-from docx.shared import Pt
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import Image as RLImage, Paragraph
-from reportlab.platypus import Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-import markdown
+from gui.preview_renderer import PreviewRenderer
 import cv2
-import base64
-from typing import List, Tuple, Optional
+from typing import Iterable, List, Tuple, Optional
 
 class ProcessingThread(QThread):
     progress_updated = pyqtSignal(int)
@@ -41,31 +35,85 @@ class ProcessingThread(QThread):
     def __init__(self, image_paths):
         super().__init__()
         self.image_paths = image_paths
-        self.client = APIClient()
+        self.client = create_engine()
         self.logger = logging.getLogger("processing_thread")
-        self._cancelled = False
+        recognize = self.client.recognize_batch if Config.BATCH_RECOGNITION else self.client.recognize_formula
+        self.pool = RecognitionPool(recognize, Config.MAX_WORKERS)
         self.results = []
 
+    def cancel(self):
+        """Cancel remaining recognitions"""
+        self.pool.cancel()
+
+    @staticmethod
+    def _display_name(image, idx):
+        # 内存中的图片（截图、PDF裁剪）没有文件名
+        if isinstance(image, (str, os.PathLike)):
+            return os.path.basename(image)
+        return f"image {idx + 1}"
+
+    def _iter_results(self):
+        if not Config.BATCH_RECOGNITION:
+            yield from self.pool.map(self.image_paths)
+            return
+
+        # 多个公式合并为一个请求，每组的结果再逐个展开
+        size = Config.BATCH_MAX_CROPS
+        groups = [self.image_paths[i:i + size] for i in range(0, len(self.image_paths), size)]
+        for group, success, results in self.pool.map(groups):
+            if not success:
+                results = [results] * len(group)
+            for image, result in zip(group, results):
+                yield image, not isinstance(result, Exception), result
+
     def run(self):
         try:
             total = len(self.image_paths)
-            for idx, path in enumerate(self.image_paths):
-                if self._cancelled:
-                    break
-                try:
-                    formula = self.client.recognize_formula(path)
-                    self.task_finished.emit(os.path.basename(path), True, formula)
-                    self.results.append(formula)
-                    self.progress_updated.emit(int((idx + 1) / total * 100))
-                except Exception as e:
-                    self.logger.error(f"Process failed {path}: {str(e)}", exc_info=True)
-                    self.task_finished.emit(os.path.basename(path), False, "")
+            # 并发识别，结果按输入顺序返回
+            for idx, (image, success, result) in enumerate(self._iter_results()):
+                name = self._display_name(image, idx)
+                if success:
+                    self.task_finished.emit(name, True, result)
+                    self.results.append(result)
+                else:
+                    self.logger.error(f"Process failed {name}: {str(result)}", exc_info=result)
+                    self.task_finished.emit(name, False, "")
+                self.progress_updated.emit(int((idx + 1) / total * 100))
+            if self.client.cache is not None:
+                self.logger.info(f"Recognition cache stats: {self.client.cache.stats()}")
+            if self.client.stats():
+                self.logger.info(f"Recognition tier stats: {self.client.stats()}")
             self.processing_done.emit()
         except Exception as e:
             self.logger.error(f"Thread crashed: {str(e)}", exc_info=True)
             self.processing_done.emit()
 
 
+class ExportThread(QThread):
+    """Export recognized formulas off the GUI thread"""
+    progress_updated = pyqtSignal(int, int)  # (done, total)
+    export_done = pyqtSignal(object)  # {format: None 或异常}
+    export_failed = pyqtSignal(str)
+
+    def __init__(self, formulas, formats, report_base, formula_prefix):
+        super().__init__()
+        self.formulas = list(formulas)
+        self.formats = list(formats)
+        self.report_base = report_base
+        self.formula_prefix = formula_prefix
+        self.logger = logging.getLogger("export_thread")
+
+    def run(self):
+        try:
+            outcomes = export_formulas(self.formulas, self.formats, self.report_base, self.formula_prefix,
+                                       progress_callback=self.progress_updated.emit)
+        except Exception as e:
+            self.logger.error(f"Export crashed: {str(e)}", exc_info=True)
+            self.export_failed.emit(str(e))
+        else:
+            self.export_done.emit(outcomes)
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -75,8 +123,11 @@ class MainWindow(QMainWindow):
         self._init_ui()
         self._setup_shortcuts()
         self._check_api_key()
-        self.api_client = APIClient()  # 添加API客户端
+        self.api_client = create_engine()  # 按配置选择识别引擎
         self.renderer = LatexRenderer()  # 添加渲染器
+        # 预览在后台线程渲染，连续输入时只渲染最后的文本
+        self.preview_renderer = PreviewRenderer(self.renderer, self)
+        self.preview_renderer.preview_ready.connect(self._show_preview)
 
     def _init_ui(self):
         self.resize(800, 600)
@@ -147,6 +198,8 @@ class MainWindow(QMainWindow):
         self.screenshot_shortcut.activated.connect(self.enter_screenshot_mode)
 
     def _check_api_key(self):
+        if Config.RECOGNITION_ENGINE in ("local", "mock"):
+            return  # 本地/离线引擎不需要API密钥
         dialog = ApiKeyDialog()
         if dialog.exec() != QDialog.DialogCode.Accepted:
             QMessageBox.critical(None, "Error", "Valid API key is required to proceed")
@@ -392,13 +445,9 @@ class MainWindow(QMainWindow):
             # Remove extension if present
             self.base_path = os.path.splitext(base_path)[0]
 
-            # Process the screenshot directly
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                if screenshot.save(temp_file.name, "PNG"):
-                    self.process_single_image(temp_file.name)
-                    self.statusBar().showMessage("Processing screenshot...")
-                else:
-                    raise RuntimeError("Failed to save temporary screenshot")
+            # Process the screenshot directly from memory (QImage is safe to use off the GUI thread)
+            self.process_single_image(screenshot.toImage())
+            self.statusBar().showMessage("Processing screenshot...")
 
         except Exception as e:
             logging.error(f"Screenshot processing failed: {str(e)}", exc_info=True)
@@ -415,8 +464,8 @@ class MainWindow(QMainWindow):
             "Word Documents (*.docx)"
         )
 
-    def process_single_image(self, image_path):
-        self.current_thread = ProcessingThread([image_path])
+    def process_single_image(self, image):
+        self.current_thread = ProcessingThread([image])
         self.current_thread.progress_updated.connect(self.progress_bar.setValue)
         self.current_thread.task_finished.connect(self.handle_task_result)
         self.current_thread.processing_done.connect(self.save_document)
@@ -593,22 +642,20 @@ class MainWindow(QMainWindow):
             self.update_preview()
 
     def update_preview(self):
-        """Update formula preview"""
+        """Schedule a preview render of the editor text"""
         code = self.editor.toPlainText()
+        if code.strip() and hasattr(self, 'preview_renderer'):
+            self.preview_renderer.request(code)
+
+    def _show_preview(self, image, is_final):
         try:
-            if code.strip():
-                pixmap = self.renderer.render_to_qpixmap(code)
-                if pixmap and not pixmap.isNull():
-                    # 计算预览框的大小
-                    preview_size = self.preview.size()
-                    # 保持宽高比例缩放图片
-                    scaled_pixmap = pixmap.scaled(
-                        preview_size,
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation
-                    )
-                    self.preview.setPixmap(scaled_pixmap)
-                    QApplication.processEvents()  # 确保预览立即更新
+            # 保持宽高比例缩放到预览框大小（草图同样放大显示，随后被完整预览替换）
+            scaled_pixmap = QPixmap.fromImage(image).scaled(
+                self.preview.size(),
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation
+            )
+            self.preview.setPixmap(scaled_pixmap)
         except Exception as e:
             self.logger.error(f"Preview error: {str(e)}", exc_info=True)
 
@@ -616,257 +663,63 @@ class MainWindow(QMainWindow):
         try:
             if not hasattr(self, 'base_path'):
                 raise ValueError("Save path not selected")
-
-            # Generate files for each format
-            success_formats = []
-            for fmt in self.selected_formats:
-                try:
-                    if fmt == "docx":
-                        self._save_docx()
-                        success_formats.append("docx (1 file)")
-                    elif fmt == "pdf":
-                        self._save_pdf()
-                        success_formats.append("pdf (1 file)")
-                    elif fmt == "tex":
-                        self._save_tex()
-                        success_formats.append("tex (1 file)")
-                    elif fmt == "md":
-                        self._save_md()
-                        success_formats.append("md (1 file)")
-                    elif fmt == "svg":
-                        self._save_svg()
-                        success_formats.append(f"svg ({len(self.current_thread.results)} files)")
-                    elif fmt == "png":
-                        self._save_png()
-                        success_formats.append(f"png ({len(self.current_thread.results)} files)")
-                except Exception as e:
-                    logging.error(f"Failed to save {fmt.upper()}: {str(e)}", exc_info=True)
-
-            if success_formats:
-                QMessageBox.information(
-                    self,
-                    "Success",
-                    f"Saved formats:\n{', '.join(success_formats)}\nBase path: {self.base_path}"
-                )
-            else:
-                QMessageBox.warning(self, "Error", "All format saves failed, please check logs")
-
+            self._start_export(self.current_thread.results, self.selected_formats,
+                               self.base_path, f"{self.base_path}_")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Save failed: {str(e)}")
             logging.error(f"Document save error: {str(e)}", exc_info=True)
 
-    def _save_docx(self):
-        """保存Word文档（原有逻辑）"""
-        from docx import Document
-        from docx.shared import Inches
-        from docx.oxml.ns import qn
-        import tempfile
-
-        try:
-            doc = Document()  # 确保这行缩进正确
-            style = doc.styles['Normal']
-            font = style.font
-            font.name = 'Times New Roman'
-            style._element.rPr.rFonts.set(qn('w:eastAsia'), 'SimSun')
-
-            doc.add_heading('Formula Recognition Report', 0)
-
-            for idx, formula in enumerate(self.current_thread.results):
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    temp_path = os.path.join(temp_dir, f"temp_{idx}.png")
-                    try:
-                        pixmap = self.renderer.render_to_qpixmap(formula)
-                        if pixmap.save(temp_path, "PNG"):
-                            doc.add_heading(f"Formula {idx + 1}", level=2)
-                            doc.add_paragraph(f"LaTeX Code:\n{formula}")
-                            doc.add_picture(temp_path, width=Inches(5))
-                        else:
-                            raise RuntimeError("Failed to save image")
-                    except Exception as e:
-                        logging.error(f"Failed to save formula {idx}: {str(e)}")
-                        doc.add_paragraph(f"Formula {idx + 1} render failed: {str(e)}")
-
-            doc.save(f"{self.base_path}.docx")
-        except Exception as e:
-            raise RuntimeError(f"Failed to save DOCX: {str(e)}")
-
-    def _save_pdf(self):
-        """Generate PDF identical to Word (Fixed version)"""
-        from reportlab.lib.pagesizes import A4
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Image, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.lib.units import mm
-        import tempfile
-        import shutil
-
-        try:
-            # Create persistent temporary directory
-            temp_dir = tempfile.mkdtemp(prefix="formulapro_")
-            logging.info(f"PDF temp directory created at: {temp_dir}")
-
-            # Create PDF document framework
-            doc = SimpleDocTemplate(
-                f"{self.base_path}.pdf",
-                pagesize=A4,
-                leftMargin=20 * mm,
-                rightMargin=20 * mm,
-                topMargin=20 * mm,
-                bottomMargin=20 * mm
-            )
-            styles = getSampleStyleSheet()
-            elements = []
-
-            # Add main title
-            elements.append(Paragraph(
-                "<font size=18><b>Formula Recognition Report</b></font>",
-                styles["Title"]
-            ))
-            elements.append(Spacer(1, 15 * mm))
-
-            for idx, formula in enumerate(self.current_thread.results):
-                # Generate image file path
-                img_path = os.path.join(temp_dir, f"formula_{idx}.png")
-
-                # Ensure rendering and saving operations are successful
-                pixmap = self.renderer.render_to_qpixmap(formula)
-                if pixmap.isNull():
-                    raise RuntimeError(f"Formula {idx + 1} rendering failed")
-
-                # Save image using absolute path
-                if not pixmap.save(img_path, "PNG", quality=100):
-                    raise RuntimeError(f"Cannot save formula image: {img_path}")
-
-                # Verify file exists
-                if not os.path.exists(img_path):
-                    raise FileNotFoundError(f"Image file not generated: {img_path}")
-
-                # Add PDF elements
-                elements.append(Paragraph(
-                    f"<b>Formula {idx + 1}</b>",
-                    styles["Heading2"]
-                ))
-
-                elements.append(Paragraph(
-                    f"LaTeX Code: <font face='Courier'>{formula}</font>",
-                    styles["BodyText"]
-                ))
-
-                # Load image using absolute path
-                full_img_path = os.path.abspath(img_path)
-                img = Image(full_img_path, width=150 * mm, height=40 * mm)
-                elements.append(img)
-
-                elements.append(Spacer(1, 10 * mm))
-
-            # Build PDF document
-            doc.build(elements)
-            logging.info("PDF generated successfully")
-
-        except Exception as e:
-            logging.error(f"PDF save failed: {str(e)}", exc_info=True)
-            raise RuntimeError(f"PDF generation failed: {str(e)}")
-        finally:
-            # Clean up temporary directory
-            if os.path.exists(temp_dir):
-                try:
-                    shutil.rmtree(temp_dir)
-                    logging.info(f"Cleaned up temporary directory: {temp_dir}")
-                except Exception as e:
-                    logging.warning(f"Failed to clean up temporary directory: {str(e)}")
-
-    def _save_tex(self):
-        """生成可直接编译的LaTeX文档"""
-        tex_content = """\\documentclass{article}
-    \\usepackage{amsmath}
-    \\begin{document}
-    \\title{Formula Report}
-    \\maketitle
-    """
-
-        for idx, formula in enumerate(self.current_thread.results):
-            # 清理公式环境符号
-            clean_formula = formula.replace("\\begin{equation}", "") \
-                .replace("\\end{equation}", "") \
-                .strip("$")
-
-            tex_content += f"\\section*{{Formula {idx + 1}}}\n"
-            tex_content += "\\begin{align*}\n"
-            tex_content += f"{clean_formula}\n"
-            tex_content += "\\end{align*}\n\n"
-
-        tex_content += "\\end{document}"
-
-        with open(f"{self.base_path}.tex", "w") as f:
-            f.write(tex_content)
-
-    def _save_md(self):
-        """生成可直接显示数学公式的Markdown"""
-        md_content = "# Formula Recognition Report\n\n"
-
-        for idx, formula in enumerate(self.current_thread.results):
-            # 直接写入LaTeX公式（不带$符号）
-            clean_formula = formula.strip("$")
-
-            md_content += f"## Formula {idx + 1}\n\n"
-            md_content += "**LaTeX Code:**\n"
-            md_content += "```math\n"  # 使用代码块包裹
-            md_content += f"{clean_formula}\n"
-            md_content += "```\n\n"
-            md_content += f"**Rendered Formula:**\n$$\n{clean_formula}\n$$\n\n"  # 内联公式
-
-        with open(f"{self.base_path}.md", "w") as f:
-            f.write(md_content)
-
-    def _save_svg(self):
-        """Save formulas as SVG files"""
-        try:
-            from PyQt6.QtSvg import QSvgGenerator
-            from PyQt6.QtCore import QSize
-
-            for idx, formula in enumerate(self.current_thread.results):
-                # Create SVG generator for each formula
-                generator = QSvgGenerator()
-                svg_path = f"{self.base_path}_{idx + 1}.svg"
-                generator.setFileName(svg_path)
-                
-                # Get formula pixmap to determine size
-                pixmap = self.renderer.render_to_qpixmap(formula)
-                generator.setSize(pixmap.size())
-                generator.setViewBox(QRect(0, 0, pixmap.width(), pixmap.height()))
-
-                # Create painter
-                painter = QPainter()
-                painter.begin(generator)
-
-                # Set up rendering
-                painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-                painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
-
-                # Draw formula
-                painter.drawPixmap(0, 0, pixmap)
-
-                painter.end()
-                logging.info(f"SVG file {idx + 1} saved successfully: {svg_path}")
-
-        except Exception as e:
-            raise RuntimeError(f"Failed to save SVG: {str(e)}")
-
-    def _save_png(self):
-        """Save formulas as PNG files"""
-        try:
-            for idx, formula in enumerate(self.current_thread.results):
-                # Get formula pixmap
-                pixmap = self.renderer.render_to_qpixmap(formula)
-                
-                # Save as PNG with index
-                png_path = f"{self.base_path}_{idx + 1}.png"
-                if pixmap.save(png_path, "PNG"):
-                    logging.info(f"PNG file {idx + 1} saved successfully: {png_path}")
-                else:
-                    raise RuntimeError(f"Failed to save PNG file {idx + 1}")
+    def _start_export(self, formulas: List[str], formats: List[str], report_base: str, formula_prefix: str):
+        """Export in a background thread; the actions that start a new save stay disabled until it ends"""
+        # 公式图片由渲染进程池生成，各格式共用同一份渲染结果
+        self.export_thread = ExportThread(formulas, formats, report_base, formula_prefix)
+        self.export_thread.progress_updated.connect(self._on_export_progress)
+        self.export_thread.export_done.connect(self._on_export_done)
+        self.export_thread.export_failed.connect(self._on_export_failed)
+        self._set_save_actions_enabled(False)
+        self.export_thread.start()
+
+    def _set_save_actions_enabled(self, enabled: bool):
+        actions = (self.folder_btn, self.screenshot_btn, self.process_btn, self.btn_parse_pdf,
+                   self.screenshot_shortcut)
+        if not enabled:
+            # 记住导出前的状态，例如未选目录时“开始处理”本来就是禁用的
+            self._save_action_states = [(action, action.isEnabled()) for action in actions]
+            for action in actions:
+                action.setEnabled(False)
+        else:
+            for action, was_enabled in getattr(self, '_save_action_states', []):
+                action.setEnabled(was_enabled)
+            self._save_action_states = []
+
+    def _on_export_progress(self, done, total):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        self.statusBar().showMessage(f"Rendering formula {done}/{total}...")
+
+    def _on_export_done(self, outcomes):
+        self._set_save_actions_enabled(True)
+        thread = self.export_thread
+        success_formats = [
+            f"{fmt} ({len(thread.formulas)} files)" if fmt in FORMULA_FORMATS else f"{fmt} (1 file)"
+            for fmt, error in outcomes.items() if error is None
+        ]
+        failed_formats = [fmt for fmt, error in outcomes.items() if error is not None]
+        self.statusBar().showMessage("Export finished")
+
+        if not success_formats:
+            QMessageBox.warning(self, "Error", "All format saves failed, please check logs")
+            return
+        message = f"Saved formats:\n{', '.join(success_formats)}\nBase path: {thread.report_base}"
+        if failed_formats:
+            QMessageBox.warning(self, "Warning", f"{message}\nFailed formats: {', '.join(failed_formats)}")
+        else:
+            QMessageBox.information(self, "Success", message)
 
-        except Exception as e:
-            raise RuntimeError(f"Failed to save PNG: {str(e)}")
+    def _on_export_failed(self, error):
+        self._set_save_actions_enabled(True)
+        self.statusBar().showMessage("Export failed")
+        QMessageBox.critical(self, "Error", f"Save failed: {error}")
 
     def _parse_pdf(self):
         """Parse PDF file and extract formulas"""
@@ -883,17 +736,30 @@ class MainWindow(QMainWindow):
                 return
                 
             # 显示进度对话框
-            progress = QProgressDialog("Parsing PDF...", None, 0, 100, self)
+            progress = QProgressDialog("Parsing PDF...", "Cancel", 0, 100, self)
             progress.setWindowModality(Qt.WindowModality.WindowModal)
             progress.setMinimumDuration(0)
             progress.setAutoClose(False)
             progress.setAutoReset(False)
             progress.show()
-            
+
+            def _on_page_parsed(done, total):
+                progress.setMaximum(total)
+                progress.setValue(done)
+                progress.setLabelText(f"Parsing PDF... page {done}/{total}")
+                QApplication.processEvents()
+
             try:
-                # 解析PDF
+                # 逐页解析PDF，进度随页面推进；预览只保留缩略图和公式所在位置，
+                # 全分辨率图像在识别时按页重新提取，内存不随文档长度增长
                 parser = PDFParser()
-                formulas = parser.extract_formulas(pdf_path)
+                formulas, locations = [], []
+                for page_num, page_formulas in parser.iter_pages(pdf_path, _on_page_parsed):
+                    for idx, (image, rect, confidence, text) in enumerate(page_formulas):
+                        formulas.append((self._thumbnail(image), rect, confidence, text))
+                        locations.append((page_num, idx))
+                    if progress.wasCanceled():
+                        break
             finally:
                 progress.close()
             
@@ -906,8 +772,8 @@ class MainWindow(QMainWindow):
             if preview_dialog.exec() != QDialog.DialogCode.Accepted:
                 return
                 
-            selected_formulas = preview_dialog.get_selected_formulas()
-            if not selected_formulas:
+            selected = [locations[i] for i in preview_dialog.get_selected_indices()]
+            if not selected:
                 QMessageBox.warning(self, "Warning", "Please select at least one formula")
                 return
                 
@@ -933,277 +799,85 @@ class MainWindow(QMainWindow):
                 return
                 
             # 处理选中的公式
-            self._process_formulas(selected_formulas, selected_formats, save_dir)
+            self._process_formulas(self._iter_selected_formulas(pdf_path, selected), len(selected),
+                                   selected_formats, save_dir)
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error processing PDF: {str(e)}")
             self.logger.error(f"Error processing PDF: {str(e)}")
             
-    def _process_formulas(self, formulas: List[Tuple[np.ndarray, Tuple[float, float, float, float], float]], 
-                         formats: List[str], save_dir: str):
-        """Process selected formulas"""
+    @staticmethod
+    def _thumbnail(image: np.ndarray, size: int = 200) -> np.ndarray:
+        """Downscale a formula image to what the preview dialog displays"""
+        height, width = image.shape[:2]
+        scale = size / max(height, width)
+        if scale >= 1:
+            return np.ascontiguousarray(image)
+        return cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def _iter_selected_formulas(pdf_path: str, selected: List[Tuple[int, int]]):
+        """Re-extract full-resolution ``(image, source_text)`` for the selected ``(page, index)`` pairs"""
+        wanted = {}
+        for page_num, idx in selected:
+            wanted.setdefault(page_num, set()).add(idx)
+        for page_num, page_formulas in PDFParser().iter_pages(pdf_path, pages=sorted(wanted)):
+            for idx, (image, _, _, text) in enumerate(page_formulas):
+                if idx in wanted[page_num]:
+                    yield image, text
+
+    def _process_formulas(self, items: Iterable[Tuple[np.ndarray, Optional[str]]], total: int,
+                          formats: List[str], save_dir: str):
+        """Recognize ``(image, source_text)`` items as they arrive and save the results"""
         try:
             self.progress_bar.setValue(0)
-            self.progress_bar.setMaximum(len(formulas))
+            self.progress_bar.setMaximum(total)
             
             results = []  # 存储识别结果
-            
-            for i, formula_data in enumerate(formulas):
-                self.progress_bar.setValue(i)
-                self.statusBar().showMessage(f"Processing formula {i+1}/{len(formulas)}...")
-                QApplication.processEvents()  # 处理事件循环，确保UI更新
-                
-                # 解包公式数据
-                if len(formula_data) == 2:
-                    formula, position = formula_data
-                    confidence = 1.0
-                else:
-                    formula, position, confidence = formula_data
-                
-                # 识别公式
-                latex = self._recognize_formula(formula)
-                if latex:
+
+            # 跨页重复的公式图像只识别一次，结果按出现顺序分发
+            pool = RecognitionPool(lambda item: self._recognize_formula(*item), Config.MAX_WORKERS)
+            for i, (_, success, latex) in enumerate(pool.map(items, dedupe=True)):
+                self.progress_bar.setValue(i + 1)
+                self.statusBar().showMessage(f"Processing formula {i+1}/{total}...")
+                if success and latex:
                     results.append(latex)
                     # 更新编辑器和预览
                     self.editor.setPlainText(latex)
                     self.update_preview()
-                    QApplication.processEvents()  # 再次处理事件循环，确保预览更新
-            
+                QApplication.processEvents()  # 处理事件循环，确保UI更新
+
             if not results:
                 QMessageBox.warning(self, "Warning", "No formulas were successfully processed")
                 return
                 
-            # 保存所有格式的文件
-            self._save_all_formats(results, formats, save_dir)
-            
-            self.progress_bar.setValue(len(formulas))
-            QMessageBox.information(self, "Success", "Formulas processed successfully!")
+            tier_stats = self.api_client.stats()
+            if tier_stats:
+                self.logger.info(f"Recognition tier stats: {tier_stats}")
+            # 保存所有格式的文件，完成后由 _on_export_done 提示结果
+            self._start_export(results, formats, os.path.join(save_dir, "FormulaReport"),
+                               os.path.join(save_dir, "formula_"))
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error processing formulas: {str(e)}")
             self.logger.error(f"Error processing formulas: {str(e)}")
             
-    def _save_all_formats(self, formulas: List[str], formats: List[str], save_dir: str):
-        """Save all formulas in selected formats"""
-        try:
-            for fmt in formats:
-                if fmt in ['png', 'svg']:
-                    # 单独保存每个公式
-                    for i, formula in enumerate(formulas):
-                        output_path = os.path.join(save_dir, f"formula_{i+1}.{fmt}")
-                        try:
-                            pixmap = self.renderer.render_to_qpixmap(formula)
-                            if pixmap:
-                                if fmt == 'svg':
-                                    # 使用QSvgGenerator保存SVG
-                                    from PyQt6.QtSvg import QSvgGenerator
-                                    from PyQt6.QtCore import QRectF
-                                    generator = QSvgGenerator()
-                                    generator.setFileName(output_path)
-                                    generator.setSize(pixmap.size())
-                                    generator.setViewBox(QRectF(0, 0, pixmap.width(), pixmap.height()))
-                                    
-                                    painter = QPainter()
-                                    painter.begin(generator)
-                                    painter.drawPixmap(0, 0, pixmap)
-                                    painter.end()
-                                    self.logger.info(f"SVG file {i+1} saved successfully: {output_path}")
-                                else:
-                                    pixmap.save(output_path, "PNG")
-                                    self.logger.info(f"PNG file {i+1} saved successfully: {output_path}")
-                        except Exception as e:
-                            self.logger.error(f"Failed to save {fmt.upper()} file {i+1}: {str(e)}")
-                else:
-                    # 合并保存到一个文件
-                    output_path = os.path.join(save_dir, f"FormulaReport.{fmt}")
-                    if fmt == 'docx':
-                        self._save_combined_docx(formulas, output_path)
-                    elif fmt == 'pdf':
-                        self._save_combined_pdf(formulas, output_path)
-                    elif fmt == 'tex':
-                        self._save_combined_tex(formulas, output_path)
-                    elif fmt == 'md':
-                        self._save_combined_md(formulas, output_path)
-                        
-        except Exception as e:
-            self.logger.error(f"Error saving files: {str(e)}")
-            raise
-            
-    def _save_combined_docx(self, formulas: List[str], output_path: str):
-        """Save all formulas in one Word document"""
-        from docx import Document
-        from docx.shared import Inches
-        from docx.oxml.ns import qn
-        import tempfile
-
-        try:
-            doc = Document()
-            style = doc.styles['Normal']
-            font = style.font
-            font.name = 'Times New Roman'
-            style._element.rPr.rFonts.set(qn('w:eastAsia'), 'SimSun')
-
-            doc.add_heading('Formula Recognition Report', 0)
-
-            for idx, formula in enumerate(formulas):
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    temp_path = os.path.join(temp_dir, f"temp_{idx}.png")
-                    try:
-                        pixmap = self.renderer.render_to_qpixmap(formula)
-                        if pixmap.save(temp_path, "PNG"):
-                            doc.add_heading(f"Formula {idx + 1}", level=2)
-                            doc.add_paragraph(f"LaTeX Code:\n{formula}")
-                            doc.add_picture(temp_path, width=Inches(5))
-                        else:
-                            raise RuntimeError("Failed to save image")
-                    except Exception as e:
-                        self.logger.error(f"Failed to save formula {idx}: {str(e)}")
-                        doc.add_paragraph(f"Formula {idx + 1} render failed: {str(e)}")
-
-            doc.save(output_path)
-            self.logger.info(f"Word document saved successfully: {output_path}")
-            
-        except Exception as e:
-            self.logger.error(f"Failed to save DOCX: {str(e)}")
-            raise
-            
-    def _save_combined_pdf(self, formulas: List[str], output_path: str):
-        """Save all formulas in one PDF document"""
-        from reportlab.lib.pagesizes import A4
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Image, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.lib.units import mm
-        import tempfile
-
+    def _recognize_formula(self, formula: np.ndarray, source_text: Optional[str] = None) -> Optional[str]:
+        """Recognize formula with the configured engine"""
         try:
-            # Create temporary directory
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Create PDF document
-                doc = SimpleDocTemplate(
-                    output_path,
-                    pagesize=A4,
-                    leftMargin=20*mm,
-                    rightMargin=20*mm,
-                    topMargin=20*mm,
-                    bottomMargin=20*mm
-                )
-                
-                styles = getSampleStyleSheet()
-                elements = []
-
-                # Add title
-                elements.append(Paragraph(
-                    "<font size=18><b>Formula Recognition Report</b></font>",
-                    styles["Title"]
-                ))
-                elements.append(Spacer(1, 15*mm))
-
-                # Add each formula
-                for idx, formula in enumerate(formulas):
-                    # Save formula image
-                    img_path = os.path.join(temp_dir, f"formula_{idx}.png")
-                    pixmap = self.renderer.render_to_qpixmap(formula)
-                    if not pixmap.save(img_path, "PNG"):
-                        raise RuntimeError(f"Failed to save formula image {idx}")
-
-                    # Add formula section
-                    elements.append(Paragraph(
-                        f"<b>Formula {idx + 1}</b>",
-                        styles["Heading2"]
-                    ))
-                    elements.append(Paragraph(
-                        f"LaTeX Code: <font face='Courier'>{formula}</font>",
-                        styles["BodyText"]
-                    ))
-                    elements.append(Image(img_path, width=150*mm, height=40*mm))
-                    elements.append(Spacer(1, 10*mm))
-
-                # Build PDF
-                doc.build(elements)
-                self.logger.info(f"PDF document saved successfully: {output_path}")
-                
-        except Exception as e:
-            self.logger.error(f"Failed to save PDF: {str(e)}")
-            raise
-            
-    def _save_combined_tex(self, formulas: List[str], output_path: str):
-        """Save all formulas in one LaTeX document"""
-        try:
-            tex_content = """\\documentclass{article}
-\\usepackage{amsmath}
-\\begin{document}
-\\title{Formula Recognition Report}
-\\maketitle
-"""
-
-            for idx, formula in enumerate(formulas):
-                # Clean formula
-                clean_formula = formula.replace("\\begin{equation}", "") \
-                    .replace("\\end{equation}", "") \
-                    .strip("$")
-
-                tex_content += f"\\section*{{Formula {idx + 1}}}\n"
-                tex_content += "\\begin{align*}\n"
-                tex_content += f"{clean_formula}\n"
-                tex_content += "\\end{align*}\n\n"
-
-            tex_content += "\\end{document}"
-
-            with open(output_path, "w", encoding='utf-8') as f:
-                f.write(tex_content)
-                
-            self.logger.info(f"LaTeX document saved successfully: {output_path}")
-            
-        except Exception as e:
-            self.logger.error(f"Failed to save TEX: {str(e)}")
-            raise
-            
-    def _save_combined_md(self, formulas: List[str], output_path: str):
-        """Save all formulas in one Markdown document"""
-        try:
-            md_content = "# Formula Recognition Report\n\n"
-
-            for idx, formula in enumerate(formulas):
-                clean_formula = formula.strip("$")
-                
-                md_content += f"## Formula {idx + 1}\n\n"
-                md_content += "**LaTeX Code:**\n"
-                md_content += "```math\n"
-                md_content += f"{clean_formula}\n"
-                md_content += "```\n\n"
-                md_content += f"**Rendered Formula:**\n$$\n{clean_formula}\n$$\n\n"
-
-            with open(output_path, "w", encoding='utf-8') as f:
-                f.write(md_content)
-                
-            self.logger.info(f"Markdown document saved successfully: {output_path}")
-            
-        except Exception as e:
-            self.logger.error(f"Failed to save MD: {str(e)}")
-            raise
+            # 直接传入numpy数组，在内存中编码
+            response = self.api_client.recognize_formula(formula, source_text=source_text)
+
+            # 检查响应类型
+            if isinstance(response, dict):
+                return response.get('latex')
+            elif isinstance(response, str):
+                return response
+            else:
+                self.logger.error(f"Unexpected response type: {type(response)}")
+                return None
 
-    def _recognize_formula(self, formula: np.ndarray) -> Optional[str]:
-        """Recognize formula using API"""
-        try:
-            # 创建临时文件来保存图片
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                cv2.imwrite(temp_file.name, formula)
-                
-                # 调用API
-                response = self.api_client.recognize_formula(temp_file.name)
-                
-                # 删除临时文件
-                os.unlink(temp_file.name)
-                
-                # 检查响应类型
-                if isinstance(response, dict):
-                    return response.get('latex')
-                elif isinstance(response, str):
-                    return response
-                else:
-                    self.logger.error(f"Unexpected response type: {type(response)}")
-                    return None
-            
         except Exception as e:
             self.logger.error(f"Error recognizing formula: {str(e)}")
             return None
@@ -1212,9 +886,14 @@ class MainWindow(QMainWindow):
         """Handle window close event"""
         try:
             # 取消所有正在进行的操作
+            if hasattr(self, 'preview_renderer'):
+                self.preview_renderer.shutdown()
             if hasattr(self, 'current_thread') and self.current_thread and self.current_thread.isRunning():
                 self.current_thread.cancel()
                 self.current_thread.wait(3000)
+            if hasattr(self, 'export_thread') and self.export_thread.isRunning():
+                # 导出正在写文件，等它结束，避免留下写了一半的报告
+                self.export_thread.wait()
             
             # 关闭所有子窗口
             for widget in QApplication.topLevelWidgets():
@@ -0,0 +1,150 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PyQt6.QtCore import QObject, QThread, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from config.settings import Config
+from core.latex_renderer import LatexRenderer
+
+
+class PreviewWorker(QThread):
+    """Background thread that renders only the most recently requested formula.
+
+    Each request first gets a small draft render and then the full-size
+    render; a request that is superseded while waiting or between the two
+    passes is dropped. Results are QImages, which are safe to hand to the
+    GUI thread.
+    """
+
+    rendered = pyqtSignal(int, str, QImage, bool)  # (generation, code, image, is_final)
+
+    def __init__(self, renderer: LatexRenderer, parent=None):
+        super().__init__(parent)
+        self.renderer = renderer
+        self.logger = logging.getLogger("preview_worker")
+        self._pending: Optional[Tuple[int, str]] = None
+        self._generation = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    def submit(self, generation: int, code: str):
+        with self._condition:
+            # 只保留最新的请求，尚未开始的旧请求直接覆盖
+            self._pending = (generation, code)
+            self._generation = generation
+            self._condition.notify()
+
+    def invalidate(self, generation: int):
+        """Mark work older than ``generation`` as stale without queueing anything new"""
+        with self._condition:
+            self._generation = generation
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.wait(3000)
+
+    def _superseded(self, generation: int) -> bool:
+        with self._condition:
+            return self._stopped or generation != self._generation
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                generation, code = self._pending
+                self._pending = None
+
+            try:
+                # 先以低分辨率快速出草图，再渲染完整质量的预览
+                draft = self._render_draft(code)
+                if draft is not None and not self._superseded(generation):
+                    self.rendered.emit(generation, code, draft, False)
+                if self._superseded(generation):
+                    continue
+                self.rendered.emit(generation, code, self._render_full(code), True)
+            except Exception as e:
+                # 输入过程中的公式经常不完整，只记录调试信息
+                self.logger.debug(f"Preview render failed: {str(e)}")
+
+    @staticmethod
+    def _detach(image: QImage) -> QImage:
+        # render_to_qimage 借用 numpy 内存；跨线程的信号只做浅拷贝，必须复制出独立的像素数据
+        return image.copy()
+
+    def _render_draft(self, code: str) -> Optional[QImage]:
+        scale = Config.PREVIEW_DRAFT_SCALE
+        try:
+            return self._detach(self.renderer.render_to_qimage(code, int(1600 * scale), int(400 * scale)))
+        except ValueError:
+            return None  # 不是合法的 mathtext，直接走完整渲染
+
+    def _render_full(self, code: str) -> QImage:
+        try:
+            return self._detach(self.renderer.render_to_qimage(code))
+        except ValueError:
+            # 纯文本等非 mathtext 内容，与预览一致地完整渲染后缩放
+            image = QImage()
+            if not image.loadFromData(self.renderer.render_export_png(code)):
+                raise RuntimeError("Failed to decode preview image")
+            return image
+
+
+class PreviewRenderer(QObject):
+    """Debounced live preview: coalesces edits and renders off the GUI thread.
+
+    ``request(code)`` restarts a ``PREVIEW_DEBOUNCE_MS`` timer; when it fires
+    the latest text goes to the worker. ``preview_ready`` is emitted with a
+    draft image and then the final one. Final images are kept in a small
+    LRU keyed by text, so revisiting a formula updates the preview at once.
+    """
+
+    preview_ready = pyqtSignal(QImage, bool)  # (image, is_final)
+
+    def __init__(self, renderer: LatexRenderer, parent=None):
+        super().__init__(parent)
+        self._generation = 0
+        self._latest = ""
+        self._images = OrderedDict()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(Config.PREVIEW_DEBOUNCE_MS)
+        self._timer.timeout.connect(self._dispatch)
+        self._worker = PreviewWorker(renderer, self)
+        self._worker.rendered.connect(self._on_rendered)
+        self._worker.start()
+
+    def request(self, code: str):
+        self._generation += 1
+        self._latest = code
+        self._worker.invalidate(self._generation)  # 正在渲染的旧文本不再继续第二遍
+        image = self._images.get(code)
+        if image is not None:
+            self._timer.stop()
+            self._images.move_to_end(code)
+            self.preview_ready.emit(image, True)
+            return
+        self._timer.start()
+
+    def _dispatch(self):
+        self._worker.submit(self._generation, self._latest)
+
+    def _on_rendered(self, generation: int, code: str, image: QImage, is_final: bool):
+        if is_final:
+            self._images[code] = image
+            while len(self._images) > Config.PREVIEW_CACHE_SIZE:
+                self._images.popitem(last=False)
+        # 渲染期间文本已改变的结果不再显示
+        if generation == self._generation:
+            self.preview_ready.emit(image, is_final)
+
+    def shutdown(self):
+        self._timer.stop()
+        self._worker.stop()
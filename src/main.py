@@ -2,6 +2,7 @@ import sys
 import os
 import logging
 import platform
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 from gui.main_window import MainWindow
 import keyring
@@ -74,6 +75,9 @@ def configure_app():
 
 
 if __name__ == "__main__":
+    # 打包后的应用需要支持多进程解析PDF
+    multiprocessing.freeze_support()
+
     sys.excepthook = lambda exc_type, exc_value, exc_tb: logging.critical(
         "Unhandled exception", exc_info=(exc_type, exc_value, exc_tb)
     )
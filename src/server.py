@@ -0,0 +1,454 @@
+"""Local HTTP recognition service shared by many users.
+
+    python src/server.py --port 8765 --workers 2 --queue-depth 32
+
+Endpoints (JSON unless noted):
+
+    POST /jobs?filename=a.pdf          body: PNG/JPEG image or PDF -> 202 {"id", "status"}
+    GET  /jobs/<id>                    status, progress and per-formula results
+    GET  /jobs/<id>/export/<format>    docx/pdf/tex/md report; png/svg as a zip
+                                       (or one file with ?index=N)
+    GET  /health                       queue depth, workers and engine stats
+
+Jobs and export renders wait in one bounded queue and are processed by a
+fixed number of workers. When the queue is full, submissions and exports
+that are not rendered yet get 429 with Retry-After.
+All jobs share one recognition engine, with its recognition cache and
+API quota. Use ``--engine mock`` to run it offline on localhost.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from cli import API_KEY_ENV_VARS, needs_api_key, resolve_api_key
+from config.settings import Config
+from core.exporters import FORMULA_FORMATS, REPORT_FORMATS, export_formulas
+from core.pdf_parser import PDFParser
+from core.recognition_engine import RecognitionEngine, create_engine
+from core.recognition_pool import RecognitionPool
+from core.render_farm import RenderFarm
+
+EXPORT_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+    "tex": "application/x-tex",
+    "md": "text/markdown; charset=utf-8",
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the job queue is at capacity"""
+
+
+class Job:
+    """One submitted image or PDF and its per-formula results"""
+
+    def __init__(self, data: bytes, filename: str, is_pdf: bool):
+        self.id = uuid.uuid4().hex
+        self.data = data
+        self.filename = filename
+        self.is_pdf = is_pdf
+        self.status = "queued"  # queued -> running -> done / failed
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.formulas: List[Dict[str, Any]] = []
+        self.exports: Dict[str, Future] = {}  # 格式 -> 导出文件名到内容的映射
+        self.lock = threading.Lock()
+
+    @property
+    def latex(self) -> List[str]:
+        return [formula["latex"] for formula in self.formulas if formula["latex"]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "id": self.id,
+                "filename": self.filename,
+                "status": self.status,
+                "error": self.error,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "recognized": len(self.latex),
+                "failed": sum(1 for formula in self.formulas if formula["error"]),
+                "formulas": list(self.formulas),
+            }
+
+
+class RecognitionService:
+    """Bounded task queue in front of one shared recognition engine and render farm.
+
+    Recognition jobs and export renders are both tasks in the same queue,
+    processed by the same ``workers`` threads, so exports are subject to
+    the same concurrency limit and backpressure as submissions.
+    """
+
+    def __init__(self, engine: Optional[RecognitionEngine] = None, workers: Optional[int] = None,
+                 queue_depth: Optional[int] = None, farm: Optional[RenderFarm] = None):
+        self.logger = logging.getLogger("recognition_service")
+        self.engine = engine or create_engine()
+        self.workers = workers or Config.SERVICE_WORKERS
+        # 每个工作线程同时最多跑一次导出，渲染进程总数不超过 CPU 核数
+        self.farm = farm or RenderFarm(workers=max(1, (os.cpu_count() or 1) // self.workers))
+        # 同理，并发解析的 PDF 平分 PDF_PARSE_WORKERS，不让每个任务各开一个满额进程池
+        self.parse_workers = max(1, Config.PDF_PARSE_WORKERS // self.workers)
+        self._queue = queue.Queue(maxsize=queue_depth or Config.SERVICE_QUEUE_DEPTH)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._running = 0
+        self._pools = set()
+        self._threads = []
+        self._stopped = threading.Event()
+
+    def start(self):
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self):
+        """Cancel queued tasks, stop running recognitions and wait for the workers"""
+        self._stopped.set()
+        with self._jobs_lock:
+            pools = list(self._pools)
+        for pool in pools:
+            pool.cancel()
+        for _ in self._threads:
+            # 队列有上限，不能阻塞地放入结束标记；先取消排队的任务腾出位置
+            while True:
+                try:
+                    self._queue.put_nowait(None)
+                    break
+                except queue.Full:
+                    try:
+                        self._cancel(self._queue.get_nowait())
+                    except queue.Empty:
+                        pass
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def _enqueue(self, task):
+        if self._stopped.is_set():
+            raise QueueFullError("Service is shutting down")
+        try:
+            self._queue.put_nowait(task)
+        except queue.Full:
+            raise QueueFullError(f"Job queue is full ({self._queue.maxsize} tasks waiting)")
+
+    def submit(self, data: bytes, filename: str) -> Job:
+        """Queue a job; raises QueueFullError instead of blocking when the queue is full"""
+        is_pdf = data.startswith(b"%PDF")
+        if not is_pdf and cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED) is None:
+            raise ValueError("Body is neither a PDF nor a decodable image")
+        job = Job(data, filename or ("upload.pdf" if is_pdf else "upload.png"), is_pdf)
+        self._enqueue((job, None, None))
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._evict()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self):
+        # 只保留最近的任务；排队和运行中的任务不会被淘汰
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("done", "failed")]
+        for job_id in finished[:max(0, len(self._jobs) - Config.SERVICE_MAX_JOBS)]:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._jobs_lock:
+            running = self._running
+        stats = {"queued": self._queue.qsize(), "queue_depth": self._queue.maxsize,
+                 "running": running, "workers": self.workers, "engine": self.engine.name,
+                 "engine_stats": self.engine.stats()}
+        if self.engine.cache is not None:
+            stats["cache"] = self.engine.cache.stats()
+        return stats
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            if self._stopped.is_set():
+                self._cancel(task)
+                continue
+            with self._jobs_lock:
+                self._running += 1
+            try:
+                job, fmt, future = task
+                if fmt is None:
+                    self._run(job)
+                else:
+                    self._run_export(job, fmt, future)
+            finally:
+                with self._jobs_lock:
+                    self._running -= 1
+
+    @staticmethod
+    def _cancel(task):
+        if task is None:
+            return
+        job, fmt, future = task
+        if fmt is not None:
+            future.set_exception(RuntimeError("Service shut down before the export ran"))
+            return
+        with job.lock:
+            job.status, job.error = "failed", "Service shut down before the job ran"
+            job.finished = time.time()
+            job.data = b""
+
+    def _run(self, job: Job):
+        with job.lock:
+            job.status, job.started = "running", time.time()
+        pool = RecognitionPool(lambda item: self.engine.recognize_formula(item[0], source_text=item[1]),
+                               Config.SERVICE_RECOGNITION_WORKERS)
+        with self._jobs_lock:
+            self._pools.add(pool)
+        try:
+            for item, success, result in pool.map(self._iter_items(job), dedupe=True):
+                formula = {"index": len(job.formulas) + 1, "source": item[2],
+                           "latex": result if success and result else None,
+                           "error": None if success and result else (str(result) if not success else "empty result")}
+                with job.lock:
+                    job.formulas.append(formula)
+            with job.lock:
+                if pool.cancelled:
+                    job.status, job.error = "failed", "Service shut down while the job was running"
+                else:
+                    job.status = "done"
+        except Exception as e:
+            self.logger.error(f"Job {job.id} failed: {str(e)}", exc_info=True)
+            with job.lock:
+                job.status, job.error = "failed", str(e)
+        finally:
+            with self._jobs_lock:
+                self._pools.discard(pool)
+            with job.lock:
+                job.finished = time.time()
+                job.data = b""  # 原始上传不再需要
+
+    def _iter_items(self, job: Job):
+        """Yield ``(image, source_text, label)`` for the uploaded image or each PDF formula"""
+        if not job.is_pdf:
+            yield job.data, None, job.filename
+            return
+        # PDFParser 按路径打开文档，上传内容先写入临时文件
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(job.data)
+            for page_num, page_formulas in PDFParser().iter_pages(path, workers=self.parse_workers):
+                for formula in page_formulas:
+                    yield formula[0], formula[3] if len(formula) > 3 else None, f"page {page_num + 1}"
+        finally:
+            os.remove(path)
+
+    def export(self, job: Job, fmt: str, index: Optional[int] = None) -> Tuple[bytes, str, str]:
+        """Return ``(body, content_type, filename)`` for a finished job in ``fmt``.
+
+        The first request per format queues the render on the job workers
+        (QueueFullError when the queue is full) and later ones reuse it.
+        """
+        if fmt not in REPORT_FORMATS + FORMULA_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        latex = job.latex
+        if not latex:
+            raise ValueError("Job has no recognized formulas")
+        if fmt in FORMULA_FORMATS and index is not None and not 1 <= index <= len(latex):
+            raise ValueError(f"Formula index out of range: {index}")
+
+        # 同一任务同一格式只渲染一次，并发请求等待同一个结果
+        with job.lock:
+            future = job.exports.get(fmt)
+            created = future is None
+            if created:
+                future = job.exports[fmt] = Future()
+        if created:
+            try:
+                self._enqueue((job, fmt, future))
+            except QueueFullError as e:
+                with job.lock:
+                    job.exports.pop(fmt, None)
+                future.set_exception(e)
+        files = future.result()
+
+        if fmt in REPORT_FORMATS:
+            return files[f"FormulaReport.{fmt}"], EXPORT_TYPES[fmt], f"FormulaReport.{fmt}"
+        if index is not None:
+            name = f"formula_{index}.{fmt}"
+            return files[name], EXPORT_TYPES[fmt], name
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name in sorted(files, key=lambda name: int(name.split("_")[1].split(".")[0])):
+                archive.writestr(name, files[name])
+        return buf.getvalue(), "application/zip", f"formulas_{fmt}.zip"
+
+    def _run_export(self, job: Job, fmt: str, future: Future):
+        try:
+            files = self._export_files(job.latex, fmt)
+        except Exception as e:
+            self.logger.error(f"Export {fmt} of job {job.id} failed: {str(e)}", exc_info=True)
+            with job.lock:
+                job.exports.pop(fmt, None)  # 失败的导出不缓存，允许重试
+            future.set_exception(e)
+        else:
+            future.set_result(files)
+
+    def _export_files(self, latex: List[str], fmt: str) -> Dict[str, bytes]:
+        with tempfile.TemporaryDirectory(prefix="formulapro_") as temp_dir:
+            outcomes = export_formulas(latex, [fmt], os.path.join(temp_dir, "FormulaReport"),
+                                       os.path.join(temp_dir, "formula_"), farm=self.farm)
+            if outcomes[fmt] is not None:
+                raise RuntimeError(f"Export failed: {str(outcomes[fmt])}")
+            files = {}
+            for name in os.listdir(temp_dir):
+                with open(os.path.join(temp_dir, name), "rb") as f:
+                    files[name] = f.read()
+            return files
+
+
+class RecognitionRequestHandler(BaseHTTPRequestHandler):
+    server_version = "FormulaPro"
+    service: RecognitionService = None  # 由 create_server 设置
+
+    def log_message(self, format, *args):
+        logging.getLogger("server").info(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        self._send_json(status, {"error": message}, headers)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._send_error(404, "Not found")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return self._send_error(400, "Empty body")
+        if length > Config.SERVICE_MAX_UPLOAD_BYTES:
+            return self._send_error(413, f"Upload exceeds {Config.SERVICE_MAX_UPLOAD_BYTES} bytes")
+        data = self.rfile.read(length)
+        filename = parse_qs(url.query).get("filename", [""])[0]
+        try:
+            job = self.service.submit(data, os.path.basename(filename))
+        except QueueFullError as e:
+            # 队列已满：拒绝而不是无限排队，由客户端稍后重试
+            return self._send_error(429, str(e), {"Retry-After": str(Config.SERVICE_RETRY_AFTER)})
+        except ValueError as e:
+            return self._send_error(400, str(e))
+        self._send_json(202, {"id": job.id, "status": job.status}, {"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["health"]:
+            return self._send_json(200, self.service.stats())
+        if len(parts) < 2 or parts[0] != "jobs":
+            return self._send_error(404, "Not found")
+        job = self.service.get(parts[1])
+        if job is None:
+            return self._send_error(404, "Unknown job")
+        if len(parts) == 2:
+            return self._send_json(200, job.to_dict())
+        if len(parts) == 4 and parts[2] == "export":
+            if job.status != "done":
+                return self._send_error(409, f"Job is {job.status}")
+            index = parse_qs(url.query).get("index", [None])[0]
+            try:
+                body, content_type, filename = self.service.export(
+                    job, parts[3].lower(), int(index) if index is not None else None)
+            except ValueError as e:
+                return self._send_error(400, str(e))
+            except QueueFullError as e:
+                return self._send_error(429, str(e), {"Retry-After": str(Config.SERVICE_RETRY_AFTER)})
+            except Exception as e:
+                logging.getLogger("server").error(f"Export error: {str(e)}", exc_info=True)
+                return self._send_error(500, str(e))
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._send_error(404, "Not found")
+
+
+def create_server(host: str, port: int, service: RecognitionService) -> ThreadingHTTPServer:
+    handler = type("BoundRequestHandler", (RecognitionRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=Config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=Config.SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=Config.SERVICE_WORKERS, help="jobs processed concurrently")
+    parser.add_argument("--queue-depth", type=int, default=Config.SERVICE_QUEUE_DEPTH,
+                        help="jobs allowed to wait before submissions get 429")
+    parser.add_argument("--engine", choices=("remote", "local", "mock", "tiered"),
+                        default=Config.RECOGNITION_ENGINE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.workers < 1 or args.queue_depth < 1:
+        parser.error("--workers and --queue-depth must be at least 1")
+    if needs_api_key(args.engine):
+        api_key = resolve_api_key()
+        if not api_key:
+            print(f"error: no API key; set {API_KEY_ENV_VARS[0]} or save one in the desktop app", file=sys.stderr)
+            return 2
+        Config.set_api_key(api_key)
+
+    service = RecognitionService(create_engine(args.engine), args.workers, args.queue_depth)
+    service.start()
+    server = create_server(args.host, args.port, service)
+    logging.getLogger("server").info(f"Serving on http://{args.host}:{args.port} with engine {args.engine}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())